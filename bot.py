@@ -2,10 +2,19 @@ import logging
 import os
 import asyncio
 import json
+import re
 import sqlite3
 import shutil
 import zipfile
+import zlib
+import hashlib
 import base64
+import threading
+import functools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types, F
@@ -52,80 +61,501 @@ USERS_DB_PATH = DATA_DIR / "users.db"
 BACKUP_DIR = DATA_DIR / "backups"
 TEMP_DIR = DATA_DIR / "temp"
 TEMP_DIR.mkdir(exist_ok=True)
-TEMP_DB_PATH = TEMP_DIR / "temp_clients.db"
 
 print(f"📁 Папка данных: {DATA_DIR}")
 print(f"📁 Папка бэкапов: {BACKUP_DIR}")
 print(f"📁 Папка временных файлов: {TEMP_DIR}")
 
+# ========== ЗАПИСИ ==========
+
+class Record:
+    """Строка БД с полями-атрибутами; COLUMNS - SQL-выражения в порядке __slots__"""
+    __slots__ = ()
+    COLUMNS = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def select(cls):
+        return ", ".join(cls.COLUMNS)
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """row_factory для курсора: значения уже приведены в SQL"""
+        return cls(*row)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(" + ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__) + ")"
+
+class Client(Record):
+    __slots__ = ('id', 'name', 'full_desc', 'download_url', 'version', 'is_vip', 'downloads', 'views', 'media_count', 'cover_file_id')
+    COLUMNS = ('id', 'name', 'full_desc', 'download_url', "IFNULL(version, '')", 'is_vip = 1',
+               'IFNULL(downloads, 0)', 'IFNULL(views, 0)', 'IFNULL(media_count, 0)', 'cover_file_id')
+
+class ResourcePack(Record):
+    __slots__ = ('id', 'name', 'full_desc', 'download_url', 'version', 'author', 'is_vip', 'downloads', 'likes', 'views', 'media_count', 'cover_file_id')
+    COLUMNS = ('id', 'name', 'full_desc', 'download_url', "IFNULL(version, '')", "IFNULL(author, 'Неизвестен')", 'is_vip = 1',
+               'IFNULL(downloads, 0)', 'IFNULL(likes, 0)', 'IFNULL(views, 0)', 'IFNULL(media_count, 0)', 'cover_file_id')
+
+class Config(Record):
+    __slots__ = ('id', 'client_name', 'client_version', 'name', 'full_desc', 'download_url', 'is_vip', 'downloads', 'views', 'media_count', 'cover_file_id')
+    COLUMNS = ('id', 'client_name', 'client_version', 'name', 'full_desc', 'download_url', 'is_vip = 1',
+               'IFNULL(downloads, 0)', 'IFNULL(views, 0)', 'IFNULL(media_count, 0)', 'cover_file_id')
+
+class UserStatus(Record):
+    __slots__ = ('user_id', 'balance', 'is_vip', 'invites', 'downloads_total')
+    COLUMNS = ('user_id', 'IFNULL(balance, 0)', 'is_vip = 1', 'IFNULL(invites, 0)', 'IFNULL(downloads_total, 0)')
+
+    @property
+    def is_admin(self):
+        return self.user_id == ADMIN_ID
+
+RECORD_TYPES = {"clients": Client, "resourcepacks": ResourcePack, "configs": Config}
+
+# ========== ПОДКЛЮЧЕНИЯ К БД ==========
+
+DB_MMAP_SIZE = 64 * 1024 * 1024   # 64 МБ отображаем в память
+DB_CACHE_SIZE = -16000            # ~16 МБ кэша страниц (отрицательное значение - в КБ)
+
+# Долгоживущие соединения: путь -> (соединение, поколение файла на момент открытия)
+_db_connections = {}
+_db_locks = {}
+_db_locks_guard = threading.Lock()
+# путь -> глубина вложенных db_connection; меняется только потоком, держащим блокировку БД
+_db_depths = {}
+# путь -> номер поколения файла; растет при каждой подмене файла через publish_db
+_db_generations = {}
+# путь -> (папка текущего поколения WAL-бэкапа, время его начала по time.monotonic())
+_wal_generations = {}
+
+def db_lock(db_path):
+    """Блокировка, сериализующая работу с одной БД"""
+    key = str(db_path)
+    with _db_locks_guard:
+        lock = _db_locks.get(key)
+        if lock is None:
+            lock = _db_locks[key] = threading.RLock()
+        return lock
+
+def db_generation(db_path):
+    return _db_generations.get(str(db_path), 0)
+
+def _open_db(db_path):
+    """Открывает соединение и один раз настраивает его"""
+    conn = sqlite3.connect(str(db_path), timeout=10, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={DB_CACHE_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if str(db_path) in _wal_generations:
+        # WAL сбрасывает в файл только ship_wal, иначе кадры ушли бы в базу мимо бэкапа
+        conn.execute("PRAGMA wal_autocheckpoint=0")
+    logger.info(f"🔌 Открыто соединение с БД: {db_path}")
+    return conn
+
+def _get_db(db_path):
+    key = str(db_path)
+    generation = db_generation(key)
+    entry = _db_connections.get(key)
+    if entry is not None:
+        conn, opened_generation = entry
+        if opened_generation == generation:
+            return conn
+        # Файл подменили - переоткрываем
+        logger.info(f"🔄 Файл БД заменен, переоткрываю: {db_path}")
+        _db_connections.pop(key, None)
+        try:
+            conn.close()
+        except Exception as e:
+            logger.error(f"❌ Ошибка закрытия старого соединения {db_path}: {e}")
+    conn = _open_db(db_path)
+    _db_connections[key] = (conn, generation)
+    # Новый файл - схема могла измениться
+    refresh_schema_cache(db_path)
+    return conn
+
+@contextmanager
+def db_connection(db_path):
+    """Выдает общее соединение с БД: коммит при успехе, откат при ошибке
+
+    Вложенный вызов в том же потоке работает внутри транзакции внешнего:
+    коммит или откат делает только самый внешний.
+    """
+    key = str(db_path)
+    with db_lock(db_path):
+        conn = _get_db(db_path)
+        depth = _db_depths.get(key, 0)
+        _db_depths[key] = depth + 1
+        try:
+            yield conn
+            if depth == 0:
+                conn.commit()
+        except BaseException:
+            if depth == 0:
+                conn.rollback()
+            raise
+        finally:
+            _db_depths[key] = depth
+
+def close_db(db_path=None):
+    """Закрывает соединение с БД (или все соединения), WAL при этом сбрасывается в файл"""
+    keys = [str(db_path)] if db_path is not None else list(_db_connections)
+    for key in keys:
+        with db_lock(key):
+            entry = _db_connections.pop(key, None)
+            if entry:
+                try:
+                    entry[0].close()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка закрытия соединения {key}: {e}")
+
+def remove_db_files(db_path):
+    """Удаляет файл БД вместе с -wal и -shm, предварительно закрыв соединение"""
+    close_db(db_path)
+    for suffix in ("", "-wal", "-shm"):
+        path = Path(f"{db_path}{suffix}")
+        if path.exists():
+            path.unlink()
+    refresh_schema_cache(db_path)
+
+SNAPSHOT_STEP_PAGES = 1024   # страниц за шаг backup API, когда нужен прогресс
+
+def snapshot_db(src_path, dst_path, progress=None):
+    """Постраничная копия БД через backup API в новый файл: согласованный снимок, читатели источника не блокируются
+
+    progress(скопировано страниц, всего страниц) вызывается после каждого шага.
+    """
+    dst_path = Path(dst_path)
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    remove_db_files(dst_path)
+    # Отдельное соединение с источником: в WAL его чтение не мешает общему соединению
+    src = sqlite3.connect(str(src_path), timeout=10)
+    dst = sqlite3.connect(str(dst_path))
+    try:
+        if progress is None:
+            src.backup(dst)
+        else:
+            # Если источник изменят между шагами, SQLite начнет копию заново - снимок остается согласованным
+            src.backup(dst, pages=SNAPSHOT_STEP_PAGES, progress=lambda status, remaining, total: progress(total - remaining, total))
+        # Снимок - самодостаточный файл без -wal, его можно сразу переименовать или архивировать
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        src.close()
+    refresh_schema_cache(dst_path)
+
+def publish_db(staged_path, db_path, backup_path=None):
+    """Атомарно подменяет файл БД готовым файлом через os.replace
+
+    Под блокировкой БД запросов к ней нет; общее соединение закрывается и при
+    следующем обращении откроется уже на новом файле. Читатель видит либо
+    старый файл, либо новый целиком. Старый файл можно сохранить в backup_path:
+    это жесткая ссылка на него, без копирования данных.
+    """
+    key = str(db_path)
+    with db_lock(staged_path):
+        close_db(staged_path)
+        with db_lock(db_path):
+            shipped = key in _wal_generations
+            if shipped:
+                # Хвост WAL старого файла дописываем в его поколение бэкапа
+                ship_wal(db_path)
+            # Закрытие последнего соединения переносит WAL в файл - старая версия целиком в нем
+            close_db(db_path)
+            if backup_path is not None and Path(db_path).exists():
+                Path(backup_path).parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(db_path, backup_path)
+                except OSError as e:
+                    logger.info(f"ℹ️ Жесткая ссылка недоступна ({e}), копирую снимком")
+                    snapshot_db(db_path, backup_path)
+            for suffix in ("-wal", "-shm"):
+                for path in (Path(f"{staged_path}{suffix}"), Path(f"{db_path}{suffix}")):
+                    if path.exists():
+                        path.unlink()
+            os.replace(staged_path, db_path)
+            _db_generations[key] = _db_generations.get(key, 0) + 1
+            refresh_schema_cache(staged_path)
+            refresh_schema_cache(db_path)
+            if shipped:
+                # Сегменты старого поколения к новому файлу не применимы
+                start_wal_generation(db_path)
+    logger.info(f"🔁 Опубликована БД {db_path} (поколение {_db_generations[key]})")
+
+# ========== КЭШ СХЕМЫ БД ==========
+
+# (путь к БД, таблица) -> множество колонок
+_schema_cache = {}
+
+def get_table_columns(db_path, table):
+    """Возвращает колонки таблицы; PRAGMA table_info выполняется один раз на файл БД"""
+    key = (str(db_path), table)
+    columns = _schema_cache.get(key)
+    if columns is None:
+        with db_connection(db_path) as conn:
+            columns = frozenset(col[1] for col in conn.execute(f"PRAGMA table_info({table})"))
+        # Несуществующую таблицу не кэшируем - ее могут создать позже
+        if columns:
+            _schema_cache[key] = columns
+    return columns
+
+def refresh_schema_cache(db_path=None):
+    """Сбрасывает кэш схемы (после восстановления, подмены файла БД или миграции)"""
+    if db_path is None:
+        _schema_cache.clear()
+        return
+    for key in [k for k in _schema_cache if k[0] == str(db_path)]:
+        _schema_cache.pop(key, None)
+
+# ========== МИГРАЦИИ ==========
+
+# Номер примененной миграции хранится в PRAGMA user_version файла БД.
+# Миграции только дописываются в конец списка, старые не меняются.
+
+def _add_column(cur, table, column, definition):
+    """ALTER TABLE ADD COLUMN, если колонки еще нет (для старых баз)"""
+    columns = {col[1] for col in cur.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _clients_v1_tables(cur):
+    # Таблица клиентов
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            full_desc TEXT NOT NULL,
+            media TEXT DEFAULT '[]',
+            download_url TEXT NOT NULL,
+            version TEXT,
+            is_vip INTEGER DEFAULT 0,
+            downloads INTEGER DEFAULT 0,
+            views INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица ресурспаков
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS resourcepacks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            full_desc TEXT NOT NULL,
+            media TEXT DEFAULT '[]',
+            download_url TEXT NOT NULL,
+            version TEXT,
+            author TEXT,
+            is_vip INTEGER DEFAULT 0,
+            downloads INTEGER DEFAULT 0,
+            likes INTEGER DEFAULT 0,
+            views INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица конфигов
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS configs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_name TEXT NOT NULL,
+            client_version TEXT NOT NULL,
+            name TEXT NOT NULL,
+            full_desc TEXT NOT NULL,
+            media TEXT DEFAULT '[]',
+            download_url TEXT NOT NULL,
+            is_vip INTEGER DEFAULT 0,
+            downloads INTEGER DEFAULT 0,
+            views INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица избранного
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS favorites (
+            user_id INTEGER NOT NULL,
+            pack_id INTEGER NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, pack_id)
+        )
+    ''')
+
+def _clients_v2_vip_columns(cur):
+    for table in ("clients", "resourcepacks", "configs"):
+        _add_column(cur, table, "is_vip", "INTEGER DEFAULT 0")
+
+def _clients_v3_indexes(cur):
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clients_version ON clients(version)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_resourcepacks_version_downloads ON resourcepacks(version, downloads DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_configs_client_version ON configs(client_name, client_version)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_favorites_user_added ON favorites(user_id, added_at)')
+
+def _clients_v4_packs_keyset_index(cur):
+    # Индекс по возрастанию читается в обратном порядке как ORDER BY downloads DESC, id DESC
+    cur.execute('DROP INDEX IF EXISTS idx_resourcepacks_version_downloads')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_resourcepacks_version_downloads_id ON resourcepacks(version, downloads, id)')
+
+def _clients_v5_version_nocase_index(cur):
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clients_version_nocase ON clients(version COLLATE NOCASE)')
+
+def media_fields(media_list):
+    """Колонки элемента, производные от списка медиа: JSON-копия, media_count и cover_file_id"""
+    media_list = media_list or []
+    # Обложка - первое медиа, если это фото (так карточка показывалась и раньше)
+    cover = media_list[0].get('id') if media_list and media_list[0].get('type') == 'photo' else None
+    return {'media': json.dumps(media_list), 'media_count': len(media_list), 'cover_file_id': cover}
+
+def set_item_media(cur, table, item_id, media_list):
+    """Записывает медиа элемента в таблицу media и обновляет JSON-копию, media_count и cover_file_id"""
+    media_list = media_list or []
+    cur.execute('DELETE FROM media WHERE item_table = ? AND item_id = ?', (table, item_id))
+    cur.executemany('INSERT INTO media (item_table, item_id, position, type, file_id) VALUES (?, ?, ?, ?, ?)',
+                    [(table, item_id, position, media.get('type'), media.get('id')) for position, media in enumerate(media_list)])
+    fields = media_fields(media_list)
+    cur.execute(f'UPDATE {table} SET media = ?, media_count = ?, cover_file_id = ? WHERE id = ?',
+                (fields['media'], fields['media_count'], fields['cover_file_id'], item_id))
+
+def _clients_v6_media_table(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS media (
+            item_table TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (item_table, item_id, position)
+        ) WITHOUT ROWID
+    ''')
+    for table in ("clients", "resourcepacks", "configs"):
+        # Денормализованные копии из таблицы media: списки показывают число медиа, а карточки обложку без JOIN
+        _add_column(cur, table, "media_count", "INTEGER DEFAULT 0")
+        _add_column(cur, table, "cover_file_id", "TEXT")
+        for item_id, media_json in cur.execute(f'SELECT id, media FROM {table}').fetchall():
+            try:
+                media_list = json.loads(media_json) if media_json else []
+            except (ValueError, TypeError):
+                media_list = []
+            # В старых записях type мог не сохраниться; раньше админка принимала только фото
+            set_item_media(cur, table, item_id, [{**m, 'type': m.get('type') or 'photo'} for m in media_list if isinstance(m, dict) and m.get('id')])
+
+def _clients_v7_list_covering_indexes(cur):
+    # Покрывающие индексы списков: страница читается из индекса, full_desc и media не загружаются
+    cur.execute('DROP INDEX IF EXISTS idx_clients_version')
+    cur.execute('DROP INDEX IF EXISTS idx_clients_version_nocase')
+    cur.execute('DROP INDEX IF EXISTS idx_resourcepacks_version_downloads_id')
+    cur.execute('DROP INDEX IF EXISTS idx_configs_client_version')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clients_version_list ON clients(version, id, name, media_count, downloads, is_vip)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clients_version_nocase_list ON clients(version COLLATE NOCASE, id, name, media_count, downloads, is_vip)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_resourcepacks_version_list ON resourcepacks(version, downloads, id, name, media_count, is_vip)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_configs_list ON configs(client_name, client_version, id, name, media_count, downloads, is_vip)')
+
+def _clients_v8_staged_changes(cur):
+    # Журнал правок админки: одна строка на элемент, op - insert/update/delete, fields - JSON новых значений
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS staged_changes (
+            item_table TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            fields TEXT NOT NULL DEFAULT '{}',
+            staged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (item_table, item_id)
+        ) WITHOUT ROWID
+    ''')
+
+CLIENTS_MIGRATIONS = [
+    _clients_v1_tables,
+    _clients_v2_vip_columns,
+    _clients_v3_indexes,
+    _clients_v4_packs_keyset_index,
+    _clients_v5_version_nocase_index,
+    _clients_v6_media_table,
+    _clients_v7_list_covering_indexes,
+    _clients_v8_staged_changes,
+]
+
+def _users_v1_tables(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            balance INTEGER DEFAULT 0,
+            is_vip INTEGER DEFAULT 0,
+            invites INTEGER DEFAULT 0,
+            downloads_total INTEGER DEFAULT 0,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS referrals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_id INTEGER NOT NULL,
+            referred_id INTEGER NOT NULL UNIQUE,
+            referred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS downloads_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            item_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            vip_item INTEGER DEFAULT 0,
+            downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS balance_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount INTEGER,
+            action TEXT NOT NULL,
+            admin_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _users_v2_columns(cur):
+    # Раньше эти колонки добавлялись на лету в add_balance/set_user_vip
+    _add_column(cur, "users", "balance", "INTEGER DEFAULT 0")
+    _add_column(cur, "users", "is_vip", "INTEGER DEFAULT 0")
+
+def _users_v3_indexes(cur):
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_downloads_log_user_date ON downloads_log(user_id, downloaded_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active)')
+
+USERS_MIGRATIONS = [
+    _users_v1_tables,
+    _users_v2_columns,
+    _users_v3_indexes,
+]
+
+def run_migrations(db_path, migrations):
+    """Применяет недостающие миграции; если схема актуальна - никакого DDL"""
+    with db_connection(db_path) as conn:
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        if current >= len(migrations):
+            return current
+        for version, migration in enumerate(migrations[current:], start=current + 1):
+            conn.execute('BEGIN')
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+            logger.info(f"🛠 Миграция {migration.__name__} применена к {Path(db_path).name} (версия {version})")
+    refresh_schema_cache(db_path)
+    return len(migrations)
+
 def init_db():
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        
-        # Таблица клиентов
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS clients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                full_desc TEXT NOT NULL,
-                media TEXT DEFAULT '[]',
-                download_url TEXT NOT NULL,
-                version TEXT,
-                is_vip INTEGER DEFAULT 0,
-                downloads INTEGER DEFAULT 0,
-                views INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица ресурспаков
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS resourcepacks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                full_desc TEXT NOT NULL,
-                media TEXT DEFAULT '[]',
-                download_url TEXT NOT NULL,
-                version TEXT,
-                author TEXT,
-                is_vip INTEGER DEFAULT 0,
-                downloads INTEGER DEFAULT 0,
-                likes INTEGER DEFAULT 0,
-                views INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица конфигов
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS configs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_name TEXT NOT NULL,
-                client_version TEXT NOT NULL,
-                name TEXT NOT NULL,
-                full_desc TEXT NOT NULL,
-                media TEXT DEFAULT '[]',
-                download_url TEXT NOT NULL,
-                is_vip INTEGER DEFAULT 0,
-                downloads INTEGER DEFAULT 0,
-                views INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица избранного
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS favorites (
-                user_id INTEGER NOT NULL,
-                pack_id INTEGER NOT NULL,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, pack_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        run_migrations(DB_PATH, CLIENTS_MIGRATIONS)
         print("✅ База данных клиентов готова")
         
         # Добавляем только клиентов
@@ -136,81 +566,33 @@ def init_db():
 def add_test_clients_only():
     """Добавляет только тестовых клиентов, без ресурспаков и конфигов"""
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
         
-        # Проверяем clients
-        cur.execute("SELECT COUNT(*) FROM clients")
-        if cur.fetchone()[0] == 0:
-            print("📝 Добавляю тестовые данные в clients...")
-            cur.execute('''
-                INSERT INTO clients (name, full_desc, download_url, version, is_vip, downloads) 
-                VALUES 
-                ('Vanilla Client', 'Обычный ванильный клиент Minecraft', 'https://example.com/vanilla', '1.20.4', 0, 100),
-                ('OptiFine Client', 'Клиент с OptiFine для лучшей производительности', 'https://example.com/optifine', '1.20.4', 0, 200),
-                ('VIP Client', 'Эксклюзивный VIP клиент с премиум функциями', 'https://example.com/vip', '1.20.4', 1, 50)
-            ''')
-            conn.commit()
-            print("✅ Тестовые данные добавлены в clients")
+            # Проверяем clients
+            cur.execute("SELECT COUNT(*) FROM clients")
+            if cur.fetchone()[0] == 0:
+                print("📝 Добавляю тестовые данные в clients...")
+                cur.execute('''
+                    INSERT INTO clients (name, full_desc, download_url, version, is_vip, downloads) 
+                    VALUES 
+                    ('Vanilla Client', 'Обычный ванильный клиент Minecraft', 'https://example.com/vanilla', '1.20.4', 0, 100),
+                    ('OptiFine Client', 'Клиент с OptiFine для лучшей производительности', 'https://example.com/optifine', '1.20.4', 0, 200),
+                    ('VIP Client', 'Эксклюзивный VIP клиент с премиум функциями', 'https://example.com/vip', '1.20.4', 1, 50)
+                ''')
+                print("✅ Тестовые данные добавлены в clients")
         
-        # resourcepacks и configs оставляем пустыми
-        cur.execute("DELETE FROM resourcepacks")
-        cur.execute("DELETE FROM configs")
-        conn.commit()
-        print("✅ Таблицы resourcepacks и configs очищены")
+            # resourcepacks и configs оставляем пустыми
+            cur.execute("DELETE FROM resourcepacks")
+            cur.execute("DELETE FROM configs")
+            print("✅ Таблицы resourcepacks и configs очищены")
         
-        conn.close()
     except Exception as e:
         print(f"❌ Ошибка при добавлении тестовых данных: {e}")
 
 def init_users_db():
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                balance INTEGER DEFAULT 0,
-                is_vip INTEGER DEFAULT 0,
-                invites INTEGER DEFAULT 0,
-                downloads_total INTEGER DEFAULT 0,
-                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS referrals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                referrer_id INTEGER NOT NULL,
-                referred_id INTEGER NOT NULL UNIQUE,
-                referred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS downloads_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                item_type TEXT NOT NULL,
-                item_id INTEGER NOT NULL,
-                vip_item INTEGER DEFAULT 0,
-                downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS balance_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount INTEGER,
-                action TEXT NOT NULL,
-                admin_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        run_migrations(USERS_DB_PATH, USERS_MIGRATIONS)
         print("✅ База данных пользователей готова")
     except Exception as e:
         print(f"❌ Ошибка при создании базы пользователей: {e}")
@@ -218,46 +600,179 @@ def init_users_db():
 init_db()
 init_users_db()
 
-# Функция для создания временной копии базы данных
+# ========== ЖУРНАЛ ИЗМЕНЕНИЙ ==========
+
+# Правки админки не трогают живые таблицы: они копятся в staged_changes и
+# накладываются на живые строки при чтении (use_temp=True). Сохранение
+# переносит в таблицы только журнал, поэтому счетчики пользователей за время
+# редактирования не теряются.
+
+def _staged_entry(cur, table, item_id):
+    row = cur.execute('SELECT op, fields FROM staged_changes WHERE item_table = ? AND item_id = ?', (table, item_id)).fetchone()
+    return (row[0], json.loads(row[1])) if row else (None, {})
+
+def _write_staged_entry(cur, table, item_id, op, fields):
+    cur.execute('''
+        INSERT INTO staged_changes (item_table, item_id, op, fields) VALUES (?, ?, ?, ?)
+        ON CONFLICT(item_table, item_id) DO UPDATE SET op = excluded.op, fields = excluded.fields, staged_at = CURRENT_TIMESTAMP
+    ''', (table, item_id, op, json.dumps(fields, ensure_ascii=False)))
+
+def stage_insert(cur, table, fields):
+    """Добавляет новый элемент в журнал; id выдается сразу, больше любого живого и уже выданного"""
+    columns = get_table_columns(DB_PATH, table)
+    fields = {**{counter: 0 for counter in CATALOG_COUNTERS if counter in columns}, **fields}
+    item_id = cur.execute(f'''
+        SELECT MAX(IFNULL((SELECT MAX(id) FROM {table}), 0),
+                   IFNULL((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                   IFNULL((SELECT MAX(item_id) FROM staged_changes WHERE item_table = ?), 0)) + 1
+    ''', (table, table)).fetchone()[0]
+    _write_staged_entry(cur, table, item_id, 'insert', fields)
+    return item_id
+
+def stage_update(cur, table, item_id, fields):
+    """Записывает новые значения полей элемента в журнал"""
+    op, staged = _staged_entry(cur, table, item_id)
+    if op == 'delete':
+        return False
+    if op is None:
+        if not cur.execute(f'SELECT 1 FROM {table} WHERE id = ?', (item_id,)).fetchone():
+            return False
+        op = 'update'
+    staged.update(fields)
+    _write_staged_entry(cur, table, item_id, op, staged)
+    return True
+
+def stage_delete(cur, table, item_id):
+    """Помечает элемент удаленным; еще не сохраненный новый элемент просто убирается из журнала"""
+    op, _ = _staged_entry(cur, table, item_id)
+    if op == 'insert':
+        cur.execute('DELETE FROM staged_changes WHERE item_table = ? AND item_id = ?', (table, item_id))
+        return True
+    if op is None and not cur.execute(f'SELECT 1 FROM {table} WHERE id = ?', (item_id,)).fetchone():
+        return False
+    _write_staged_entry(cur, table, item_id, 'delete', {})
+    return True
+
+def staged_source(cur, table):
+    """SQL-источник строк таблицы с наложенным журналом: живые строки с правками, без удаленных, плюс новые"""
+    if not cur.execute('SELECT 1 FROM staged_changes WHERE item_table = ? LIMIT 1', (table,)).fetchone():
+        return table
+    columns = sorted(get_table_columns(DB_PATH, table) - {'id'})
+    # json_type отличает отсутствующий ключ (NULL) от явно записанного null ('null')
+    merged = ", ".join(f"CASE WHEN json_type(s.fields, '$.{c}') IS NULL THEN t.{c} ELSE json_extract(s.fields, '$.{c}') END AS {c}" for c in columns)
+    inserted = ", ".join(f"json_extract(s.fields, '$.{c}') AS {c}" for c in columns)
+    return (f"(SELECT t.id AS id, {merged} FROM {table} t LEFT JOIN staged_changes s ON s.item_table = '{table}' AND s.item_id = t.id "
+            f"WHERE s.op IS NULL OR s.op = 'update' "
+            f"UNION ALL SELECT s.item_id, {inserted} FROM staged_changes s WHERE s.item_table = '{table}' AND s.op = 'insert')")
+
+def get_staged_changes_count():
+    try:
+        with db_connection(DB_PATH) as conn:
+            return conn.execute('SELECT COUNT(*) FROM staged_changes').fetchone()[0]
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения журнала изменений: {e}")
+        return 0
+
+DIFF_PAGE_SIZE = 15
+
+def _staged_diff_source():
+    """Строки журнала с именем элемента и списком реально измененных полей (сравнение с живой строкой в SQL)"""
+    parts = []
+    for table in CATALOG_TABLES:
+        columns = sorted(get_table_columns(DB_PATH, table) - {'id'})
+        live_value = "CASE je.key " + " ".join(f"WHEN '{c}' THEN t.{c}" for c in columns) + " END"
+        parts.append(
+            f"SELECT s.item_table AS item_table, s.item_id AS item_id, s.op AS op, "
+            f"COALESCE(json_extract(s.fields, '$.name'), t.name) AS name, "
+            f"(SELECT group_concat(je.key, ', ') FROM json_each(s.fields) je "
+            f"WHERE je.key NOT IN ('media_count', 'cover_file_id') AND {live_value} IS NOT je.value) AS changed "
+            f"FROM staged_changes s LEFT JOIN {table} t ON t.id = s.item_id WHERE s.item_table = '{table}'"
+        )
+    # Правка, вернувшая все поля к живым значениям, изменением не считается
+    return f"(SELECT * FROM ({' UNION ALL '.join(parts)}) WHERE op != 'update' OR changed IS NOT NULL)"
+
+def get_staged_diff(page: int = 1, per_page: int = DIFF_PAGE_SIZE):
+    """Что изменит сохранение: счетчики по таблицам и страница списка изменений"""
+    try:
+        with db_connection(DB_PATH) as conn:
+            source = _staged_diff_source()
+            counts = {}
+            for table, op, count in conn.execute(f'SELECT item_table, op, COUNT(*) FROM {source} GROUP BY item_table, op'):
+                counts.setdefault(table, {})[op] = count
+            total = sum(sum(ops.values()) for ops in counts.values())
+            items = conn.execute(
+                f'SELECT item_table, item_id, op, name, changed FROM {source} ORDER BY item_table, item_id LIMIT ? OFFSET ?',
+                (per_page, (page - 1) * per_page)
+            ).fetchall()
+            return counts, items, total
+    except Exception as e:
+        logger.error(f"❌ Ошибка сравнения журнала с БД: {e}")
+        return {}, [], 0
+
 def create_temp_db():
-    """Создает временную копию базы данных для редактирования"""
+    """Начинает сеанс редактирования: правки пишутся в журнал, несохраненные правки прошлых сеансов остаются"""
     try:
-        if TEMP_DB_PATH.exists():
-            TEMP_DB_PATH.unlink()
-        shutil.copy2(DB_PATH, TEMP_DB_PATH)
-        logger.info(f"✅ Создана временная копия БД: {TEMP_DB_PATH}")
+        pending = get_staged_changes_count()
+        logger.info(f"✏️ Сеанс редактирования, несохраненных правок: {pending}")
         return True
     except Exception as e:
-        logger.error(f"❌ Ошибка создания временной копии: {e}")
+        logger.error(f"❌ Ошибка начала редактирования: {e}")
         return False
 
-# Функция для применения изменений из временной БД
 def apply_temp_db_changes():
-    """Заменяет основную базу данных временной"""
+    """Переносит журнал правок в основную БД одной транзакцией: применяется все или ничего"""
     try:
-        # Создаем бэкап перед заменой
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = BACKUP_DIR / f"pre_edit_backup_{timestamp}.db"
-        shutil.copy2(DB_PATH, backup_path)
-        
-        # Заменяем основную БД временной
-        if TEMP_DB_PATH.exists():
-            shutil.copy2(TEMP_DB_PATH, DB_PATH)
-            TEMP_DB_PATH.unlink()
-            logger.info(f"✅ Изменения применены, создан бэкап: {backup_path}")
-            return True
-        return False
+        # Схему читаем до первой записи, чтобы внутри транзакции не было обращений к БД по другим путям
+        table_columns = {table: get_table_columns(DB_PATH, table) for table in CATALOG_TABLES}
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            entries = cur.execute('SELECT item_table, item_id, op, fields FROM staged_changes ORDER BY item_table, item_id').fetchall()
+            if not entries:
+                return False
+            pre_images = []
+            for table, item_id, op, fields_json in entries:
+                if table not in RECORD_TYPES:
+                    continue
+                columns = table_columns[table]
+                fields = json.loads(fields_json)
+                media = fields.pop('media', None)
+                fields = {k: v for k, v in fields.items() if k in columns and k not in ('id', 'media_count', 'cover_file_id')}
+                old = cur.execute(f'SELECT * FROM {table} WHERE id = ?', (item_id,))
+                old_row = old.fetchone()
+                if old_row:
+                    pre_images.append({'table': table, 'id': item_id, 'row': dict(zip((c[0] for c in old.description), old_row))})
+                if op == 'delete':
+                    cur.execute(f'DELETE FROM {table} WHERE id = ?', (item_id,))
+                    cur.execute('DELETE FROM media WHERE item_table = ? AND item_id = ?', (table, item_id))
+                    continue
+                if op == 'insert':
+                    names = ", ".join(["id", *fields])
+                    placeholders = ", ".join("?" * (len(fields) + 1))
+                    cur.execute(f'INSERT INTO {table} ({names}) VALUES ({placeholders})', (item_id, *fields.values()))
+                elif fields:
+                    assignments = ", ".join(f"{k} = ?" for k in fields)
+                    cur.execute(f'UPDATE {table} SET {assignments} WHERE id = ?', (*fields.values(), item_id))
+                if media is not None:
+                    set_item_media(cur, table, item_id, json.loads(media))
+            cur.execute('DELETE FROM staged_changes')
+            # Бэкап перед сохранением - прежние версии затронутых строк, размер зависит от числа правок, а не от БД
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_path = BACKUP_DIR / f"pre_edit_backup_{timestamp}.json"
+            BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+            backup_path.write_text(json.dumps(pre_images, ensure_ascii=False, default=str), encoding="utf-8")
+        build_catalog()
+        logger.info(f"✅ Изменения применены ({len(entries)} правок), создан бэкап: {backup_path}")
+        return True
     except Exception as e:
         logger.error(f"❌ Ошибка применения изменений: {e}")
         return False
 
-# Функция для отмены изменений
 def cancel_temp_db_changes():
-    """Отменяет изменения, удаляя временную БД"""
+    """Отменяет изменения, очищая журнал"""
     try:
-        if TEMP_DB_PATH.exists():
-            TEMP_DB_PATH.unlink()
-            logger.info("✅ Временная БД удалена, изменения отменены")
+        with db_connection(DB_PATH) as conn:
+            removed = conn.execute('DELETE FROM staged_changes').rowcount
+        logger.info(f"✅ Журнал очищен, отменено правок: {removed}")
         return True
     except Exception as e:
         logger.error(f"❌ Ошибка отмены изменений: {e}")
@@ -265,17 +780,16 @@ def cancel_temp_db_changes():
 
 def check_all_clients():
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, version, is_vip FROM clients ORDER BY id DESC LIMIT 20")
-        clients = cur.fetchall()
-        cur.execute("SELECT DISTINCT version FROM clients WHERE version IS NOT NULL AND version != ''")
-        versions = [v[0] for v in cur.fetchall()]
-        cur.execute("SELECT COUNT(*) FROM resourcepacks")
-        packs_count = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM configs")
-        configs_count = cur.fetchone()[0]
-        conn.close()
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, name, version, is_vip FROM clients ORDER BY id DESC LIMIT 20")
+            clients = cur.fetchall()
+            cur.execute("SELECT DISTINCT version FROM clients WHERE version IS NOT NULL AND version != ''")
+            versions = [v[0] for v in cur.fetchall()]
+            cur.execute("SELECT COUNT(*) FROM resourcepacks")
+            packs_count = cur.fetchone()[0]
+            cur.execute("SELECT COUNT(*) FROM configs")
+            configs_count = cur.fetchone()[0]
         print("\n" + "="*50)
         print("📊 ДИАГНОСТИКА БАЗЫ ДАННЫХ")
         print("="*50)
@@ -294,609 +808,1212 @@ def check_all_clients():
         logger.error(f"Ошибка проверки клиентов: {e}")
         return []
 
+BACKUP_MANIFEST_SUFFIX = ".manifest"
+
 def get_all_backups():
     try:
         files = os.listdir(str(BACKUP_DIR))
-        backups = [f for f in files if f.endswith('.zip')]
+        # Копии pre_restore_* тоже манифесты, но в список бэкапов для восстановления не входят
+        backups = [f for f in files if (f.endswith('.zip') or f.endswith(BACKUP_MANIFEST_SUFFIX)) and not f.startswith('pre_')]
         backups.sort(reverse=True)
         return backups
     except Exception as e:
         print(f"Ошибка получения списка бэкапов: {e}")
         return []
 
-def check_backup_structure(zip_path):
+def get_backup_size(path):
+    """Размер бэкапа для списка: у манифеста - суммарный размер файлов БД, у ZIP - размер архива"""
+    path = Path(path)
+    if path.name.endswith(BACKUP_MANIFEST_SUFFIX):
+        manifest = load_manifest(path)
+        return manifest.get('size', sum(entry['size'] for entry in manifest['files'].values()))
+    return path.stat().st_size
+
+def get_backup_sizes(names):
+    """Размеры бэкапов из BACKUP_DIR по именам; нечитаемые пропускаются"""
+    sizes = {}
+    for name in names:
+        try:
+            sizes[name] = get_backup_size(BACKUP_DIR / name)
+        except Exception as e:
+            logger.error(f"❌ Не удалось прочитать размер бэкапа {name}: {e}")
+    return sizes
+
+def check_backup_structure(path):
     issues = []
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zipf:
-            files = zipf.namelist()
-            if 'clients.db' not in files:
+        with open_backup(path) as members:
+            if 'clients.db' not in members:
                 issues.append("❌ Отсутствует clients.db")
-            if 'users.db' not in files:
+            if 'users.db' not in members:
                 issues.append("❌ Отсутствует users.db")
-            for file in files:
-                info = zipf.getinfo(file)
-                if info.file_size == 0:
-                    issues.append(f"⚠️ Файл {file} пустой")
+            for name, (size, _) in members.items():
+                if size == 0:
+                    issues.append(f"⚠️ Файл {name} пустой")
+        if str(path).endswith(BACKUP_MANIFEST_SUFFIX):
+            digests = {digest for entry in load_manifest(path)['files'].values() for digest in entry['chunks']}
+            missing = sum(1 for digest in digests if not _chunk_path(digest).exists())
+            if missing:
+                issues.append(f"❌ В хранилище нет чанков: {missing}")
         return issues
     except zipfile.BadZipFile:
         return ["❌ Файл поврежден (не является ZIP архивом)"]
     except Exception as e:
         return [f"❌ Ошибка проверки: {str(e)}"]
 
-async def create_zip_backup():
+BACKUP_CHUNK_SIZE = 1024 * 1024       # байт за шаг чтения/сжатия
+BACKUP_PROGRESS_INTERVAL = 2          # секунд между обновлениями прогресса
+
+# Бэкапы собираются в своем потоке: zlib и sha256 отпускают GIL, event loop и потоки БД не ждут
+_backup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup")
+
+# ========== ХРАНИЛИЩЕ ЧАНКОВ ==========
+
+# Бэкап - манифест BACKUP_DIR/<имя>.manifest со списком sha256 чанков каждого файла.
+# Чанк хранится один раз, сжатым, в store/<2 символа хэша>/<хэш>: одинаковые и почти
+# одинаковые бэкапы занимают место только под изменившиеся чанки.
+BACKUP_STORE_DIR = BACKUP_DIR / "store"
+BACKUP_STORE_CHUNK_SIZE = 64 * 1024   # кратно странице SQLite: измененная страница меняет один чанк
+
+# Запись чанков и манифестов и сборка мусора не должны пересекаться
+_store_lock = threading.Lock()
+
+def _chunk_path(digest):
+    return BACKUP_STORE_DIR / digest[:2] / digest
+
+def _store_chunk(data):
+    """Кладет чанк в хранилище, если его там еще нет; возвращает (хэш, новый ли чанк)"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(digest)
+    if path.exists():
+        return digest, False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = path.with_suffix(".part")
+    part_path.write_bytes(zlib.compress(data, 6))
+    os.replace(part_path, path)
+    return digest, True
+
+def _read_chunks(entry):
+    """Содержимое файла из манифеста по чанкам; хэш каждого чанка сверяется"""
+    for digest in entry['chunks']:
+        data = zlib.decompress(_chunk_path(digest).read_bytes())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"чанк {digest[:12]} поврежден")
+        yield data
+
+def _read_file(path, size=BACKUP_CHUNK_SIZE):
+    with open(path, 'rb') as src:
+        while chunk := src.read(size):
+            yield chunk
+
+def _split(pieces, size):
+    """Перенарезает поток кусков произвольной длины на куски ровно по size байт (последний - короче)"""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+def file_members(files):
+    """{имя в бэкапе: путь} -> {имя: (размер, функция, отдающая содержимое кусками)}"""
+    return {name: (Path(path).stat().st_size, lambda path=path: _read_file(path, BACKUP_STORE_CHUNK_SIZE)) for name, path in files.items()}
+
+def load_manifest(path):
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+@contextmanager
+def open_backup(path):
+    """Открывает бэкап (манифест или ZIP) и выдает {имя файла: (размер, функция, отдающая содержимое кусками)}"""
+    if str(path).endswith(BACKUP_MANIFEST_SUFFIX):
+        files = load_manifest(path)['files']
+        yield {name: (entry['size'], lambda entry=entry: _read_chunks(entry)) for name, entry in files.items()}
+        return
+    with zipfile.ZipFile(path, 'r') as zipf:
+        def read(info):
+            # CRC проверяет сам zipfile при дочитывании файла
+            with zipf.open(info) as src:
+                while chunk := src.read(BACKUP_CHUNK_SIZE):
+                    yield chunk
+        yield {info.filename: (info.file_size, lambda info=info: read(info)) for info in zipf.infolist() if not info.is_dir()}
+
+def store_backup(members, name, progress=None):
+    """Записывает файлы {имя: (размер, чтение)} в хранилище и манифест BACKUP_DIR/<name>.manifest; возвращает путь манифеста"""
+    report = progress or (lambda stage, percent: None)
+    total_size = sum(size for size, _ in members.values()) or 1
+    done = new_bytes = 0
+    manifest = {'created': datetime.now().isoformat(timespec='seconds'), 'chunk_size': BACKUP_STORE_CHUNK_SIZE, 'files': {}}
+    part_path = BACKUP_DIR / f"{name}{BACKUP_MANIFEST_SUFFIX}.part"
+    with _store_lock:
+        for member, (_, read) in members.items():
+            digests = []
+            size = 0
+            for chunk in _split(read(), BACKUP_STORE_CHUNK_SIZE):
+                digest, is_new = _store_chunk(chunk)
+                digests.append(digest)
+                size += len(chunk)
+                done += len(chunk)
+                new_bytes += len(chunk) if is_new else 0
+                report(f"сохранение {member}", done * 100 // total_size)
+            manifest['files'][member] = {'size': size, 'chunks': digests}
+        manifest['size'] = done
+        # Манифест появляется только после всех своих чанков
+        part_path.write_text(json.dumps(manifest), encoding="utf-8")
+        # Имена с точностью до секунды: одноименный манифест не перезаписываем, иначе сборка мусора
+        # удалит его чанки. Все записи манифестов идут под _store_lock, так что проверка без гонок
+        manifest_path = BACKUP_DIR / f"{name}{BACKUP_MANIFEST_SUFFIX}"
+        attempt = 1
+        while manifest_path.exists():
+            attempt += 1
+            manifest_path = BACKUP_DIR / f"{name}_{attempt}{BACKUP_MANIFEST_SUFFIX}"
+        os.replace(part_path, manifest_path)
+    logger.info(f"📦 Бэкап {manifest_path.stem}: {done // 1024} KB, новых данных {new_bytes // 1024} KB")
+    return manifest_path
+
+def gc_backup_store():
+    """Удаляет чанки, на которые не ссылается ни один манифест; возвращает число удаленных"""
+    if not BACKUP_STORE_DIR.exists():
+        return 0
+    deleted = 0
+    with _store_lock:
+        referenced = set()
+        for path in BACKUP_DIR.glob(f"*{BACKUP_MANIFEST_SUFFIX}"):
+            try:
+                for entry in load_manifest(path)['files'].values():
+                    referenced.update(entry['chunks'])
+            except Exception as e:
+                # Без полного списка ссылок удалять нельзя ничего
+                logger.error(f"❌ Манифест {path.name} не читается, очистка хранилища пропущена: {e}")
+                return 0
+        for path in BACKUP_STORE_DIR.glob("*/*"):
+            if path.name not in referenced:
+                path.unlink(missing_ok=True)
+                deleted += 1
+    if deleted:
+        logger.info(f"🧹 Удалено чанков без ссылок: {deleted}")
+    return deleted
+
+def store_pre_restore(db_name, path):
+    """Перекладывает копию БД, сделанную перед восстановлением, из файла в хранилище"""
+    path = Path(path)
+    if not path.exists():
+        return
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_filename = f"backup_{timestamp}.zip"
-        zip_path = BACKUP_DIR / zip_filename
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            if DB_PATH.exists():
-                zipf.write(DB_PATH, 'clients.db')
-            if USERS_DB_PATH.exists():
-                zipf.write(USERS_DB_PATH, 'users.db')
-        if zip_path.exists():
-            return str(zip_path), zip_filename
-        return None, None
+        store_backup(file_members({f"{db_name}.db": path}), path.stem)
+        path.unlink()
+    except Exception as e:
+        logger.error(f"❌ Копия {path.name} оставлена файлом: {e}")
+
+def build_store_backup(progress=None):
+    """Бэкап clients.db и users.db в хранилище из согласованных снимков; progress(этап, процент)"""
+    report = progress or (lambda stage, percent: None)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"backup_{timestamp}"
+    snapshot_dir = BACKUP_DIR / f"snapshot_{timestamp}"
+    try:
+        flush_counters()
+        flush_last_active()
+        snapshots = {}
+        for db_path, member in ((DB_PATH, 'clients.db'), (USERS_DB_PATH, 'users.db')):
+            if not db_path.exists():
+                continue
+            snapshots[member] = snapshot_dir / member
+            snapshot_db(db_path, snapshots[member], lambda done, total, member=member: report(f"снимок {member}", done * 100 // max(total, 1)))
+        manifest_path = store_backup(file_members(snapshots), name, report)
+        return str(manifest_path), manifest_path.name
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+def export_backup_zip(backup_path, zip_path, progress=None):
+    """Собирает из бэкапа ZIP для отправки в Telegram; возвращает путь архива"""
+    report = progress or (lambda stage, percent: None)
+    zip_path = Path(zip_path)
+    part_path = zip_path.with_name(zip_path.name + ".part")
+    try:
+        with open_backup(backup_path) as members, zipfile.ZipFile(part_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            total_size = sum(size for size, _ in members.values()) or 1
+            written = 0
+            for member, (_, read) in members.items():
+                with zipf.open(member, 'w') as dst:
+                    for chunk in read():
+                        dst.write(chunk)
+                        written += len(chunk)
+                        report("сжатие", written * 100 // total_size)
+        os.replace(part_path, zip_path)
+        return str(zip_path)
+    finally:
+        part_path.unlink(missing_ok=True)
+
+def import_zip_backup(zip_path, name, progress=None):
+    """Переносит загруженный ZIP в хранилище; возвращает путь манифеста"""
+    with open_backup(zip_path) as members:
+        members = {member: entry for member, entry in members.items() if member in RESTORE_TARGETS}
+        if not members:
+            raise ValueError("в архиве нет clients.db и users.db")
+        return store_backup(members, name, progress)
+
+async def run_backup_job(func, *args, on_progress=None):
+    """Выполняет func(*args, progress=...) в потоке бэкапов; on_progress(этап, процент) вызывается из event loop не чаще раза в BACKUP_PROGRESS_INTERVAL"""
+    state = {}
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_backup_executor, functools.partial(func, *args, progress=lambda stage, percent: state.update(stage=stage, percent=percent)))
+    reported = None
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=BACKUP_PROGRESS_INTERVAL)
+        if done:
+            return future.result()
+        current = (state.get('stage'), state.get('percent'))
+        if on_progress is not None and current[0] and current != reported:
+            reported = current
+            await on_progress(*current)
+
+async def run_backup_io(func, *args):
+    """Чтение манифестов и обход хранилища - в потоке бэкапов, не в event loop"""
+    return await asyncio.get_running_loop().run_in_executor(_backup_executor, functools.partial(func, *args))
+
+async def create_backup_async(on_progress=None):
+    """Бэкап в отдельном потоке, см. run_backup_job; возвращает (путь манифеста, имя)"""
+    try:
+        return await run_backup_job(build_store_backup, on_progress=on_progress)
     except Exception as e:
         logger.error(f"Ошибка создания бэкапа: {e}")
         return None, None
 
-async def restore_from_zip(zip_path):
+# Файлы, которые берутся из бэкапа: рабочая БД, ее миграции и таблицы/колонки, без которых файл не подставить
+RESTORE_TARGETS = {
+    'clients.db': (DB_PATH, CLIENTS_MIGRATIONS, {
+        'clients': {'id', 'name', 'full_desc', 'download_url', 'version'},
+        'resourcepacks': {'id', 'name', 'full_desc', 'download_url', 'version'},
+        'configs': {'id', 'client_name', 'client_version', 'name', 'full_desc', 'download_url'},
+        'favorites': {'user_id', 'pack_id'},
+    }),
+    'users.db': (USERS_DB_PATH, USERS_MIGRATIONS, {
+        'users': {'user_id', 'username', 'first_name', 'last_name'},
+        'referrals': {'referrer_id', 'referred_id'},
+        'downloads_log': {'user_id', 'item_type', 'item_id'},
+    }),
+}
+
+def verify_db_file(path, migrations, required):
+    """Проверяет файл БД из бэкапа: integrity_check, версия схемы, обязательные таблицы и колонки; возвращает список проблем"""
+    problems = []
     try:
-        extract_dir = BACKUP_DIR / f"restore_temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        extract_dir.mkdir(parents=True, exist_ok=True)
-        with zipfile.ZipFile(zip_path, 'r') as zipf:
-            zipf.extractall(extract_dir)
-        restored = False
-        restored_files = []
-        for file in extract_dir.iterdir():
-            if file.name == 'clients.db':
-                if DB_PATH.exists():
-                    backup_path = BACKUP_DIR / f"pre_restore_clients_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-                    shutil.copy2(DB_PATH, backup_path)
-                shutil.copy2(file, DB_PATH)
-                restored = True
-                restored_files.append('clients.db')
-            elif file.name == 'users.db':
-                if USERS_DB_PATH.exists():
-                    backup_path = BACKUP_DIR / f"pre_restore_users_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-                    shutil.copy2(USERS_DB_PATH, backup_path)
-                shutil.copy2(file, USERS_DB_PATH)
-                restored = True
-                restored_files.append('users.db')
-        shutil.rmtree(extract_dir, ignore_errors=True)
-        if restored:
+        conn = sqlite3.connect(str(path))
+        try:
+            problems += [row[0] for row in conn.execute("PRAGMA integrity_check") if row[0] != 'ok']
+            if problems:
+                return problems
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > len(migrations):
+                problems.append(f"схема версии {version} новее, чем знает бот ({len(migrations)})")
+            for table, columns in required.items():
+                existing = {col[1] for col in conn.execute(f"PRAGMA table_info({table})")}
+                if not existing:
+                    problems.append(f"нет таблицы {table}")
+                elif columns - existing:
+                    problems.append(f"в {table} нет колонок: {', '.join(sorted(columns - existing))}")
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        problems.append(str(e))
+    return problems
+
+def _stage_member(chunks, size, dst_path, report, name):
+    """Пишет файл бэкапа в файл подготовки кусками"""
+    written = 0
+    with open(dst_path, 'wb') as dst:
+        for chunk in chunks:
+            dst.write(chunk)
+            written += len(chunk)
+            report(f"распаковка {name}", written * 100 // max(size, 1))
+        dst.flush()
+        os.fsync(dst.fileno())
+
+def restore_backup_file(backup_path, progress=None):
+    """Восстанавливает clients.db и users.db из бэкапа (манифест или ZIP); возвращает список восстановленных файлов
+
+    Каждый файл распаковывается в папку подготовки и проверяется, рабочие БД
+    подменяются только после проверки всех файлов. При любой проблеме летит
+    исключение, а рабочие БД остаются как были.
+    """
+    report = progress or (lambda stage, percent: None)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    staging_dir = BACKUP_DIR / f"restore_temp_{timestamp}"
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        staged = []
+        with open_backup(backup_path) as members:
+            for name, (db_path, migrations, required) in RESTORE_TARGETS.items():
+                if name not in members:
+                    continue
+                size, read = members[name]
+                staged_path = staging_dir / name
+                _stage_member(read(), size, staged_path, report, name)
+                report(f"проверка {name}", 0)
+                problems = verify_db_file(staged_path, migrations, required)
+                if problems:
+                    raise ValueError(f"{name}: {'; '.join(problems)}")
+                staged.append((name, staged_path))
+        for name, staged_path in staged:
+            db_path, migrations, _ = RESTORE_TARGETS[name]
+            report(f"подмена {name}", 100)
+            if db_path == DB_PATH:
+                flush_counters()
+            else:
+                flush_last_active()
+            backup_path = BACKUP_DIR / f"pre_restore_{Path(name).stem}_{timestamp}.db"
+            publish_db(staged_path, db_path, backup_path)
+            run_migrations(db_path, migrations)
+            if db_path == DB_PATH:
+                build_catalog()
+            else:
+                invalidate_user_status()
+            store_pre_restore(Path(name).stem, backup_path)
+        restored_files = [name for name, _ in staged]
+        if restored_files:
             logger.info(f"✅ Восстановлены файлы: {', '.join(restored_files)}")
-        return restored
+        return restored_files
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+async def restore_from_backup(backup_path, on_progress=None):
+    """Восстановление в потоке бэкапов; возвращает (восстановленные файлы, текст ошибки или None)"""
+    try:
+        restored_files = await run_backup_job(restore_backup_file, backup_path, on_progress=on_progress)
+        if not restored_files:
+            return [], "в бэкапе нет clients.db и users.db"
+        return restored_files, None
     except Exception as e:
         logger.error(f"Ошибка восстановления: {e}")
-        return False
+        return [], str(e)
+
+# ========== НЕПРЕРЫВНЫЙ БЭКАП (WAL) ==========
+
+# Поколение - папка BACKUP_DIR/wal/<имя БД>/<время>: полный снимок base.db и сегменты <время>.wal.
+# Сегмент - копия WAL за интервал, т.е. только измененные страницы; стоимость зависит от числа записей, а не от размера БД.
+WAL_BACKUP_DIR = BACKUP_DIR / "wal"
+WAL_SHIP_INTERVAL = 30                  # секунд между отправками WAL (точность восстановления)
+WAL_GENERATION_INTERVAL = 24 * 3600     # новый полный снимок раз в сутки
+WAL_KEEP_GENERATIONS = 7
+WAL_SHIPPED_DBS = {"clients": DB_PATH, "users": USERS_DB_PATH}
+WAL_TIME_FORMAT = "%Y%m%d_%H%M%S_%f"
+
+def ship_wal(db_path):
+    """Копирует накопленный WAL сегментом в текущее поколение и обнуляет WAL; возвращает размер сегмента"""
+    generation = _wal_generations.get(str(db_path))
+    if generation is None:
+        return 0
+    wal_path = Path(f"{db_path}-wal")
+    with db_lock(db_path):
+        conn = _get_db(db_path)
+        size = wal_path.stat().st_size if wal_path.exists() else 0
+        if size == 0:
+            return 0
+        segment = generation[0] / f"{datetime.now().strftime(WAL_TIME_FORMAT)}.wal"
+        part_path = segment.with_suffix(".part")
+        with open(wal_path, 'rb') as src, open(part_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, BACKUP_CHUNK_SIZE)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(part_path, segment)
+        # Не ждем чужих читателей (например, снимок для ZIP) под блокировкой БД
+        conn.execute("PRAGMA busy_timeout=0")
+        try:
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        finally:
+            conn.execute("PRAGMA busy_timeout=10000")
+        if busy:
+            # WAL не обнулился - следующий сегмент повторит эти кадры, при восстановлении это безвредно
+            logger.info(f"ℹ️ WAL {db_path} занят читателем, обнулю в следующий раз")
+        return size
+
+def start_wal_generation(db_path):
+    """Начинает новое поколение WAL-бэкапа: дописывает хвост старого и снимает полную копию БД"""
+    key = str(db_path)
+    with db_lock(db_path):
+        ship_wal(db_path)
+        generation_dir = WAL_BACKUP_DIR / Path(db_path).stem / datetime.now().strftime(WAL_TIME_FORMAT)
+        snapshot_db(db_path, generation_dir / "base.db")
+        _wal_generations[key] = (generation_dir, time.monotonic())
+        _get_db(db_path).execute("PRAGMA wal_autocheckpoint=0")
+    logger.info(f"🧬 Новое поколение WAL-бэкапа: {generation_dir}")
+    prune_wal_generations(db_path)
+
+def _wal_generation_dirs(name):
+    root = WAL_BACKUP_DIR / name
+    if not root.exists():
+        return []
+    return sorted(path for path in root.iterdir() if (path / "base.db").exists())
+
+def prune_wal_generations(db_path):
+    """Оставляет WAL_KEEP_GENERATIONS последних поколений"""
+    current = _wal_generations.get(str(db_path), (None,))[0]
+    for path in _wal_generation_dirs(Path(db_path).stem)[:-WAL_KEEP_GENERATIONS]:
+        if path != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+def rebuild_db_at(name, moment, dst_path):
+    """Собирает БД name ('clients'/'users') на момент moment: base.db поколения плюс его сегменты до moment
+
+    Возвращает время последнего примененного сегмента (или снимка), None - если бэкапа на этот момент нет.
+    """
+    generation_dir = None
+    for path in _wal_generation_dirs(name):
+        if datetime.strptime(path.name, WAL_TIME_FORMAT) <= moment:
+            generation_dir = path
+    if generation_dir is None:
+        return None
+    dst_path = Path(dst_path)
+    remove_db_files(dst_path)
+    shutil.copyfile(generation_dir / "base.db", dst_path)
+    conn = sqlite3.connect(str(dst_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    applied = datetime.strptime(generation_dir.name, WAL_TIME_FORMAT)
+    for segment in sorted(generation_dir.glob("*.wal")):
+        shipped_at = datetime.strptime(segment.stem, WAL_TIME_FORMAT)
+        if shipped_at > moment:
+            break
+        # Подкладываем сегмент как -wal: SQLite восстановит его и перенесет страницы в файл
+        Path(f"{dst_path}-shm").unlink(missing_ok=True)
+        shutil.copyfile(segment, f"{dst_path}-wal")
+        conn = sqlite3.connect(str(dst_path))
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        applied = shipped_at
+    conn = sqlite3.connect(str(dst_path))
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        if conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise sqlite3.DatabaseError(f"собранная БД {dst_path} повреждена")
+    finally:
+        conn.close()
+    return applied
+
+def restore_db_at(name, moment):
+    """Восстанавливает БД name на момент moment с сохранением текущей версии; возвращает время восстановленного состояния"""
+    try:
+        db_path = WAL_SHIPPED_DBS[name]
+        staged_path = BACKUP_DIR / f"pitr_{name}.db"
+        applied = rebuild_db_at(name, moment, staged_path)
+        if applied is None:
+            remove_db_files(staged_path)
+            return None
+        if db_path == DB_PATH:
+            flush_counters()
+        else:
+            flush_last_active()
+        backup_path = BACKUP_DIR / f"pre_restore_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+        publish_db(staged_path, db_path, backup_path)
+        if db_path == DB_PATH:
+            run_migrations(DB_PATH, CLIENTS_MIGRATIONS)
+            build_catalog()
+        else:
+            run_migrations(USERS_DB_PATH, USERS_MIGRATIONS)
+            invalidate_user_status()
+        store_pre_restore(name, backup_path)
+        logger.info(f"✅ {name}.db восстановлена на {applied}")
+        return applied
+    except Exception as e:
+        logger.error(f"❌ Ошибка восстановления {name}.db на {moment}: {e}")
+        return None
+
+async def wal_ship_loop():
+    """Фоновая отправка WAL каждые WAL_SHIP_INTERVAL секунд, новое поколение раз в WAL_GENERATION_INTERVAL"""
+    while True:
+        await asyncio.sleep(WAL_SHIP_INTERVAL)
+        for db_path in WAL_SHIPPED_DBS.values():
+            try:
+                generation = _wal_generations.get(str(db_path))
+                if generation is None or time.monotonic() - generation[1] > WAL_GENERATION_INTERVAL:
+                    await run_db(db_path, start_wal_generation, db_path)
+                else:
+                    await run_db(db_path, ship_wal, db_path)
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки WAL {db_path}: {e}")
+
+# ========== РАСПИСАНИЕ И ХРАНЕНИЕ БЭКАПОВ ==========
+
+BACKUP_SCHEDULE_MAX_INTERVAL = 12 * 3600   # автобэкап не реже
+BACKUP_SCHEDULE_MIN_INTERVAL = 3 * 3600    # в тихое время - не чаще
+BACKUP_SCHEDULE_CHECK_INTERVAL = 10 * 60   # секунд между проверками расписания
+BACKUP_QUIET_UPDATES = 20                  # апдейтов за проверку, при которых нагрузка считается низкой
+
+# Дед-отец-сын: в каждой серии остается самый новый файл каждого часа за сутки, дня за неделю,
+# недели за 4 недели и месяца за полгода, плюс самый новый файл серии
+BACKUP_RETENTION = (("%Y%m%d%H", timedelta(hours=24)), ("%Y%m%d", timedelta(days=7)),
+                    ("%G%V", timedelta(weeks=4)), ("%Y%m", timedelta(days=183)))
+BACKUP_SERIES = ("backup_", "uploaded_", "pre_edit_backup_", "pre_restore_clients_", "pre_restore_users_")
+
+# Число входящих апдейтов с запуска; по приросту планировщик находит тихие окна
+_updates_seen = 0
+
+@dp.update.outer_middleware()
+async def count_updates(handler, event, data):
+    global _updates_seen
+    _updates_seen += 1
+    return await handler(event, data)
+
+def get_backup_series():
+    """Файлы бэкапов по сериям: префикс -> [(время создания, путь)]"""
+    series = {}
+    if not BACKUP_DIR.exists():
+        return series
+    for path in BACKUP_DIR.iterdir():
+        prefix = next((prefix for prefix in BACKUP_SERIES if path.name.startswith(prefix)), None)
+        if prefix is None or not path.is_file() or path.name.endswith('.part'):
+            continue
+        match = re.match(r'\d{8}_\d{6}', path.name[len(prefix):])
+        try:
+            moment = datetime.strptime(match.group(0), "%Y%m%d_%H%M%S")
+        except (AttributeError, ValueError):
+            moment = datetime.fromtimestamp(path.stat().st_mtime)
+        series.setdefault(prefix, []).append((moment, path))
+    return series
+
+def gfs_keep(moments, now=None):
+    """Моменты, которые оставляет BACKUP_RETENTION"""
+    now = now or datetime.now()
+    newest_first = sorted(moments, reverse=True)
+    keep = set(newest_first[:1])
+    for bucket_format, window in BACKUP_RETENTION:
+        buckets = set()
+        for moment in newest_first:
+            if now - moment > window:
+                break
+            bucket = moment.strftime(bucket_format)
+            if bucket not in buckets:
+                buckets.add(bucket)
+                keep.add(moment)
+    return keep
+
+def apply_backup_retention():
+    """Удаляет бэкапы всех серий, не попавшие в BACKUP_RETENTION; возвращает число удаленных файлов"""
+    deleted = 0
+    try:
+        for prefix, files in get_backup_series().items():
+            keep = gfs_keep([moment for moment, _ in files])
+            for moment, path in files:
+                if moment not in keep:
+                    path.unlink(missing_ok=True)
+                    deleted += 1
+        if deleted:
+            logger.info(f"🧹 Удалено старых бэкапов: {deleted}")
+        gc_backup_store()
+    except Exception as e:
+        logger.error(f"❌ Ошибка очистки бэкапов: {e}")
+    return deleted
+
+def get_backup_disk_usage():
+    """Место под бэкапы в байтах: хранилище чанков с манифестами, ZIP, прочие копии, WAL; плюс свободное место на томе"""
+    usage = {'store': 0, 'zip': 0, 'copies': 0, 'wal': 0, 'free': 0}
+    if not BACKUP_DIR.exists():
+        return usage
+    for path in BACKUP_DIR.rglob('*'):
+        if not path.is_file():
+            continue
+        size = path.stat().st_size
+        if path.is_relative_to(WAL_BACKUP_DIR):
+            usage['wal'] += size
+        elif path.is_relative_to(BACKUP_STORE_DIR) or path.name.endswith(BACKUP_MANIFEST_SUFFIX):
+            usage['store'] += size
+        elif path.suffix == '.zip':
+            usage['zip'] += size
+        else:
+            usage['copies'] += size
+    usage['free'] = shutil.disk_usage(BACKUP_DIR).free
+    return usage
+
+def delete_all_backups():
+    """Удаляет все бэкапы из списка и освободившиеся чанки; возвращает число удаленных бэкапов"""
+    deleted = 0
+    for name in get_all_backups():
+        try:
+            (BACKUP_DIR / name).unlink()
+            deleted += 1
+        except Exception as e:
+            logger.error(f"❌ Не удалось удалить бэкап {name}: {e}")
+    gc_backup_store()
+    return deleted
+
+def last_backup_time():
+    moments = [moment for moment, _ in get_backup_series().get("backup_", [])]
+    return max(moments) if moments else None
+
+async def backup_scheduler_loop():
+    """Автобэкап раз в BACKUP_SCHEDULE_MAX_INTERVAL или раньше, если бот затих; после каждого - очистка по схеме хранения"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_backup_executor, apply_backup_retention)
+    updates_before = _updates_seen
+    while True:
+        await asyncio.sleep(BACKUP_SCHEDULE_CHECK_INTERVAL)
+        updates, updates_before = _updates_seen - updates_before, _updates_seen
+        try:
+            last = await loop.run_in_executor(_backup_executor, last_backup_time)
+            elapsed = (datetime.now() - last).total_seconds() if last else None
+            quiet = updates <= BACKUP_QUIET_UPDATES
+            if elapsed is not None and elapsed < BACKUP_SCHEDULE_MAX_INTERVAL and not (quiet and elapsed >= BACKUP_SCHEDULE_MIN_INTERVAL):
+                continue
+            backup_path, _ = await create_backup_async()
+            if backup_path:
+                logger.info(f"⏰ Автобэкап создан: {backup_path} (апдейтов за {BACKUP_SCHEDULE_CHECK_INTERVAL // 60} мин: {updates})")
+            await loop.run_in_executor(_backup_executor, apply_backup_retention)
+        except Exception as e:
+            logger.error(f"❌ Ошибка автобэкапа: {e}")
 
 def get_users_count():
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute('SELECT COUNT(*) FROM users')
-        result = cur.fetchone()
-        conn.close()
-        return result[0] if result else 0
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT COUNT(*) FROM users')
+            result = cur.fetchone()
+            return result[0] if result else 0
     except Exception as e:
         logger.error(f"Ошибка получения количества пользователей: {e}")
         return 0
 
 def get_vip_users_count():
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'is_vip' in columns:
-            cur.execute('SELECT COUNT(*) FROM users WHERE is_vip = 1')
-            result = cur.fetchone()
-            conn.close()
-            return result[0] if result else 0
-        else:
-            conn.close()
-            return 0
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            columns = get_table_columns(USERS_DB_PATH, "users")
+            if 'is_vip' in columns:
+                cur.execute('SELECT COUNT(*) FROM users WHERE is_vip = 1')
+                result = cur.fetchone()
+                return result[0] if result else 0
+            else:
+                return 0
     except Exception as e:
         logger.error(f"Ошибка получения количества VIP пользователей: {e}")
         return 0
 
 def get_all_users():
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute('SELECT user_id FROM users ORDER BY last_active DESC')
-        users = [row[0] for row in cur.fetchall()]
-        conn.close()
-        return users
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT user_id FROM users ORDER BY last_active DESC')
+            users = [row[0] for row in cur.fetchall()]
+            return users
     except Exception as e:
         logger.error(f"Ошибка получения списка пользователей: {e}")
         return []
 
 def get_all_users_with_details():
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cur.fetchall()]
-        has_balance = 'balance' in columns
-        has_vip = 'is_vip' in columns
-        if has_balance and has_vip:
-            cur.execute('SELECT user_id, username, first_name, balance, is_vip FROM users ORDER BY last_active DESC')
-        elif has_balance:
-            cur.execute('SELECT user_id, username, first_name, balance, 0 as is_vip FROM users ORDER BY last_active DESC')
-        elif has_vip:
-            cur.execute('SELECT user_id, username, first_name, 0 as balance, is_vip FROM users ORDER BY last_active DESC')
-        else:
-            cur.execute('SELECT user_id, username, first_name, 0 as balance, 0 as is_vip FROM users ORDER BY last_active DESC')
-        users = cur.fetchall()
-        conn.close()
-        return users
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            columns = get_table_columns(USERS_DB_PATH, "users")
+            has_balance = 'balance' in columns
+            has_vip = 'is_vip' in columns
+            if has_balance and has_vip:
+                cur.execute('SELECT user_id, username, first_name, balance, is_vip FROM users ORDER BY last_active DESC')
+            elif has_balance:
+                cur.execute('SELECT user_id, username, first_name, balance, 0 as is_vip FROM users ORDER BY last_active DESC')
+            elif has_vip:
+                cur.execute('SELECT user_id, username, first_name, 0 as balance, is_vip FROM users ORDER BY last_active DESC')
+            else:
+                cur.execute('SELECT user_id, username, first_name, 0 as balance, 0 as is_vip FROM users ORDER BY last_active DESC')
+            users = cur.fetchall()
+            return users
     except Exception as e:
         logger.error(f"Ошибка получения списка пользователей: {e}")
         return []
 
+# ========== КЭШ СТАТУСОВ ПОЛЬЗОВАТЕЛЕЙ ==========
+
+USER_STATUS_CACHE_SIZE = 5000   # максимум пользователей в кэше
+USER_STATUS_CACHE_TTL = 300     # секунд жизни записи
+
+# user_id -> (время записи, статус); порядок - от давно использованных к недавним
+_user_status_cache = OrderedDict()
+_user_status_lock = threading.Lock()
+
+def get_cached_user_status(user_id):
+    with _user_status_lock:
+        entry = _user_status_cache.get(user_id)
+        if entry is None:
+            return None
+        stored_at, status = entry
+        if time.monotonic() - stored_at > USER_STATUS_CACHE_TTL:
+            del _user_status_cache[user_id]
+            return None
+        _user_status_cache.move_to_end(user_id)
+        return status
+
+def _cache_user_status(user_id, status):
+    with _user_status_lock:
+        _user_status_cache[user_id] = (time.monotonic(), status)
+        _user_status_cache.move_to_end(user_id)
+        while len(_user_status_cache) > USER_STATUS_CACHE_SIZE:
+            _user_status_cache.popitem(last=False)
+
+def invalidate_user_status(user_id=None):
+    """Сбрасывает статус одного пользователя или весь кэш (после восстановления users.db)"""
+    with _user_status_lock:
+        if user_id is None:
+            _user_status_cache.clear()
+        else:
+            _user_status_cache.pop(user_id, None)
+
 def get_user_status(user_id: int):
+    """Статус пользователя одним SELECT; новый пользователь создается атомарным upsert"""
+    status = get_cached_user_status(user_id)
+    if status is not None:
+        return status
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cur.fetchall()]
-        has_balance = 'balance' in columns
-        has_vip = 'is_vip' in columns
-        cur.execute('SELECT user_id, username, invites, downloads_total FROM users WHERE user_id = ?', (user_id,))
-        user = cur.fetchone()
-        if not user:
-            try:
-                if has_balance and has_vip:
-                    cur.execute('INSERT INTO users (user_id, balance, is_vip, last_active) VALUES (?, 0, 0, CURRENT_TIMESTAMP)', (user_id,))
-                else:
-                    cur.execute('INSERT INTO users (user_id, last_active) VALUES (?, CURRENT_TIMESTAMP)', (user_id,))
-                conn.commit()
-                logger.info(f"Создан новый пользователь: {user_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при создании пользователя {user_id}: {e}")
-            status_data = {
-                'user_id': user_id,
-                'is_admin': (user_id == ADMIN_ID),
-                'balance': 0,
-                'is_vip': False,
-                'invites': 0,
-                'downloads_total': 0
-            }
-        else:
-            balance = 0
-            is_vip = False
-            if has_balance:
-                cur.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-                bal_result = cur.fetchone()
-                balance = bal_result[0] if bal_result else 0
-            if has_vip:
-                cur.execute('SELECT is_vip FROM users WHERE user_id = ?', (user_id,))
-                vip_result = cur.fetchone()
-                is_vip = vip_result[0] == 1 if vip_result else False
-            status_data = {
-                'user_id': user[0],
-                'is_admin': (user_id == ADMIN_ID),
-                'balance': balance,
-                'is_vip': is_vip,
-                'invites': user[2] if user[2] is not None else 0,
-                'downloads_total': user[3] if user[3] is not None else 0
-            }
-        conn.close()
-        return status_data
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.row_factory = UserStatus.from_row
+            status = cur.execute(f'SELECT {UserStatus.select()} FROM users WHERE user_id = ?', (user_id,)).fetchone()
+            if status is None:
+                cur = conn.execute('INSERT INTO users (user_id, balance, is_vip, last_active) VALUES (?, 0, 0, CURRENT_TIMESTAMP) ON CONFLICT(user_id) DO NOTHING', (user_id,))
+                if cur.rowcount:
+                    logger.info(f"Создан новый пользователь: {user_id}")
+                status = UserStatus(user_id, 0, 0, 0, 0)
+        _cache_user_status(user_id, status)
+        return status
     except Exception as e:
         logger.error(f"Ошибка в get_user_status для {user_id}: {e}")
-        return {
-            'user_id': user_id,
-            'is_admin': (user_id == ADMIN_ID),
-            'balance': 0,
-            'is_vip': False,
-            'invites': 0,
-            'downloads_total': 0
-        }
+        return UserStatus(user_id, 0, 0, 0, 0)
 
 def add_balance(user_id: int, amount: int, admin_id: int = None):
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'balance' not in columns:
-            cur.execute("ALTER TABLE users ADD COLUMN balance INTEGER DEFAULT 0")
-        cur.execute('UPDATE users SET balance = COALESCE(balance, 0) + ?, last_active = CURRENT_TIMESTAMP WHERE user_id = ?', (amount, user_id))
-        cur.execute("INSERT INTO balance_history (user_id, amount, action, admin_id) VALUES (?, ?, 'add', ?)", (user_id, amount, admin_id))
-        conn.commit()
-        conn.close()
-        return True
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('UPDATE users SET balance = COALESCE(balance, 0) + ?, last_active = CURRENT_TIMESTAMP WHERE user_id = ?', (amount, user_id))
+            cur.execute("INSERT INTO balance_history (user_id, amount, action, admin_id) VALUES (?, ?, 'add', ?)", (user_id, amount, admin_id))
+            invalidate_user_status(user_id)
+            return True
     except Exception as e:
         logger.error(f"Ошибка добавления баланса для {user_id}: {e}")
         return False
 
 def set_user_vip(user_id: int, admin_id: int = None):
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'is_vip' not in columns:
-            cur.execute("ALTER TABLE users ADD COLUMN is_vip INTEGER DEFAULT 0")
-        cur.execute('UPDATE users SET is_vip = 1, last_active = CURRENT_TIMESTAMP WHERE user_id = ?', (user_id,))
-        cur.execute("INSERT INTO balance_history (user_id, action, admin_id) VALUES (?, 'vip_grant', ?)", (user_id, admin_id))
-        conn.commit()
-        conn.close()
-        logger.info(f"VIP статус установлен для пользователя {user_id}")
-        return True
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('UPDATE users SET is_vip = 1, last_active = CURRENT_TIMESTAMP WHERE user_id = ?', (user_id,))
+            cur.execute("INSERT INTO balance_history (user_id, action, admin_id) VALUES (?, 'vip_grant', ?)", (user_id, admin_id))
+            logger.info(f"VIP статус установлен для пользователя {user_id}")
+            invalidate_user_status(user_id)
+            return True
     except Exception as e:
         logger.error(f"Ошибка установки VIP статуса для {user_id}: {e}")
         return False
 
 def remove_user_vip(user_id: int, admin_id: int = None):
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'is_vip' not in columns:
-            cur.execute("ALTER TABLE users ADD COLUMN is_vip INTEGER DEFAULT 0")
-        cur.execute('UPDATE users SET is_vip = 0, last_active = CURRENT_TIMESTAMP WHERE user_id = ?', (user_id,))
-        cur.execute("INSERT INTO balance_history (user_id, action, admin_id) VALUES (?, 'vip_remove', ?)", (user_id, admin_id))
-        conn.commit()
-        conn.close()
-        logger.info(f"VIP статус снят с пользователя {user_id}")
-        return True
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('UPDATE users SET is_vip = 0, last_active = CURRENT_TIMESTAMP WHERE user_id = ?', (user_id,))
+            cur.execute("INSERT INTO balance_history (user_id, action, admin_id) VALUES (?, 'vip_remove', ?)", (user_id, admin_id))
+            logger.info(f"VIP статус снят с пользователя {user_id}")
+            invalidate_user_status(user_id)
+            return True
     except Exception as e:
         logger.error(f"Ошибка снятия VIP статуса для {user_id}: {e}")
         return False
 
-def increment_download_count(user_id: int, vip_item: bool = False):
+def record_downloads(events):
+    """Записывает пачку скачиваний одной транзакцией: upsert пользователя, downloads_total и downloads_log.
+    events - список (user_id, item_id, vip_item)"""
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
-        if not cur.fetchone():
-            cur.execute('INSERT INTO users (user_id, last_active) VALUES (?, CURRENT_TIMESTAMP)', (user_id,))
-        cur.execute('UPDATE users SET downloads_total = COALESCE(downloads_total, 0) + 1, last_active = CURRENT_TIMESTAMP WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("INSERT INTO downloads_log (user_id, item_type, item_id, vip_item) VALUES (?, 'download', 0, ?)", (user_id, 1 if vip_item else 0))
-        conn.commit()
-        conn.close()
+        with db_connection(USERS_DB_PATH) as conn:
+            conn.executemany('''
+                INSERT INTO users (user_id, downloads_total, last_active) VALUES (?, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET downloads_total = COALESCE(downloads_total, 0) + 1, last_active = CURRENT_TIMESTAMP
+            ''', [(user_id,) for user_id, _, _ in events])
+            conn.executemany("INSERT INTO downloads_log (user_id, item_type, item_id, vip_item) VALUES (?, 'download', ?, ?)",
+                             [(user_id, item_id, 1 if vip_item else 0) for user_id, item_id, vip_item in events])
+        for user_id, _, _ in events:
+            invalidate_user_status(user_id)
+        return True
     except Exception as e:
-        logger.error(f"Ошибка увеличения счётчика для {user_id}: {e}")
+        logger.error(f"Ошибка записи скачиваний ({len(events)} шт.): {e}")
+        return False
+
+DOWNLOADS_FLUSH_INTERVAL = 5   # секунд между пакетными записями скачиваний
+DOWNLOADS_FLUSH_EVENTS = 50    # или запись после стольких скачиваний
+
+# Скачивания (user_id, item_id, vip_item), еще не записанные в users.db
+_downloads_pending = []
+_downloads_lock = threading.Lock()
+
+def queue_download(user_id: int, item_id: int = 0, vip_item: bool = False):
+    """Ставит скачивание в очередь; возвращает True, если пора записать пачку"""
+    with _downloads_lock:
+        _downloads_pending.append((user_id, item_id, vip_item))
+        return len(_downloads_pending) >= DOWNLOADS_FLUSH_EVENTS
+
+def take_pending_downloads():
+    global _downloads_pending
+    with _downloads_lock:
+        pending, _downloads_pending = _downloads_pending, []
+    return pending
+
+def requeue_downloads(events):
+    with _downloads_lock:
+        _downloads_pending[:0] = events
+
+def flush_downloads():
+    """Синхронная запись очереди скачиваний (при остановке бота)"""
+    pending = take_pending_downloads()
+    if pending and not record_downloads(pending):
+        requeue_downloads(pending)
+    return len(pending)
+
+async def flush_downloads_async():
+    pending = take_pending_downloads()
+    if pending and not await record_downloads_async(pending):
+        # Неудачную пачку вернем в очередь, чтобы записать при следующем сбросе
+        requeue_downloads(pending)
+    return len(pending)
+
+async def downloads_flush_loop():
+    while True:
+        await asyncio.sleep(DOWNLOADS_FLUSH_INTERVAL)
+        await flush_downloads_async()
+
+async def register_download(user_id: int, item_id: int, vip_item: bool):
+    if queue_download(user_id, item_id, vip_item):
+        await flush_downloads_async()
+
+LAST_ACTIVE_FLUSH_INTERVAL = 60   # секунд между пакетными обновлениями last_active
+
+# Пользователи, чей last_active нужно обновить при следующем сбросе
+_last_active_pending = set()
+_last_active_lock = threading.Lock()
+
+def touch_last_active(user_id: int):
+    with _last_active_lock:
+        _last_active_pending.add(user_id)
+
+def flush_last_active():
+    """Одним UPDATE-пакетом проставляет last_active накопленным пользователям"""
+    global _last_active_pending
+    with _last_active_lock:
+        pending, _last_active_pending = _last_active_pending, set()
+    if not pending:
+        return 0
+    try:
+        with db_connection(USERS_DB_PATH) as conn:
+            conn.executemany('UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE user_id = ?', [(user_id,) for user_id in pending])
+        return len(pending)
+    except Exception as e:
+        logger.error(f"Ошибка обновления last_active: {e}")
+        with _last_active_lock:
+            _last_active_pending.update(pending)
+        return 0
+
+async def last_active_flush_loop():
+    while True:
+        await asyncio.sleep(LAST_ACTIVE_FLUSH_INTERVAL)
+        await run_db(USERS_DB_PATH, flush_last_active)
 
 def save_user(message: Message):
+    """Регистрирует пользователя; профиль перезаписывается только если username/имя изменились"""
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        user_id = message.from_user.id
-        username = message.from_user.username
-        first_name = message.from_user.first_name
-        last_name = message.from_user.last_name
-        cur.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
-        exists = cur.fetchone()
-        if not exists:
-            referrer_id = None
-            if message.text and message.text.startswith('/start ref_'):
-                try:
-                    referrer_id = int(message.text.replace('/start ref_', ''))
-                    if referrer_id == user_id:
-                        referrer_id = None
-                except:
-                    pass
-            cur.execute('INSERT INTO users (user_id, username, first_name, last_name, last_active) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)', (user_id, username, first_name, last_name))
-        else:
-            cur.execute('UPDATE users SET username=?, first_name=?, last_name=?, last_active=CURRENT_TIMESTAMP WHERE user_id=?', (username, first_name, last_name, user_id))
-        conn.commit()
-        conn.close()
+        user = message.from_user
+        with db_connection(USERS_DB_PATH) as conn:
+            conn.execute('''
+                INSERT INTO users (user_id, username, first_name, last_name, last_active) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, first_name = excluded.first_name, last_name = excluded.last_name
+                WHERE username IS NOT excluded.username OR first_name IS NOT excluded.first_name OR last_name IS NOT excluded.last_name
+            ''', (user.id, user.username, user.first_name, user.last_name))
+        touch_last_active(user.id)
     except Exception as e:
         logger.error(f"Ошибка сохранения пользователя {message.from_user.id}: {e}")
 
+# ========== KEYSET-ПАГИНАЦИЯ ==========
+
+def keyset_clause(cursor, columns):
+    """Условие и порядок для постраничного вывода по убыванию columns без OFFSET.
+    cursor: None - первая страница, ('a', ключ) - строки после ключа, ('b', ключ) - строки перед ключом"""
+    names = ", ".join(columns)
+    desc = ", ".join(f"{col} DESC" for col in columns)
+    if not cursor or len(cursor[1]) != len(columns):
+        return "", desc, (), False
+    direction, key = cursor
+    marks = ", ".join("?" * len(columns))
+    if direction == "b":
+        # Идем назад по возрастанию, потом разворачиваем строки
+        return f" AND ({names}) > ({marks})", ", ".join(f"{col} ASC" for col in columns), tuple(key), True
+    return f" AND ({names}) < ({marks})", desc, tuple(key), False
+
+def fetch_page(cur, fields, source, params, count_where, count_params, order, limit, offset, reverse=False, count_from=None):
+    """Строки страницы и общее количество за один запрос.
+    Количество считается некоррелированным подзапросом (вычисляется один раз) и приходит последней колонкой;
+    COUNT(*) OVER () здесь не подходит - с keyset-условием он посчитал бы только строки после курсора"""
+    table = count_from or source.split()[0]
+    rows = cur.execute(
+        f'SELECT {fields}, (SELECT COUNT(*) FROM {table} WHERE {count_where}) FROM {source} ORDER BY {order} LIMIT ? OFFSET ?',
+        (*count_params, *params, limit, offset)
+    ).fetchall()
+    if not rows:
+        # Пустая страница: отдельный COUNT, чтобы отличить пустой список от страницы за концом списка
+        return [], cur.execute(f'SELECT COUNT(*) FROM {table} WHERE {count_where}', count_params).fetchone()[0]
+    if reverse:
+        rows.reverse()
+    return [row[:-1] for row in rows], rows[0][-1]
+
 def get_item(table: str, item_id: int, use_temp: bool = False):
-    """Получает элемент из указанной таблицы (из основной или временной БД)"""
+    """Получает элемент из указанной таблицы (с use_temp - с наложенным журналом правок) записью Client/ResourcePack/Config"""
     try:
-        db_path = TEMP_DB_PATH if use_temp and TEMP_DB_PATH.exists() else DB_PATH
-        conn = sqlite3.connect(str(db_path))
-        cur = conn.cursor()
-        cur.execute(f'SELECT * FROM {table} WHERE id = ?', (item_id,))
-        item = cur.fetchone()
-        conn.close()
-        if item:
-            item_list = list(item)
-            for i in range(len(item_list)):
-                if isinstance(item_list[i], (int, float, str)) and str(item_list[i]).isdigit():
-                    item_list[i] = int(item_list[i])
-            return tuple(item_list)
-        return item
+        record_type = RECORD_TYPES.get(table)
+        if record_type is None:
+            return None
+        if not use_temp and _catalog is not None:
+            return catalog_item(_catalog, table, item_id)
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            source = staged_source(cur, table) if use_temp else table
+            cur.row_factory = record_type.from_row
+            return cur.execute(f'SELECT {record_type.select()} FROM {source} AS t WHERE id = ?', (item_id,)).fetchone()
     except Exception as e:
         logger.error(f"Ошибка получения элемента {table} {item_id}: {e}")
         return None
 
-def get_all_items_paginated(table: str, page: int = 1, per_page: int = 10, vip_filter: str = "all", use_temp: bool = False):
-    """Получает элементы с пагинацией из основной или временной БД"""
+def get_item_media(table: str, item_id: int, use_temp: bool = False):
+    """Медиа элемента списком [{'type', 'id'}] по порядку; None, если элемента нет"""
     try:
-        db_path = TEMP_DB_PATH if use_temp and TEMP_DB_PATH.exists() else DB_PATH
-        conn = sqlite3.connect(str(db_path))
-        cur = conn.cursor()
-        offset = (page - 1) * per_page
-        
-        cur.execute(f"PRAGMA table_info({table})")
-        columns = [col[1] for col in cur.fetchall()]
-        has_vip = 'is_vip' in columns
-        
-        # Сначала получаем общее количество
-        if vip_filter == "vip" and has_vip:
-            cur.execute(f'SELECT COUNT(*) FROM {table} WHERE is_vip = 1')
-        elif vip_filter == "regular" and has_vip:
-            cur.execute(f'SELECT COUNT(*) FROM {table} WHERE is_vip = 0')
-        else:
-            cur.execute(f'SELECT COUNT(*) FROM {table}')
-        total = cur.fetchone()[0]
+        if table not in RECORD_TYPES:
+            return None
+        if not use_temp and _catalog is not None:
+            if item_id not in _catalog['tables'][table][1]:
+                return None
+            return [{'type': media_type, 'id': file_id} for media_type, file_id in _catalog['media'].get((table, item_id), ())]
+        with db_connection(DB_PATH) as conn:
+            if use_temp:
+                op, staged = _staged_entry(conn.cursor(), table, item_id)
+                if op == 'delete':
+                    return None
+                if 'media' in staged:
+                    return json.loads(staged['media'])
+                if op == 'insert':
+                    return []
+            if not conn.execute(f'SELECT 1 FROM {table} WHERE id = ?', (item_id,)).fetchone():
+                return None
+            rows = conn.execute('SELECT type, file_id FROM media WHERE item_table = ? AND item_id = ? ORDER BY position', (table, item_id)).fetchall()
+            return [{'type': media_type, 'id': file_id} for media_type, file_id in rows]
+    except Exception as e:
+        logger.error(f"Ошибка получения медиа {table} {item_id}: {e}")
+        return None
+
+def get_all_items_paginated(table: str, page: int = 1, per_page: int = 10, vip_filter: str = "all", use_temp: bool = False, cursor=None):
+    """Получает элементы с пагинацией из основной БД, с use_temp - с наложенным журналом правок"""
+    try:
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            # С курсором страница ищется по индексу, OFFSET остается только для старых кнопок
+            offset = 0 if cursor else (page - 1) * per_page
         
-        # Формируем запрос в зависимости от таблицы
-        if table == "clients":
-            if has_vip:
-                if vip_filter == "vip":
-                    cur.execute('SELECT id, name, full_desc, media, downloads, version, is_vip FROM clients WHERE is_vip = 1 ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
-                elif vip_filter == "regular":
-                    cur.execute('SELECT id, name, full_desc, media, downloads, version, is_vip FROM clients WHERE is_vip = 0 ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
-                else:
-                    cur.execute('SELECT id, name, full_desc, media, downloads, version, is_vip FROM clients ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
-            else:
-                cur.execute('SELECT id, name, full_desc, media, downloads, version, 0 as is_vip FROM clients ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
+            columns = get_table_columns(DB_PATH, table)
+            has_vip = 'is_vip' in columns
+            vip_col = 'is_vip' if has_vip else '0 as is_vip'
         
-        elif table == "resourcepacks":
-            if has_vip:
-                if vip_filter == "vip":
-                    cur.execute('SELECT id, name, full_desc, media, downloads, version, is_vip FROM resourcepacks WHERE is_vip = 1 ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
-                elif vip_filter == "regular":
-                    cur.execute('SELECT id, name, full_desc, media, downloads, version, is_vip FROM resourcepacks WHERE is_vip = 0 ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
-                else:
-                    cur.execute('SELECT id, name, full_desc, media, downloads, version, is_vip FROM resourcepacks ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
+            if vip_filter == "vip" and has_vip:
+                where = 'is_vip = 1'
+            elif vip_filter == "regular" and has_vip:
+                where = 'is_vip = 0'
             else:
-                cur.execute('SELECT id, name, full_desc, media, downloads, version, 0 as is_vip FROM resourcepacks ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
+                where = '1'
         
-        elif table == "configs":
-            if has_vip:
-                if vip_filter == "vip":
-                    cur.execute('SELECT id, client_name, client_version, name, full_desc, media, downloads, is_vip FROM configs WHERE is_vip = 1 ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
-                elif vip_filter == "regular":
-                    cur.execute('SELECT id, client_name, client_version, name, full_desc, media, downloads, is_vip FROM configs WHERE is_vip = 0 ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
-                else:
-                    cur.execute('SELECT id, client_name, client_version, name, full_desc, media, downloads, is_vip FROM configs ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
+            # Формируем запрос в зависимости от таблицы
+            if table == "configs":
+                fields = f'id, client_name, client_version, name, media_count, downloads, {vip_col}'
             else:
-                cur.execute('SELECT id, client_name, client_version, name, full_desc, media, downloads, 0 as is_vip FROM configs ORDER BY id DESC LIMIT ? OFFSET ?', (per_page, offset))
+                fields = f'id, name, media_count, downloads, version, {vip_col}'
+            keyset, order, keyset_params, reverse = keyset_clause(cursor, ("id",))
+            source = staged_source(cur, table) if use_temp else table
+            items, total = fetch_page(cur, fields, f'{source} AS t WHERE {where}{keyset}', keyset_params,
+                                      where, (), order, per_page, offset, reverse, count_from=f'{source} AS t')
         
-        items = cur.fetchall()
+            # Конвертируем значения в правильные типы
+            vip_index = len(items[0]) - 1 if items else 0
+            converted_items = []
+            for item in items:
+                item_list = list(item)
+                if item_list[vip_index] is not None:
+                    try:
+                        item_list[vip_index] = int(item_list[vip_index])
+                    except (ValueError, TypeError):
+                        item_list[vip_index] = 0
+                converted_items.append(tuple(item_list))
         
-        # Конвертируем значения в правильные типы
-        converted_items = []
-        for item in items:
-            item_list = list(item)
-            if len(item_list) > 6 and item_list[6] is not None:
-                try:
-                    item_list[6] = int(item_list[6])
-                except (ValueError, TypeError):
-                    item_list[6] = 0
-            converted_items.append(tuple(item_list))
-        
-        conn.close()
         
-        db_type = "временной" if use_temp else "основной"
-        logger.info(f"📊 {table}: найдено {len(items)} элементов из {total} (страница {page}) в {db_type} БД")
+            db_type = "с правками" if use_temp else "основная БД"
+            logger.info(f"📊 {table}: найдено {len(items)} элементов из {total} (страница {page}), {db_type}")
         
-        return converted_items, total
+            return converted_items, total
         
     except Exception as e:
         logger.error(f"Ошибка получения элементов {table}: {e}")
         return [], 0
 
 def delete_item_from_temp(table: str, item_id: int):
-    """Удаляет элемент из временной БД"""
+    """Помечает элемент удаленным в журнале правок"""
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return False
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        cur.execute(f'DELETE FROM {table} WHERE id = ?', (item_id,))
-        conn.commit()
-        conn.close()
-        logger.info(f"✅ Элемент ID {item_id} удален из временной БД (таблица {table})")
-        return True
+        with db_connection(DB_PATH) as conn:
+            if not stage_delete(conn.cursor(), table, item_id):
+                return False
+            logger.info(f"✅ Элемент ID {item_id} помечен удаленным (таблица {table})")
+            return True
     except Exception as e:
-        logger.error(f"❌ Ошибка удаления элемента из временной БД: {e}")
+        logger.error(f"❌ Ошибка удаления элемента: {e}")
         return False
 
 def update_item_in_temp(table: str, item_id: int, field: str, value):
-    """Обновляет поле элемента во временной БД"""
+    """Записывает новое значение поля элемента в журнал правок"""
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
+        if field not in get_table_columns(DB_PATH, table):
+            logger.error(f"❌ Нет поля {field} в таблице {table}")
             return False
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        cur.execute(f'UPDATE {table} SET {field} = ? WHERE id = ?', (value, item_id))
-        conn.commit()
-        conn.close()
-        logger.info(f"✅ Поле {field} элемента ID {item_id} обновлено во временной БД")
-        return True
+        with db_connection(DB_PATH) as conn:
+            if not stage_update(conn.cursor(), table, item_id, {field: value}):
+                return False
+            logger.info(f"✅ Поле {field} элемента ID {item_id} изменено в журнале")
+            return True
     except Exception as e:
-        logger.error(f"❌ Ошибка обновления элемента во временной БД: {e}")
+        logger.error(f"❌ Ошибка обновления элемента: {e}")
         return False
 
 def toggle_vip_in_temp(table: str, item_id: int):
-    """Переключает VIP статус элемента во временной БД"""
+    """Переключает VIP статус элемента в журнале правок"""
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return False
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        
-        # Проверяем наличие колонки is_vip
-        cur.execute(f"PRAGMA table_info({table})")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'is_vip' not in columns:
-            cur.execute(f"ALTER TABLE {table} ADD COLUMN is_vip INTEGER DEFAULT 0")
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
         
-        cur.execute(f'SELECT is_vip FROM {table} WHERE id = ?', (item_id,))
-        result = cur.fetchone()
-        if result:
-            new_status = 0 if result[0] == 1 else 1
-            cur.execute(f'UPDATE {table} SET is_vip = ? WHERE id = ?', (new_status, item_id))
-            conn.commit()
-            conn.close()
-            logger.info(f"✅ VIP статус элемента ID {item_id} переключен на {new_status} во временной БД")
-            return new_status == 1
-        conn.close()
-        return False
+            cur.execute(f'SELECT is_vip FROM {staged_source(cur, table)} AS t WHERE id = ?', (item_id,))
+            result = cur.fetchone()
+            if result:
+                new_status = 0 if result[0] == 1 else 1
+                stage_update(cur, table, item_id, {'is_vip': new_status})
+                logger.info(f"✅ VIP статус элемента ID {item_id} переключен на {new_status} в журнале")
+                return new_status == 1
+            return False
     except Exception as e:
-        logger.error(f"❌ Ошибка переключения VIP статуса во временной БД: {e}")
+        logger.error(f"❌ Ошибка переключения VIP статуса: {e}")
         return False
 
-def get_clients_by_version(version, page=1, per_page=10, user_id=None):
+def get_clients_by_version(version, page=1, per_page=10, user_id=None, cursor=None):
+    catalog = _catalog
+    if catalog is not None:
+        return catalog_clients_by_version(catalog, version, page, per_page, cursor)
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        offset = (page - 1) * per_page
-        is_admin = (user_id == ADMIN_ID)
-        
-        search_version = version.strip()
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            offset = 0 if cursor else (page - 1) * per_page
+            is_admin = (user_id == ADMIN_ID)
         
-        logger.info(f"🔍 Поиск клиентов по версии: '{search_version}'")
+            search_version = version.strip()
         
-        cur.execute("PRAGMA table_info(clients)")
-        columns = [col[1] for col in cur.fetchall()]
-        has_vip = 'is_vip' in columns
+            logger.info(f"🔍 Поиск клиентов по версии: '{search_version}'")
         
-        if has_vip:
-            cur.execute('SELECT id, name, full_desc, media, downloads, version, is_vip FROM clients WHERE version = ? ORDER BY id DESC LIMIT ? OFFSET ?', 
-                       (search_version, per_page, offset))
-        else:
-            cur.execute('SELECT id, name, full_desc, media, downloads, version, 0 as is_vip FROM clients WHERE version = ? ORDER BY id DESC LIMIT ? OFFSET ?', 
-                       (search_version, per_page, offset))
+            columns = get_table_columns(DB_PATH, "clients")
+            has_vip = 'is_vip' in columns
         
-        items = cur.fetchall()
+            vip_col = 'is_vip' if has_vip else '0 as is_vip'
+            keyset, order, keyset_params, reverse = keyset_clause(cursor, ("id",))
+            where, where_params = sql_version_filter(cur, "clients", search_version)
+            items, total = fetch_page(cur, f'id, name, media_count, downloads, version, {vip_col}',
+                                      f'clients WHERE {where}{keyset}', (*where_params, *keyset_params),
+                                      where, where_params, order, per_page, offset, reverse)
         
-        cur.execute('SELECT COUNT(*) FROM clients WHERE version = ?', (search_version,))
-        total = cur.fetchone()[0]
+            logger.info(f"📊 Найдено клиентов: {len(items)} из {total}")
         
-        logger.info(f"📊 Найдено клиентов: {len(items)} из {total}")
+            if total == 0 and version_range_prefix(search_version) is None:
+                # Точного совпадения нет - ищем без учета регистра по индексу idx_clients_version_nocase_list
+                items, total = fetch_page(cur, f'id, name, media_count, downloads, version, {vip_col}',
+                                          f'clients WHERE version = ? COLLATE NOCASE{keyset}', (search_version, *keyset_params),
+                                          'version = ? COLLATE NOCASE', (search_version,), order, per_page, offset, reverse)
+                if items:
+                    logger.info(f"✅ Найдено без учета регистра: {total}")
         
-        if len(items) == 0:
-            cur.execute("SELECT id, name, version FROM clients WHERE LOWER(version) = LOWER(?)", (search_version,))
-            alternative = cur.fetchall()
-            if alternative:
-                logger.info(f"✅ Найдено по LOWER совпадению: {alternative}")
-                ids = [str(a[0]) for a in alternative]
-                if has_vip:
-                    cur.execute(f'SELECT id, name, full_desc, media, downloads, version, is_vip FROM clients WHERE id IN ({",".join(ids)}) ORDER BY id DESC')
-                else:
-                    cur.execute(f'SELECT id, name, full_desc, media, downloads, version, 0 as is_vip FROM clients WHERE id IN ({",".join(ids)}) ORDER BY id DESC')
-                items = cur.fetchall()
-                total = len(items)
+            converted_items = []
+            for item in items:
+                item_list = list(item)
+                if item_list[3] is not None:
+                    try:
+                        item_list[3] = int(item_list[3])
+                    except:
+                        item_list[3] = 0
+                converted_items.append(tuple(item_list))
         
-        converted_items = []
-        for item in items:
-            item_list = list(item)
-            if len(item_list) > 4 and item_list[4] is not None:
-                try:
-                    item_list[4] = int(item_list[4])
-                except:
-                    item_list[4] = 0
-            converted_items.append(tuple(item_list))
-        
-        conn.close()
-        return converted_items, total
+            return converted_items, total
     except Exception as e:
         logger.error(f"Ошибка получения клиентов по версии {version}: {e}")
         return [], 0
 
 def get_all_client_versions(user_id=None):
+    if _catalog is not None:
+        return list(_catalog['client_versions'])
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
         
-        cur.execute('SELECT DISTINCT version FROM clients WHERE version IS NOT NULL AND version != ""')
-        versions = []
-        for v in cur.fetchall():
-            clean_version = v[0].strip()
-            if clean_version and clean_version not in versions:
-                versions.append(clean_version)
-        
-        if not versions:
-            logger.warning("⚠️ Нет версий в БД")
+            cur.execute('SELECT DISTINCT version FROM clients WHERE version IS NOT NULL AND version != ""')
             versions = []
-        else:
-            versions.sort(reverse=True)
+            for v in cur.fetchall():
+                clean_version = v[0].strip()
+                if clean_version and clean_version not in versions:
+                    versions.append(clean_version)
         
-        logger.info(f"📋 Найденные версии клиентов: {versions}")
-        conn.close()
-        return versions
+            if not versions:
+                logger.warning("⚠️ Нет версий в БД")
+                versions = []
+            else:
+                versions = sort_versions(versions)
+        
+            logger.info(f"📋 Найденные версии клиентов: {versions}")
+            return versions
     except Exception as e:
         logger.error(f"Ошибка получения версий клиентов: {e}")
         return []
 
-def get_packs_by_version(version, page=1, per_page=10, user_id=None):
+def get_packs_by_version(version, page=1, per_page=10, user_id=None, cursor=None):
+    catalog = _catalog
+    if catalog is not None:
+        return catalog_packs_by_version(catalog, version, page, per_page, cursor)
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        offset = (page - 1) * per_page
-        is_admin = (user_id == ADMIN_ID)
-        cur.execute("PRAGMA table_info(resourcepacks)")
-        columns = [col[1] for col in cur.fetchall()]
-        has_vip = 'is_vip' in columns
-        search_version = version.strip()
-        if has_vip:
-            if is_admin:
-                cur.execute('SELECT id, name, full_desc, media, downloads, likes, views, version, author, is_vip FROM resourcepacks WHERE version = ? ORDER BY downloads DESC LIMIT ? OFFSET ?', (search_version, per_page, offset))
-                total = cur.execute('SELECT COUNT(*) FROM resourcepacks WHERE version = ?', (search_version,)).fetchone()[0]
-            else:
-                cur.execute('SELECT id, name, full_desc, media, downloads, likes, views, version, author, is_vip FROM resourcepacks WHERE version = ? ORDER BY downloads DESC LIMIT ? OFFSET ?', (search_version, per_page, offset))
-                total = cur.execute('SELECT COUNT(*) FROM resourcepacks WHERE version = ?', (search_version,)).fetchone()[0]
-        else:
-            cur.execute('SELECT id, name, full_desc, media, downloads, likes, views, version, author, 0 as is_vip FROM resourcepacks WHERE version = ? ORDER BY downloads DESC LIMIT ? OFFSET ?', (search_version, per_page, offset))
-            total = cur.execute('SELECT COUNT(*) FROM resourcepacks WHERE version = ?', (search_version,)).fetchone()[0]
-        items = cur.fetchall()
-        converted_items = []
-        for item in items:
-            item_list = list(item)
-            if len(item_list) > 4 and item_list[4] is not None:
-                try:
-                    item_list[4] = int(item_list[4])
-                except:
-                    item_list[4] = 0
-            if len(item_list) > 5 and item_list[5] is not None:
-                try:
-                    item_list[5] = int(item_list[5])
-                except:
-                    item_list[5] = 0
-            if len(item_list) > 6 and item_list[6] is not None:
-                try:
-                    item_list[6] = int(item_list[6])
-                except:
-                    item_list[6] = 0
-            converted_items.append(tuple(item_list))
-        conn.close()
-        return converted_items, total
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            offset = 0 if cursor else (page - 1) * per_page
+            is_admin = (user_id == ADMIN_ID)
+            columns = get_table_columns(DB_PATH, "resourcepacks")
+            has_vip = 'is_vip' in columns
+            search_version = version.strip()
+            vip_col = 'is_vip' if has_vip else '0 as is_vip'
+            # id - второй ключ сортировки, чтобы курсор однозначно указывал на строку при равных downloads
+            keyset, order, keyset_params, reverse = keyset_clause(cursor, ("downloads", "id"))
+            where, where_params = sql_version_filter(cur, "resourcepacks", search_version)
+            items, total = fetch_page(cur, f'id, name, media_count, downloads, version, {vip_col}',
+                                      f'resourcepacks WHERE {where}{keyset}', (*where_params, *keyset_params),
+                                      where, where_params, order, per_page, offset, reverse)
+            converted_items = []
+            for item in items:
+                item_list = list(item)
+                if item_list[3] is not None:
+                    try:
+                        item_list[3] = int(item_list[3])
+                    except:
+                        item_list[3] = 0
+                converted_items.append(tuple(item_list))
+            return converted_items, total
     except Exception as e:
         logger.error(f"Ошибка получения ресурспаков по версии {version}: {e}")
         return [], 0
 
 def get_all_pack_versions(user_id=None):
+    if _catalog is not None:
+        return list(_catalog['pack_versions'])
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute('SELECT DISTINCT version FROM resourcepacks WHERE version IS NOT NULL AND version != "" ORDER BY version DESC')
-        versions = [v[0] for v in cur.fetchall()]
-        conn.close()
-        return versions
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT DISTINCT version FROM resourcepacks WHERE version IS NOT NULL AND version != ""')
+            versions = sort_versions(v[0] for v in cur.fetchall())
+            return versions
     except Exception as e:
         logger.error(f"Ошибка получения версий ресурспаков: {e}")
         return []
@@ -905,89 +2022,72 @@ def get_all_pack_versions(user_id=None):
 
 def get_all_config_clients():
     """Получает список уникальных клиентов, для которых есть конфиги"""
+    if _catalog is not None:
+        return list(_catalog['config_clients'])
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute('SELECT DISTINCT client_name FROM configs ORDER BY client_name')
-        clients = [row[0] for row in cur.fetchall()]
-        conn.close()
-        return clients
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT DISTINCT client_name FROM configs ORDER BY client_name')
+            clients = [row[0] for row in cur.fetchall()]
+            return clients
     except Exception as e:
         logger.error(f"Ошибка получения списка клиентов для конфигов: {e}")
         return []
 
 def get_config_versions_by_client(client_name: str):
     """Получает список версий для конкретного клиента"""
+    if _catalog is not None:
+        return list(_catalog['config_versions'].get(client_name, ()))
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute('SELECT DISTINCT client_version FROM configs WHERE client_name = ? ORDER BY client_version DESC', (client_name,))
-        versions = [row[0] for row in cur.fetchall()]
-        conn.close()
-        return versions
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT DISTINCT client_version FROM configs WHERE client_name = ?', (client_name,))
+            versions = sort_versions(row[0] for row in cur.fetchall())
+            return versions
     except Exception as e:
         logger.error(f"Ошибка получения версий конфигов для клиента {client_name}: {e}")
         return []
 
-def get_configs_by_client_and_version(client_name: str, version: str, page: int = 1, per_page: int = 10, user_id: int = None):
+def get_configs_by_client_and_version(client_name: str, version: str, page: int = 1, per_page: int = 10, user_id: int = None, cursor=None):
     """Получает конфиги для конкретного клиента и версии"""
+    catalog = _catalog
+    if catalog is not None:
+        return catalog_configs(catalog, client_name, version, page, per_page, cursor)
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        offset = (page - 1) * per_page
-        
-        cur.execute('''
-            SELECT id, client_name, client_version, name, full_desc, media, download_url, is_vip, downloads, views 
-            FROM configs 
-            WHERE client_name = ? AND client_version = ? 
-            ORDER BY id DESC LIMIT ? OFFSET ?
-        ''', (client_name, version, per_page, offset))
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            offset = 0 if cursor else (page - 1) * per_page
+            keyset, order, keyset_params, reverse = keyset_clause(cursor, ("id",))
         
-        items = cur.fetchall()
+            items, total = fetch_page(cur, 'id, client_name, client_version, name, media_count, downloads, is_vip',
+                                      f'configs WHERE client_name = ? AND client_version = ?{keyset}', (client_name, version, *keyset_params),
+                                      'client_name = ? AND client_version = ?', (client_name, version), order, per_page, offset, reverse)
         
-        cur.execute('SELECT COUNT(*) FROM configs WHERE client_name = ? AND client_version = ?', (client_name, version))
-        total = cur.fetchone()[0]
+            converted_items = []
+            for item in items:
+                item_list = list(item)
+                if item_list[5] is not None:
+                    try:
+                        item_list[5] = int(item_list[5])
+                    except:
+                        item_list[5] = 0
+                converted_items.append(tuple(item_list))
         
-        converted_items = []
-        for item in items:
-            item_list = list(item)
-            if len(item_list) > 8 and item_list[8] is not None:
-                try:
-                    item_list[8] = int(item_list[8])
-                except:
-                    item_list[8] = 0
-            converted_items.append(tuple(item_list))
-        
-        conn.close()
-        return converted_items, total
+            return converted_items, total
     except Exception as e:
         logger.error(f"Ошибка получения конфигов: {e}")
         return [], 0
 
 def add_config(client_name: str, client_version: str, name: str, full_desc: str, url: str, is_vip: int = 0, media: list = None):
-    """Добавляет конфиг во временную БД"""
+    """Добавляет конфиг в журнал правок"""
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return None
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        
-        if media is None:
-            media = []
-        media_json = json.dumps(media)
-        
-        cur.execute('''
-            INSERT INTO configs (client_name, client_version, name, full_desc, download_url, is_vip, media) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (client_name, client_version, name, full_desc, url, is_vip, media_json))
-        
-        conn.commit()
-        item_id = cur.lastrowid
-        conn.close()
-        logger.info(f"✅ Конфиг добавлен во временную БД: ID={item_id}, name={name}")
-        return item_id
+        with db_connection(DB_PATH) as conn:
+            item_id = stage_insert(conn.cursor(), "configs", {
+                'client_name': client_name, 'client_version': client_version, 'name': name, 'full_desc': full_desc,
+                'download_url': url, 'is_vip': is_vip, **media_fields(media)
+            })
+            logger.info(f"✅ Конфиг добавлен в журнал: ID={item_id}, name={name}")
+            return item_id
     except Exception as e:
         logger.error(f"❌ Ошибка добавления конфига: {e}")
         return None
@@ -997,59 +2097,28 @@ def update_config(item_id: int, field: str, value):
 
 def update_config_media(item_id: int, media_list: list):
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return False
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        if media_list is None:
-            media_list = []
-        media_json = json.dumps(media_list)
-        cur.execute('UPDATE configs SET media = ? WHERE id = ?', (media_json, item_id))
-        conn.commit()
-        conn.close()
-        return True
+        with db_connection(DB_PATH) as conn:
+            return stage_update(conn.cursor(), "configs", item_id, media_fields(media_list))
     except Exception as e:
         logger.error(f"❌ Ошибка обновления медиа конфига {item_id}: {e}")
         return False
 
 def add_client(name, full_desc, url, version, is_vip=0, media=None):
-    """Добавляет клиента во временную БД"""
+    """Добавляет клиента в журнал правок"""
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return None
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        
-        if media is None:
-            media = []
-        media_json = json.dumps(media)
-        
         if not version or version.strip() == "":
             version = "1.20"
         else:
             version = version.strip()
             version = version.rstrip('.')
         
-        cur.execute("PRAGMA table_info(clients)")
-        columns = [col[1] for col in cur.fetchall()]
-        
-        if 'is_vip' in columns:
-            cur.execute('INSERT INTO clients (name, full_desc, download_url, version, is_vip, media) VALUES (?, ?, ?, ?, ?, ?)', 
-                       (name, full_desc, url, version, is_vip, media_json))
-        else:
-            cur.execute('INSERT INTO clients (name, full_desc, download_url, version, media) VALUES (?, ?, ?, ?, ?)', 
-                       (name, full_desc, url, version, media_json))
-        
-        conn.commit()
-        item_id = cur.lastrowid
-        conn.close()
-        
-        logger.info(f"✅ Клиент добавлен во временную БД: ID={item_id}, name={name}, version='{version}'")
-        return item_id
+        with db_connection(DB_PATH) as conn:
+            item_id = stage_insert(conn.cursor(), "clients", {
+                'name': name, 'full_desc': full_desc, 'download_url': url, 'version': version,
+                'is_vip': is_vip, **media_fields(media)
+            })
+            logger.info(f"✅ Клиент добавлен в журнал: ID={item_id}, name={name}, version='{version}'")
+            return item_id
     except Exception as e:
         logger.error(f"❌ Ошибка добавления клиента: {e}")
         return None
@@ -1059,56 +2128,26 @@ def update_client(item_id, field, value):
 
 def update_client_media(item_id: int, media_list: list):
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return False
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        if media_list is None:
-            media_list = []
-        media_json = json.dumps(media_list)
-        cur.execute('UPDATE clients SET media = ? WHERE id = ?', (media_json, item_id))
-        conn.commit()
-        conn.close()
-        return True
+        with db_connection(DB_PATH) as conn:
+            return stage_update(conn.cursor(), "clients", item_id, media_fields(media_list))
     except Exception as e:
         logger.error(f"❌ Ошибка обновления медиа клиента {item_id}: {e}")
         return False
 
 def add_pack(name, full_desc, url, version, author, is_vip=0, media=None):
-    """Добавляет ресурспак во временную БД"""
+    """Добавляет ресурспак в журнал правок"""
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return None
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        
-        if media is None:
-            media = []
-        media_json = json.dumps(media)
-        
         if not version or version.strip() == "":
             version = "1.20"
         version = version.strip()
         
-        cur.execute("PRAGMA table_info(resourcepacks)")
-        columns = [col[1] for col in cur.fetchall()]
-        
-        if 'is_vip' in columns:
-            cur.execute('INSERT INTO resourcepacks (name, full_desc, download_url, version, author, is_vip, media) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                       (name, full_desc, url, version, author, is_vip, media_json))
-        else:
-            cur.execute('INSERT INTO resourcepacks (name, full_desc, download_url, version, author, media) VALUES (?, ?, ?, ?, ?, ?)', 
-                       (name, full_desc, url, version, author, media_json))
-        
-        conn.commit()
-        item_id = cur.lastrowid
-        conn.close()
-        logger.info(f"✅ Ресурспак добавлен во временную БД: ID={item_id}, name={name}")
-        return item_id
+        with db_connection(DB_PATH) as conn:
+            item_id = stage_insert(conn.cursor(), "resourcepacks", {
+                'name': name, 'full_desc': full_desc, 'download_url': url, 'version': version, 'author': author,
+                'is_vip': is_vip, **media_fields(media)
+            })
+            logger.info(f"✅ Ресурспак добавлен в журнал: ID={item_id}, name={name}")
+            return item_id
     except Exception as e:
         logger.error(f"❌ Ошибка добавления ресурспака: {e}")
         return None
@@ -1118,95 +2157,430 @@ def update_pack(item_id, field, value):
 
 def update_pack_media(item_id: int, media_list: list):
     try:
-        if not TEMP_DB_PATH.exists():
-            logger.error("Временная БД не существует")
-            return False
-            
-        conn = sqlite3.connect(str(TEMP_DB_PATH))
-        cur = conn.cursor()
-        if media_list is None:
-            media_list = []
-        media_json = json.dumps(media_list)
-        cur.execute('UPDATE resourcepacks SET media = ? WHERE id = ?', (media_json, item_id))
-        conn.commit()
-        conn.close()
-        return True
+        with db_connection(DB_PATH) as conn:
+            return stage_update(conn.cursor(), "resourcepacks", item_id, media_fields(media_list))
     except Exception as e:
         logger.error(f"❌ Ошибка обновления медиа ресурспака {item_id}: {e}")
         return False
 
 def toggle_favorite(user_id, pack_id):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        exists = cur.execute('SELECT 1 FROM favorites WHERE user_id = ? AND pack_id = ?', (user_id, pack_id)).fetchone()
-        if exists:
-            cur.execute('DELETE FROM favorites WHERE user_id = ? AND pack_id = ?', (user_id, pack_id))
-            cur.execute('UPDATE resourcepacks SET likes = likes - 1 WHERE id = ?', (pack_id,))
-            conn.commit()
-            conn.close()
-            return False
-        else:
-            cur.execute('INSERT INTO favorites (user_id, pack_id) VALUES (?, ?)', (user_id, pack_id))
-            cur.execute('UPDATE resourcepacks SET likes = likes + 1 WHERE id = ?', (pack_id,))
-            conn.commit()
-            conn.close()
-            return True
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            exists = cur.execute('SELECT 1 FROM favorites WHERE user_id = ? AND pack_id = ?', (user_id, pack_id)).fetchone()
+            if exists:
+                cur.execute('DELETE FROM favorites WHERE user_id = ? AND pack_id = ?', (user_id, pack_id))
+                cur.execute('UPDATE resourcepacks SET likes = likes - 1 WHERE id = ?', (pack_id,))
+                note_catalog_delta("resourcepacks", pack_id, likes=-1)
+                return False
+            else:
+                cur.execute('INSERT INTO favorites (user_id, pack_id) VALUES (?, ?)', (user_id, pack_id))
+                cur.execute('UPDATE resourcepacks SET likes = likes + 1 WHERE id = ?', (pack_id,))
+                note_catalog_delta("resourcepacks", pack_id, likes=1)
+                return True
     except Exception as e:
         logger.error(f"❌ Ошибка переключения избранного: {e}")
         return False
 
 def get_favorites(user_id):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(resourcepacks)")
-        columns = [col[1] for col in cur.fetchall()]
-        has_vip = 'is_vip' in columns
-        if has_vip:
-            cur.execute('SELECT r.id, r.name, r.full_desc, r.media, r.downloads, r.likes, r.is_vip FROM resourcepacks r JOIN favorites f ON r.id = f.pack_id WHERE f.user_id = ? ORDER BY f.added_at DESC', (user_id,))
-        else:
-            cur.execute('SELECT r.id, r.name, r.full_desc, r.media, r.downloads, r.likes, 0 as is_vip FROM resourcepacks r JOIN favorites f ON r.id = f.pack_id WHERE f.user_id = ? ORDER BY f.added_at DESC', (user_id,))
-        favs = cur.fetchall()
-        converted_favs = []
-        for fav in favs:
-            fav_list = list(fav)
-            if len(fav_list) > 4 and fav_list[4] is not None:
-                try:
-                    fav_list[4] = int(fav_list[4])
-                except:
-                    fav_list[4] = 0
-            if len(fav_list) > 5 and fav_list[5] is not None:
-                try:
-                    fav_list[5] = int(fav_list[5])
-                except:
-                    fav_list[5] = 0
-            converted_favs.append(tuple(fav_list))
-        conn.close()
-        return converted_favs
+        with db_connection(DB_PATH) as conn:
+            cur = conn.cursor()
+            columns = get_table_columns(DB_PATH, "resourcepacks")
+            has_vip = 'is_vip' in columns
+            if has_vip:
+                cur.execute('SELECT r.id, r.name, r.media_count, r.downloads, r.likes, r.is_vip FROM resourcepacks r JOIN favorites f ON r.id = f.pack_id WHERE f.user_id = ? ORDER BY f.added_at DESC', (user_id,))
+            else:
+                cur.execute('SELECT r.id, r.name, r.media_count, r.downloads, r.likes, 0 as is_vip FROM resourcepacks r JOIN favorites f ON r.id = f.pack_id WHERE f.user_id = ? ORDER BY f.added_at DESC', (user_id,))
+            favs = cur.fetchall()
+            converted_favs = []
+            for fav in favs:
+                fav_list = list(fav)
+                if fav_list[3] is not None:
+                    try:
+                        fav_list[3] = int(fav_list[3])
+                    except:
+                        fav_list[3] = 0
+                if fav_list[4] is not None:
+                    try:
+                        fav_list[4] = int(fav_list[4])
+                    except:
+                        fav_list[4] = 0
+                converted_favs.append(tuple(fav_list))
+            return converted_favs
     except Exception as e:
         logger.error(f"❌ Ошибка получения избранного: {e}")
         return []
 
-def increment_view(table, item_id):
+def is_favorite(user_id, pack_id):
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute(f'UPDATE {table} SET views = views + 1 WHERE id = ?', (item_id,))
-        conn.commit()
-        conn.close()
+        with db_connection(DB_PATH) as conn:
+            return conn.execute('SELECT 1 FROM favorites WHERE user_id = ? AND pack_id = ?', (user_id, pack_id)).fetchone() is not None
+    except Exception as e:
+        logger.error(f"❌ Ошибка проверки избранного: {e}")
+        return False
+
+def get_download_history(user_id, limit=10):
+    """Последние скачивания пользователя"""
+    try:
+        with db_connection(USERS_DB_PATH) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='downloads_log'")
+            if not cur.fetchone():
+                return []
+            return cur.execute('SELECT item_type, downloaded_at FROM downloads_log WHERE user_id = ? ORDER BY downloaded_at DESC LIMIT ?', (user_id, limit)).fetchall()
+    except Exception as e:
+        logger.error(f"Ошибка истории скачиваний для {user_id}: {e}")
+        return []
+
+def get_catalog_stats():
+    """Количество элементов каталога (всего и VIP) по таблицам"""
+    stats = {}
+    with db_connection(DB_PATH) as conn:
+        for table in ("clients", "resourcepacks", "configs"):
+            stats[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            if 'is_vip' in get_table_columns(DB_PATH, table):
+                stats[f"vip_{table}"] = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE is_vip = 1').fetchone()[0]
+            else:
+                stats[f"vip_{table}"] = 0
+    return stats
+
+# ========== БУФЕР СЧЕТЧИКОВ ==========
+
+COUNTER_FLUSH_INTERVAL = 30   # секунд между сбросами на диск
+COUNTER_FLUSH_EVENTS = 100    # или сброс после стольких событий
+
+# (таблица, id) -> [просмотры, скачивания], еще не записанные в БД
+_counter_buffer = {}
+_counter_events = 0
+_counter_lock = threading.RLock()
+
+def _buffer_counter(table, item_id, views=0, downloads=0):
+    global _counter_events
+    # Неизвестная таблица сломала бы весь пакетный сброс
+    if table not in ("clients", "resourcepacks", "configs"):
+        return
+    with _counter_lock:
+        counts = _counter_buffer.setdefault((table, item_id), [0, 0])
+        counts[0] += views
+        counts[1] += downloads
+        _counter_events += 1
+        note_catalog_delta(table, item_id, views=views, downloads=downloads)
+        flush_now = _counter_events >= COUNTER_FLUSH_EVENTS
+    if flush_now:
+        flush_counters()
+
+def flush_counters():
+    """Записывает накопленные просмотры и скачивания одной транзакцией"""
+    global _counter_buffer, _counter_events
+    with _counter_lock:
+        pending, _counter_buffer = _counter_buffer, {}
+        _counter_events = 0
+    if not pending:
+        return 0
+    try:
+        with db_connection(DB_PATH) as conn:
+            for (table, item_id), (views, downloads) in pending.items():
+                conn.execute(f'UPDATE {table} SET views = views + ?, downloads = downloads + ? WHERE id = ?', (views, downloads, item_id))
+        return len(pending)
     except Exception as e:
-        logger.error(f"❌ Ошибка увеличения просмотров: {e}")
+        logger.error(f"❌ Ошибка записи счетчиков: {e}")
+        # Возвращаем несохраненное в буфер, чтобы не потерять при следующем сбросе
+        with _counter_lock:
+            for key, (views, downloads) in pending.items():
+                counts = _counter_buffer.setdefault(key, [0, 0])
+                counts[0] += views
+                counts[1] += downloads
+        return 0
+
+async def counter_flush_loop():
+    """Фоновый сброс буфера счетчиков каждые COUNTER_FLUSH_INTERVAL секунд"""
+    while True:
+        await asyncio.sleep(COUNTER_FLUSH_INTERVAL)
+        await flush_counters_async()
+
+def increment_view(table, item_id):
+    _buffer_counter(table, item_id, views=1)
 
 def increment_download(table, item_id, vip_item=False):
+    _buffer_counter(table, item_id, downloads=1)
+
+# ========== ВЕРСИИ ==========
+
+def version_sort_key(version):
+    """Ключ сортировки версии: '1.20.4' -> ((1, 20, 4), 1, ''), '1.21-Pre' -> ((1, 21, 0), 0, '-pre').
+    Числа сравниваются как числа (1.9 < 1.20), релиз выше пре-релиза той же версии"""
+    text = (version or "").strip()
+    match = re.match(r'(\d+(?:\.\d+)*)(.*)', text)
+    if not match:
+        return ((), 0, text.lower())
+    numbers = tuple(int(n) for n in match.group(1).split("."))
+    numbers += (0,) * (3 - len(numbers))
+    suffix = match.group(2).strip().lower()
+    return (numbers, 0 if suffix else 1, suffix)
+
+def sort_versions(versions):
+    """Версии от новых к старым"""
+    return sorted(versions, key=lambda v: (version_sort_key(v), v), reverse=True)
+
+def version_range_prefix(version):
+    """'1.20.x' -> (1, 20); для обычной версии - None"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)*)\.[xX*]\s*', version or "")
+    if not match:
+        return None
+    return tuple(int(n) for n in match.group(1).split("."))
+
+def versions_in_range(versions, prefix):
+    """Все версии семейства prefix, например (1, 20) -> 1.20, 1.20.1, 1.20.4-pre..."""
+    return [v for v in versions if version_sort_key(v)[0][:len(prefix)] == prefix]
+
+def sql_version_filter(cur, table, version):
+    """Условие WHERE по версии для запросов мимо снимка; '1.20.x' раскрывается тем же versions_in_range, что и в снимке"""
+    prefix = version_range_prefix(version)
+    if prefix is None:
+        return 'version = ?', (version,)
+    versions = versions_in_range([v for (v,) in cur.execute(f'SELECT DISTINCT version FROM {table} WHERE version IS NOT NULL')], prefix)
+    if not versions:
+        return '0', ()
+    return f'version IN ({", ".join("?" * len(versions))})', tuple(versions)
+
+# ========== СНИМОК КАТАЛОГА ==========
+
+# Каталог меняется только при сохранении правок админки или восстановлении,
+# поэтому пользовательские списки и карточки читаются из неизменяемого снимка в памяти.
+# Снимок подменяется целиком одной ссылкой, номер поколения растет при каждой пересборке.
+CATALOG_TABLES = ("clients", "resourcepacks", "configs")
+CATALOG_COUNTERS = ("views", "downloads", "likes")
+
+_catalog = None
+_catalog_generation = 0
+# (таблица, id) -> {колонка: прирост} для счетчиков, изменившихся после сборки снимка
+_catalog_deltas = {}
+
+def note_catalog_delta(table, item_id, **deltas):
+    with _counter_lock:
+        entry = _catalog_deltas.setdefault((table, item_id), {})
+        for column, delta in deltas.items():
+            if delta:
+                entry[column] = entry.get(column, 0) + delta
+
+def build_catalog():
+    """Перечитывает каталог из clients.db и атомарно подменяет снимок"""
+    global _catalog
     try:
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute(f'UPDATE {table} SET downloads = downloads + 1 WHERE id = ?', (item_id,))
-        conn.commit()
-        conn.close()
+        return _build_catalog()
     except Exception as e:
-        logger.error(f"❌ Ошибка увеличения скачиваний: {e}")
+        # Устаревший снимок хуже его отсутствия: без снимка чтение идет напрямую из БД
+        _catalog = None
+        logger.error(f"❌ Ошибка сборки снимка каталога: {e}")
+        return None
+
+def _build_catalog():
+    global _catalog, _catalog_generation, _catalog_deltas
+    # Порядок блокировок как у toggle_favorite: сначала БД, потом счетчики
+    with db_lock(DB_PATH), _counter_lock:
+        flush_counters()
+        tables = {}
+        with db_connection(DB_PATH) as conn:
+            for table in CATALOG_TABLES:
+                record_type = RECORD_TYPES[table]
+                cur = conn.execute(f'SELECT {record_type.select()} FROM {table} ORDER BY id DESC')
+                columns = {field: i for i, field in enumerate(record_type.__slots__)}
+                tables[table] = (columns, {row[0]: row for row in cur})
+            media = {}
+            for item_table, item_id, media_type, file_id in conn.execute('SELECT item_table, item_id, type, file_id FROM media ORDER BY item_table, item_id, position'):
+                media.setdefault((item_table, item_id), []).append((media_type, file_id))
+        
+        clients_by_version = {}
+        clients_by_version_lower = {}
+        columns, rows = tables["clients"]
+        for item_id, row in rows.items():
+            version = (row[columns["version"]] or "").strip()
+            clients_by_version.setdefault(version, []).append(item_id)
+            clients_by_version_lower.setdefault(version.lower(), []).append(item_id)
+        
+        packs_by_version = {}
+        packs_by_version_lower = {}
+        columns, rows = tables["resourcepacks"]
+        for item_id, row in rows.items():
+            version = (row[columns["version"]] or "").strip()
+            packs_by_version.setdefault(version, []).append(item_id)
+            packs_by_version_lower.setdefault(version.lower(), []).append(item_id)
+        
+        configs_by_client = {}
+        columns, rows = tables["configs"]
+        for item_id, row in rows.items():
+            versions = configs_by_client.setdefault(row[columns["client_name"]], {})
+            versions.setdefault(row[columns["client_version"]], []).append(item_id)
+        
+        _catalog_generation += 1
+        _catalog = {
+            'generation': _catalog_generation,
+            'tables': tables,
+            'media': {key: tuple(items) for key, items in media.items()},
+            'clients_by_version': {k: tuple(v) for k, v in clients_by_version.items()},
+            'clients_by_version_lower': {k: tuple(v) for k, v in clients_by_version_lower.items()},
+            'packs_by_version': {k: tuple(v) for k, v in packs_by_version.items()},
+            'packs_by_version_lower': {k: tuple(v) for k, v in packs_by_version_lower.items()},
+            'configs_by_client': {c: {v: tuple(ids) for v, ids in vs.items()} for c, vs in configs_by_client.items()},
+            # Списки для меню: считаются один раз на снимок, до следующего изменения каталога
+            'client_versions': tuple(sort_versions(v for v in clients_by_version if v)),
+            'pack_versions': tuple(sort_versions(v for v in packs_by_version if v)),
+            'config_clients': tuple(sorted(configs_by_client, key=str.lower)),
+            'config_versions': {c: tuple(sort_versions(vs)) for c, vs in configs_by_client.items()},
+        }
+        # Несброшенные (после ошибки записи) счетчики еще не в БД - их оставляем приростом
+        _catalog_deltas = {key: {'views': v, 'downloads': d} for key, (v, d) in _counter_buffer.items()}
+    logger.info(f"📚 Снимок каталога #{_catalog_generation}: " + ", ".join(f"{t}: {len(tables[t][1])}" for t in CATALOG_TABLES))
+    return _catalog_generation
+
+def _catalog_row(catalog, table, item_id, fields):
+    """Строка снимка в виде кортежа полей с учетом приростов счетчиков"""
+    columns, rows = catalog['tables'][table]
+    row = rows[item_id]
+    delta = _catalog_deltas.get((table, item_id))
+    if not delta:
+        return tuple(row[columns[field]] for field in fields)
+    return tuple(row[columns[field]] + delta.get(field, 0) if field in CATALOG_COUNTERS else row[columns[field]] for field in fields)
+
+def catalog_item(catalog, table, item_id):
+    if table not in catalog['tables']:
+        return None
+    record_type = RECORD_TYPES[table]
+    if item_id not in catalog['tables'][table][1]:
+        return None
+    return record_type(*_catalog_row(catalog, table, item_id, record_type.__slots__))
+
+def _page_rows(rows, page, per_page, cursor, key):
+    """Страница из списка, отсортированного по убыванию key; курсор как в keyset_clause"""
+    if not cursor or (rows and len(cursor[1]) != len(key(rows[0]))):
+        start = (page - 1) * per_page
+        return rows[start:start + per_page]
+    direction, cursor_key = cursor
+    if direction == "b":
+        return [row for row in rows if key(row) > cursor_key][-per_page:]
+    return [row for row in rows if key(row) < cursor_key][:per_page]
+
+def _catalog_version_ids(catalog, kind, versions, version):
+    """id элементов версии: точное совпадение, затем без учета регистра, '1.20.x' - все версии семейства"""
+    search_version = version.strip()
+    prefix = version_range_prefix(search_version)
+    if prefix is not None:
+        ids = [i for v in versions_in_range(versions, prefix) for i in catalog[f'{kind}_by_version'][v]]
+        return sorted(ids, reverse=True)
+    ids = catalog[f'{kind}_by_version'].get(search_version)
+    if not ids:
+        ids = catalog[f'{kind}_by_version_lower'].get(search_version.lower(), ())
+    return ids
+
+def catalog_clients_by_version(catalog, version, page, per_page, cursor):
+    ids = _catalog_version_ids(catalog, 'clients', catalog['client_versions'], version)
+    fields = ('id', 'name', 'media_count', 'downloads', 'version', 'is_vip')
+    rows = [_catalog_row(catalog, "clients", item_id, fields) for item_id in ids]
+    return _page_rows(rows, page, per_page, cursor, lambda row: (row[0],)), len(rows)
+
+def catalog_packs_by_version(catalog, version, page, per_page, cursor):
+    ids = _catalog_version_ids(catalog, 'packs', catalog['pack_versions'], version)
+    fields = ('id', 'name', 'media_count', 'downloads', 'version', 'is_vip')
+    rows = [_catalog_row(catalog, "resourcepacks", item_id, fields) for item_id in ids]
+    # downloads живые (снимок + прирост), поэтому сортируем на каждый запрос; паков в версии немного
+    rows.sort(key=lambda row: (row[3], row[0]), reverse=True)
+    return _page_rows(rows, page, per_page, cursor, lambda row: (row[3], row[0])), len(rows)
+
+def catalog_configs(catalog, client_name, version, page, per_page, cursor):
+    ids = catalog['configs_by_client'].get(client_name, {}).get(version, ())
+    fields = ('id', 'client_name', 'client_version', 'name', 'media_count', 'downloads', 'is_vip')
+    rows = [_catalog_row(catalog, "configs", item_id, fields) for item_id in ids]
+    return _page_rows(rows, page, per_page, cursor, lambda row: (row[0],)), len(rows)
+
+# ========== АСИНХРОННЫЙ ДОСТУП К БД ==========
+
+# Для каждой БД свой поток: медленный запрос к одной базе не блокирует event loop и другие базы
+_db_executors = {}
+
+def _db_executor(db_path):
+    key = str(db_path)
+    executor = _db_executors.get(key)
+    if executor is None:
+        executor = _db_executors[key] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db_{Path(key).stem}")
+    return executor
+
+async def run_db(db_path, func, *args, **kwargs):
+    """Выполняет синхронную функцию работы с БД в потоке этой БД"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor(db_path), functools.partial(func, *args, **kwargs))
+
+def db_async(db_path, func):
+    """Создает awaitable-версию синхронного хелпера"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(db_path, func, *args, **kwargs)
+    return wrapper
+
+def shutdown_db_executors():
+    for executor in _db_executors.values():
+        executor.shutdown(wait=True)
+    _db_executors.clear()
+
+async def get_user_status_async(user_id: int):
+    # Попадание в кэш отдаем прямо из event loop, без перехода в поток БД
+    status = get_cached_user_status(user_id)
+    if status is not None:
+        return status
+    return await run_db(USERS_DB_PATH, get_user_status, user_id)
+
+async def get_item_async(table: str, item_id: int, use_temp: bool = False):
+    return await run_db(DB_PATH, get_item, table, item_id, use_temp)
+
+async def get_item_media_async(table: str, item_id: int, use_temp: bool = False):
+    return await run_db(DB_PATH, get_item_media, table, item_id, use_temp)
+
+async def get_all_items_paginated_async(table: str, page: int = 1, per_page: int = 10, vip_filter: str = "all", use_temp: bool = False, cursor=None):
+    return await run_db(DB_PATH, get_all_items_paginated, table, page, per_page, vip_filter, use_temp, cursor)
+
+# users.db
+get_users_count_async = db_async(USERS_DB_PATH, get_users_count)
+get_vip_users_count_async = db_async(USERS_DB_PATH, get_vip_users_count)
+get_all_users_async = db_async(USERS_DB_PATH, get_all_users)
+get_all_users_with_details_async = db_async(USERS_DB_PATH, get_all_users_with_details)
+set_user_vip_async = db_async(USERS_DB_PATH, set_user_vip)
+remove_user_vip_async = db_async(USERS_DB_PATH, remove_user_vip)
+record_downloads_async = db_async(USERS_DB_PATH, record_downloads)
+save_user_async = db_async(USERS_DB_PATH, save_user)
+get_download_history_async = db_async(USERS_DB_PATH, get_download_history)
+
+# clients.db
+check_all_clients_async = db_async(DB_PATH, check_all_clients)
+get_clients_by_version_async = db_async(DB_PATH, get_clients_by_version)
+get_all_client_versions_async = db_async(DB_PATH, get_all_client_versions)
+get_packs_by_version_async = db_async(DB_PATH, get_packs_by_version)
+get_all_pack_versions_async = db_async(DB_PATH, get_all_pack_versions)
+get_all_config_clients_async = db_async(DB_PATH, get_all_config_clients)
+get_config_versions_by_client_async = db_async(DB_PATH, get_config_versions_by_client)
+get_configs_by_client_and_version_async = db_async(DB_PATH, get_configs_by_client_and_version)
+toggle_favorite_async = db_async(DB_PATH, toggle_favorite)
+get_favorites_async = db_async(DB_PATH, get_favorites)
+is_favorite_async = db_async(DB_PATH, is_favorite)
+get_staged_diff_async = db_async(DB_PATH, get_staged_diff)
+get_catalog_stats_async = db_async(DB_PATH, get_catalog_stats)
+increment_view_async = db_async(DB_PATH, increment_view)
+increment_download_async = db_async(DB_PATH, increment_download)
+flush_counters_async = db_async(DB_PATH, flush_counters)
+apply_temp_db_changes_async = db_async(DB_PATH, apply_temp_db_changes)
+build_catalog_async = db_async(DB_PATH, build_catalog)
+
+# Журнал правок staged_changes в clients.db (админка)
+create_temp_db_async = db_async(DB_PATH, create_temp_db)
+cancel_temp_db_changes_async = db_async(DB_PATH, cancel_temp_db_changes)
+delete_item_from_temp_async = db_async(DB_PATH, delete_item_from_temp)
+update_item_in_temp_async = db_async(DB_PATH, update_item_in_temp)
+toggle_vip_in_temp_async = db_async(DB_PATH, toggle_vip_in_temp)
+add_config_async = db_async(DB_PATH, add_config)
+add_client_async = db_async(DB_PATH, add_client)
+add_pack_async = db_async(DB_PATH, add_pack)
+update_config_media_async = db_async(DB_PATH, update_config_media)
+update_client_media_async = db_async(DB_PATH, update_client_media)
+update_pack_media_async = db_async(DB_PATH, update_pack_media)
 
 def format_number(num):
     if num is None:
@@ -1295,43 +2669,52 @@ def get_version_keyboard(versions, category, user_id=None):
     buttons.append([InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_main")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def page_cursor(category, item):
+    """Ключ строки для курсора: downloads:id для ресурспаков пользователя, id для остальных списков"""
+    if category == "packs":
+        return f"{int(item[3] or 0)}:{item[0]}"
+    return str(item[0])
+
+def page_nav_data(prefix, category, page, items, forward):
+    """callback_data кнопки навигации: номер страницы + направление + ключ крайней строки"""
+    if forward:
+        return f"{prefix}{page}_a_{page_cursor(category, items[-1])}"
+    return f"{prefix}{page}_b_{page_cursor(category, items[0])}"
+
+def parse_page_data(data):
+    """'3' или '3_a_150:42' -> (3, курсор или None)"""
+    parts = data.split("_")
+    page = int(parts[0])
+    if len(parts) < 3:
+        return page, None
+    return page, (parts[1], tuple(int(p) for p in parts[2].split(":")))
+
 def get_items_keyboard(items, category, page, total_pages, show_vip=False):
+    key = ("list", category, show_vip, tuple(item[0] for item in items))
+    rows = cached_render(key, lambda: _build_item_rows(items, category, show_vip))
+    # Навигация не кэшируется: курсор ресурспаков содержит downloads, а он меняется с каждым скачиванием
+    nav_row = []
+    if page > 1: nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data(f"page_{category}_", category, page - 1, items, forward=False)))
+    nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
+    if page < total_pages: nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data(f"page_{category}_", category, page + 1, items, forward=True)))
+    return InlineKeyboardMarkup(inline_keyboard=[*rows, nav_row])
+
+def _build_item_rows(items, category, show_vip=False):
     buttons = []
     for item in items:
         if category == "configs":
-            if len(item) >= 8:
-                item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-            else:
-                item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-                client_name = name
-                client_version = version
-            try:
-                media_list = json.loads(media_json) if media_json else []
-            except:
-                media_list = []
-            preview = "🖼️" if media_list else "📄"
+            item_id, client_name, client_version, name, media_count, downloads, is_vip = item
+            preview = "🖼️" if media_count else "📄"
             vip_icon = "💎 " if is_vip and show_vip else ""
             button_text = f"{preview} {vip_icon}{name[:30]} (v{client_version})\n📥 {format_number(downloads)}"
             buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"detail_configs_{item_id}")])
         else:
-            item_id, name, full_desc, media_json, downloads = item[0], item[1], item[2], item[3], item[4]
-            version = item[5] if len(item) > 5 else "?"
-            is_vip = item[6] if len(item) > 6 else 0
-            try:
-                media_list = json.loads(media_json) if media_json else []
-            except:
-                media_list = []
-            preview = "🖼️" if media_list else "📄"
+            item_id, name, media_count, downloads, version, is_vip = item
+            preview = "🖼️" if media_count else "📄"
             vip_icon = "💎 " if is_vip and show_vip else ""
             button_text = f"{preview} {vip_icon}{name[:30]} ({version})\n📥 {format_number(downloads)}"
             buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"detail_{category}_{item_id}")])
-    
-    nav_row = []
-    if page > 1: nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"page_{category}_{page-1}"))
-    nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
-    if page < total_pages: nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"page_{category}_{page+1}"))
-    if nav_row: buttons.append(nav_row)
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
+    return tuple(buttons)
 
 def get_detail_keyboard(category, item_id, is_favorite=False, is_vip=False, user_is_vip=False, user_is_admin=False):
     buttons = []
@@ -1364,9 +2747,16 @@ def get_admin_main_keyboard():
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_db_management_keyboard():
+def get_db_management_keyboard(page=1, total_pages=1):
     """Клавиатура для управления БД"""
-    buttons = [
+    buttons = []
+    if total_pages > 1:
+        nav_row = []
+        if page > 1: nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"db_diff_page_{page - 1}"))
+        nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
+        if page < total_pages: nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"db_diff_page_{page + 1}"))
+        buttons.append(nav_row)
+    buttons += [
         [InlineKeyboardButton(text="✅ СОХРАНИТЬ БД", callback_data="save_edit_all")],
         [InlineKeyboardButton(text="❌ ОТМЕНИТЬ ВСЕ ИЗМЕНЕНИЯ", callback_data="cancel_edit_all")],
         [InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]
@@ -1378,17 +2768,12 @@ def get_admin_list_keyboard(items, category, page, total_pages, action):
     buttons = []
     for item in items:
         if category == "configs":
-            if len(item) >= 8:
-                item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-            else:
-                item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-                client_name = name
-                client_version = version
+            item_id, client_name, client_version, name, media_count, downloads, is_vip = item
             vip_icon = "💎 " if is_vip else ""
             button_text = f"{item_id}. {vip_icon}{name[:30]} ({client_name} v{client_version}) 📥 {downloads}"
             buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"{action}_{category}_{item_id}")])
         else:
-            item_id, name, full_desc, media_json, downloads, version, is_vip = item
+            item_id, name, media_count, downloads, version, is_vip = item
             vip_icon = "💎 " if is_vip else ""
             button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
             buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"{action}_{category}_{item_id}")])
@@ -1396,10 +2781,10 @@ def get_admin_list_keyboard(items, category, page, total_pages, action):
     # Навигация по страницам
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"list_page_{category}_{action}_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data(f"list_page_{category}_{action}_", category, page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"list_page_{category}_{action}_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data(f"list_page_{category}_{action}_", category, page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -1514,22 +2899,95 @@ def get_profile_keyboard():
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+# ========== КЭШ ОТРИСОВКИ ==========
+
+RENDER_CACHE_SIZE = 1000   # максимум закэшированных клавиатур и карточек
+RENDER_CACHE_TTL = 30      # секунд; за это время счетчики в тексте успевают устареть
+
+# ключ -> (время, результат); в ключ всегда входит поколение снимка каталога
+_render_cache = OrderedDict()
+_render_lock = threading.Lock()
+
+def cached_render(key, build):
+    """Отдает готовую разметку из кэша или строит ее через build().
+    Кэшируется только то, что построено из снимка каталога: новое поколение снимка - новые ключи"""
+    if _catalog is None:
+        return build()
+    key = (_catalog_generation,) + key
+    now = time.monotonic()
+    with _render_lock:
+        entry = _render_cache.get(key)
+        if entry is not None and now - entry[0] <= RENDER_CACHE_TTL:
+            _render_cache.move_to_end(key)
+            return entry[1]
+    value = build()
+    with _render_lock:
+        _render_cache[key] = (now, value)
+        _render_cache.move_to_end(key)
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return value
+
+def _viewer_tier(is_vip, is_admin):
+    return "admin" if is_admin else "vip" if is_vip else "user"
+
+def render_detail_card(category, item, is_fav, user_is_vip, user_is_admin):
+    """Текст, file_id обложки и клавиатура карточки клиента или ресурспака"""
+    vip_text = "💎 VIP\n\n" if item.is_vip else ""
+    if category == "clients":
+        text = f"🎮 {item.name}\n\n{vip_text}{item.full_desc}\n\nВерсия: {item.version}\n📥 Скачиваний: {format_number(item.downloads)}\n👁 Просмотров: {format_number(item.views)}"
+    else:
+        text = f"🎨 {item.name}\n\n{vip_text}{item.full_desc}\n\nАвтор: {item.author}\nВерсия: {item.version}\n📥 Скачиваний: {format_number(item.downloads)}\n❤️ В избранном: {format_number(item.likes)}\n👁 Просмотров: {format_number(item.views)}"
+    keyboard = get_detail_keyboard(category, item.id, is_fav if category == 'packs' else False, item.is_vip, user_is_vip, user_is_admin)
+    return text, item.cover_file_id, keyboard
+
+def render_config_card(item, user_is_vip, user_is_admin):
+    """Текст, file_id обложки и клавиатура карточки конфига"""
+    vip_text = "💎 VIP\n\n" if item.is_vip else ""
+    text = f"⚙️ {item.name}\n\nДля клиента: {item.client_name} (версия {item.client_version})\n\n{vip_text}{item.full_desc}\n\n📥 Скачиваний: {format_number(item.downloads)}\n👁 Просмотров: {format_number(item.views)}"
+    return text, item.cover_file_id, get_detail_keyboard("configs", item.id, False, item.is_vip, user_is_vip, user_is_admin)
+
 @dp.message(Command("check_db"))
 async def cmd_check_db(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
-    check_all_clients()
+    await check_all_clients_async()
     await message.answer("✅ Диагностика выполнена, проверь логи!")
 
+@dp.message(Command("restore_at"))
+async def cmd_restore_at(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    parts = message.text.split(maxsplit=2)
+    moment = None
+    if len(parts) == 3 and parts[1] in WAL_SHIPPED_DBS:
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+            try:
+                moment = datetime.strptime(parts[2].strip(), fmt)
+                break
+            except ValueError:
+                pass
+    if moment is None:
+        await message.answer("❌ Формат: /restore_at clients|users ГГГГ-ММ-ДД ЧЧ:ММ[:СС]")
+        return
+    name = parts[1]
+    await message.answer(f"⏳ Восстанавливаю {name}.db на {moment}...")
+    # Как и восстановление из бэкапа - в потоке бэкапов: сборка и перенос копии в хранилище не держат поток БД
+    applied = await run_backup_io(restore_db_at, name, moment)
+    if applied is None:
+        await message.answer(f"❌ Не удалось восстановить {name}.db на {moment} (нет бэкапа на этот момент или ошибка, смотри логи)")
+        return
+    await message.answer(f"✅ {name}.db восстановлена на {applied.strftime('%Y-%m-%d %H:%M:%S')}\nТекущая версия сохранена в папке бэкапов")
+
 @dp.message(Command("debug_admin"))
 async def debug_admin(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
     
-    items, total = get_all_items_paginated("clients", 1)
+    items, total = await get_all_items_paginated_async("clients", 1)
     text = f"📊 Всего клиентов: {total}\n\n"
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         text += f"ID: {item_id}, {name}, версия: {version}, загрузок: {downloads}, VIP: {is_vip}\n"
     
     await message.answer(text)
@@ -1537,10 +2995,10 @@ async def debug_admin(message: Message):
 @dp.message(CommandStart())
 async def cmd_start(message: Message):
     user_id = message.from_user.id
-    user_status = get_user_status(user_id)
+    user_status = await get_user_status_async(user_id)
     is_admin = (user_id == ADMIN_ID)
-    is_vip = user_status.get('is_vip', False)
-    save_user(message)
+    is_vip = user_status.is_vip
+    await save_user_async(message)
     welcome_text = "👋 Привет! Я бот-каталог Minecraft\n\n🎮 Клиенты - моды и сборки\n🎨 Ресурспаки - текстурпаки\n❤️ Избранное - сохраняй понравившееся\n⚙️ Конфиги - настройки для клиентов\n👤 Профиль - твой профиль\n💎 VIP - эксклюзивный контент\nℹ️ Инфо - о боте и создателе\n❓ Помощь - связаться с админом\n\n"
     if is_vip:
         welcome_text += "✨ У тебя есть VIP статус! Тебе доступен эксклюзивный контент.\n"
@@ -1550,7 +3008,7 @@ async def cmd_start(message: Message):
 @dp.message(F.text == "🎮 Клиенты")
 async def clients_menu(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    versions = get_all_client_versions(user_id)
+    versions = await get_all_client_versions_async(user_id)
     if not versions:
         await message.answer("📭 Пока нет клиентов")
         return
@@ -1560,7 +3018,7 @@ async def clients_menu(message: Message, state: FSMContext):
 async def clients_version_selected(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     version = callback.data.replace("ver_clients_", "")
-    items, total = get_clients_by_version(version, 1, user_id=user_id)
+    items, total = await get_clients_by_version_async(version, 1, user_id=user_id)
     if not items:
         await callback.message.edit_text(f"❌ Для версии {version} пока нет доступных клиентов", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_main")]]))
         await callback.answer()
@@ -1573,7 +3031,7 @@ async def clients_version_selected(callback: CallbackQuery, state: FSMContext):
 @dp.message(F.text == "🎨 Ресурспаки")
 async def packs_menu(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    versions = get_all_pack_versions(user_id)
+    versions = await get_all_pack_versions_async(user_id)
     if not versions:
         await message.answer("📭 Пока нет ресурспаков")
         return
@@ -1583,7 +3041,7 @@ async def packs_menu(message: Message, state: FSMContext):
 async def packs_version_selected(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     version = callback.data.replace("ver_packs_", "")
-    items, total = get_packs_by_version(version, 1, user_id=user_id)
+    items, total = await get_packs_by_version_async(version, 1, user_id=user_id)
     if not items:
         await callback.message.edit_text(f"❌ Для версии {version} пока нет доступных ресурспаков", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_main")]]))
         await callback.answer()
@@ -1598,7 +3056,7 @@ async def packs_version_selected(callback: CallbackQuery, state: FSMContext):
 @dp.message(F.text == "⚙️ Конфиги")
 async def configs_menu(message: Message, state: FSMContext):
     """Показывает список клиентов, для которых есть конфиги"""
-    clients = get_all_config_clients()
+    clients = await get_all_config_clients_async()
     if not clients:
         await message.answer("📭 Пока нет доступных конфигов")
         return
@@ -1614,7 +3072,7 @@ async def config_client_selected(callback: CallbackQuery, state: FSMContext):
     client_name = callback.data.replace("config_client_", "")
     
     # Получаем список версий для этого клиента
-    versions = get_config_versions_by_client(client_name)
+    versions = await get_config_versions_by_client_async(client_name)
     
     if not versions:
         await callback.message.edit_text(
@@ -1651,7 +3109,7 @@ async def config_version_selected(callback: CallbackQuery, state: FSMContext):
 @dp.callback_query(lambda c: c.data == "config_back_to_clients")
 async def config_back_to_clients(callback: CallbackQuery):
     """Возврат к списку клиентов"""
-    clients = get_all_config_clients()
+    clients = await get_all_config_clients_async()
     if not clients:
         await callback.message.edit_text("📭 Пока нет доступных конфигов")
         await callback.answer()
@@ -1667,7 +3125,7 @@ async def show_configs_for_client(message: Message, client_name: str, version: s
     """Показывает конфиги для конкретного клиента и версии"""
     user_id = message.chat.id
     
-    items, total = get_configs_by_client_and_version(client_name, version, 1, user_id=user_id)
+    items, total = await get_configs_by_client_and_version_async(client_name, version, 1, user_id=user_id)
     
     if not items:
         await message.edit_text(
@@ -1692,67 +3150,40 @@ async def config_detail_view(callback: CallbackQuery, state: FSMContext):
     item_id = int(callback.data.replace("detail_configs_", ""))
     user_id = callback.from_user.id
     
-    item = get_item("configs", item_id)
+    item = await get_item_async("configs", item_id)
     if not item:
         await callback.answer("❌ Конфиг не найден", show_alert=True)
         return
     
     is_admin = (user_id == ADMIN_ID)
-    user_status = get_user_status(user_id)
-    is_vip = user_status.get('is_vip', False)
-    
-    # Определяем структуру item в зависимости от количества полей
-    if len(item) >= 10:
-        # Новая структура: id, client_name, client_version, name, full_desc, media, download_url, is_vip, downloads, views
-        client_name = item[1]
-        client_version = item[2]
-        name = item[3]
-        full_desc = item[4]
-        media = item[5]
-        download_url = item[6]
-        item_is_vip = item[7] == 1
-        downloads = int(item[8]) if item[8] else 0
-        views = int(item[9]) if item[9] else 0
-    else:
-        # Старая структура для обратной совместимости
-        name = item[1]
-        full_desc = item[2]
-        media = item[3]
-        download_url = item[4]
-        client_version = item[5] if len(item) > 5 else "1.20.4"
-        item_is_vip = item[6] == 1 if len(item) > 6 else False
-        downloads = int(item[7]) if len(item) > 7 and item[7] else 0
-        views = int(item[8]) if len(item) > 8 and item[8] else 0
-        client_name = name
-    
-    try:
-        media_list = json.loads(media) if media else []
-    except:
-        media_list = []
+    user_status = await get_user_status_async(user_id)
+    is_vip = user_status.is_vip
     
-    vip_text = "💎 VIP\n\n" if item_is_vip else ""
-    text = f"⚙️ {name}\n\nДля клиента: {client_name} (версия {client_version})\n\n{vip_text}{full_desc}\n\n📥 Скачиваний: {format_number(downloads)}\n👁 Просмотров: {format_number(views)}"
+    text, cover, keyboard = cached_render(
+        ("detail", "configs", item_id, _viewer_tier(is_vip, is_admin)),
+        lambda: render_config_card(item, is_vip, is_admin)
+    )
     
-    increment_view("configs", item_id)
+    await increment_view_async("configs", item_id)
     
-    if media_list and media_list[0]['type'] == 'photo':
+    if cover:
         try:
             await callback.message.answer_photo(
-                photo=media_list[0]['id'], 
+                photo=cover, 
                 caption=text, 
-                reply_markup=get_detail_keyboard("configs", item_id, False, item_is_vip, is_vip, is_admin)
+                reply_markup=keyboard
             )
             await callback.message.delete()
         except Exception as e:
             logger.error(f"Ошибка отправки фото: {e}")
             await callback.message.edit_text(
                 text + "\n\n❌ Фото недоступно", 
-                reply_markup=get_detail_keyboard("configs", item_id, False, item_is_vip, is_vip, is_admin)
+                reply_markup=keyboard
             )
     else:
         await callback.message.edit_text(
             text, 
-            reply_markup=get_detail_keyboard("configs", item_id, False, item_is_vip, is_vip, is_admin)
+            reply_markup=keyboard
         )
     
     await callback.answer()
@@ -1762,7 +3193,7 @@ async def config_detail_view(callback: CallbackQuery, state: FSMContext):
 @dp.callback_query(lambda c: c.data.startswith("page_configs_"))
 async def config_pagination(callback: CallbackQuery, state: FSMContext):
     """Пагинация для списка конфигов"""
-    page = int(callback.data.replace("page_configs_", ""))
+    page, cursor = parse_page_data(callback.data.replace("page_configs_", ""))
     data = await state.get_data()
     
     client_name = data.get("config_client_name")
@@ -1773,7 +3204,7 @@ async def config_pagination(callback: CallbackQuery, state: FSMContext):
         await config_back_to_clients(callback)
         return
     
-    items, total = get_configs_by_client_and_version(client_name, version, page, user_id=user_id)
+    items, total = await get_configs_by_client_and_version_async(client_name, version, page, user_id=user_id, cursor=cursor)
     
     if total == 0:
         await callback.message.edit_text(f"⚙️ Нет конфигов для {client_name} версии {version}")
@@ -1804,7 +3235,7 @@ async def back_to_configs(callback: CallbackQuery, state: FSMContext):
         await config_back_to_clients(callback)
         return
     
-    items, total = get_configs_by_client_and_version(client_name, version, 1, user_id=user_id)
+    items, total = await get_configs_by_client_and_version_async(client_name, version, 1, user_id=user_id)
     
     if total == 0:
         await callback.message.edit_text(
@@ -1846,30 +3277,25 @@ async def download_config(callback: CallbackQuery):
     item_id = int(callback.data.replace("download_configs_", ""))
     user_id = callback.from_user.id
     
-    item = get_item("configs", item_id)
+    item = await get_item_async("configs", item_id)
     if not item:
         await callback.answer("❌ Конфиг не найден", show_alert=True)
         return
     
     is_admin = (user_id == ADMIN_ID)
-    user_status = get_user_status(user_id)
-    is_vip = user_status.get('is_vip', False)
+    user_status = await get_user_status_async(user_id)
+    is_vip = user_status.is_vip
     
-    if len(item) >= 10:
-        name = item[3]
-        download_url = item[6]
-        item_is_vip = item[7] == 1
-    else:
-        name = item[1]
-        download_url = item[4]
-        item_is_vip = item[6] == 1 if len(item) > 6 else False
+    name = item.name
+    download_url = item.download_url
+    item_is_vip = bool(item.is_vip)
     
     if item_is_vip and not is_vip and not is_admin:
         await callback.answer("💎 Это VIP контент! Получи VIP статус у админа", show_alert=True)
         return
     
-    increment_download("configs", item_id, item_is_vip)
-    increment_download_count(user_id, item_is_vip)
+    await increment_download_async("configs", item_id, item_is_vip)
+    await register_download(user_id, item_id, item_is_vip)
     
     vip_prefix = "💎 " if item_is_vip else ""
     await callback.message.answer(f"📥 Скачать {vip_prefix}{name}\n\n{download_url}")
@@ -1878,8 +3304,8 @@ async def download_config(callback: CallbackQuery):
 @dp.message(F.text == "💎 VIP")
 async def vip_menu(message: Message):
     user_id = message.from_user.id
-    user_status = get_user_status(user_id)
-    is_vip = user_status.get('is_vip', False)
+    user_status = await get_user_status_async(user_id)
+    is_vip = user_status.is_vip
     text = "💎 VIP раздел\n\n"
     if is_vip:
         text += "✅ У тебя есть VIP статус!\n\nТебе доступен эксклюзивный контент:\n• 💎 VIP клиенты\n• 💎 VIP ресурспаки\n• 💎 VIP конфиги\n\nПросто выбери нужную категорию в главном меню!"
@@ -1900,17 +3326,17 @@ async def show_profile(message: Message):
     try:
         user_id = message.from_user.id
         first_name = message.from_user.first_name or "пользователь"
-        status_data = get_user_status(user_id)
+        status_data = await get_user_status_async(user_id)
         if user_id == ADMIN_ID:
             status_text = "👑 СОЗДАТЕЛЬ"
-        elif status_data.get('is_vip', False):
+        elif status_data.is_vip:
             status_text = "💎 VIP"
         else:
             status_text = "👤 ПОЛЬЗОВАТЕЛЬ"
         bot_info = await bot.me()
         bot_username = bot_info.username
         ref_link = f"https://t.me/{bot_username}?start=ref_{user_id}"
-        text = f"👋 Привет, {first_name}!\n\nТвой профиль:\n• Статус: {status_text}\n• ID: {user_id}\n• Всего скачиваний: {status_data.get('downloads_total', 0)}\n• Приглашено друзей: {status_data.get('invites', 0)}\n\nТвоя реферальная ссылка:\n{ref_link}"
+        text = f"👋 Привет, {first_name}!\n\nТвой профиль:\n• Статус: {status_text}\n• ID: {user_id}\n• Всего скачиваний: {status_data.downloads_total}\n• Приглашено друзей: {status_data.invites}\n\nТвоя реферальная ссылка:\n{ref_link}"
         await message.answer(text, reply_markup=get_profile_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в профиле: {e}")
@@ -1920,14 +3346,7 @@ async def show_profile(message: Message):
 async def profile_history(callback: CallbackQuery):
     user_id = callback.from_user.id
     try:
-        conn = sqlite3.connect(str(USERS_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='downloads_log'")
-        if cur.fetchone():
-            downloads = cur.execute('SELECT item_type, downloaded_at FROM downloads_log WHERE user_id = ? ORDER BY downloaded_at DESC LIMIT 10', (user_id,)).fetchall()
-        else:
-            downloads = []
-        conn.close()
+        downloads = await get_download_history_async(user_id)
         if not downloads:
             text = "📭 История скачиваний пуста"
         else:
@@ -1947,14 +3366,14 @@ async def back_to_profile(callback: CallbackQuery):
 
 @dp.callback_query(lambda c: c.data.startswith("page_") and not c.data.startswith("page_configs_"))
 async def pagination(callback: CallbackQuery, state: FSMContext):
-    _, category, page = callback.data.split("_")
-    page = int(page)
+    category, page_data = callback.data.replace("page_", "", 1).split("_", 1)
+    page, cursor = parse_page_data(page_data)
     data = await state.get_data()
     user_id = callback.from_user.id
     
     if category == "clients":
         version = data.get("client_version", "1.20")
-        items, total = get_clients_by_version(version, page, user_id=user_id)
+        items, total = await get_clients_by_version_async(version, page, user_id=user_id, cursor=cursor)
         if total == 0:
             await callback.message.edit_text(f"🎮 Нет клиентов для версии {version}")
             await callback.answer()
@@ -1962,7 +3381,7 @@ async def pagination(callback: CallbackQuery, state: FSMContext):
         title = f"🎮 Клиенты для версии {version}"
     elif category == "packs":
         version = data.get("pack_version", "1.20")
-        items, total = get_packs_by_version(version, page, user_id=user_id)
+        items, total = await get_packs_by_version_async(version, page, user_id=user_id, cursor=cursor)
         if total == 0:
             await callback.message.edit_text(f"🎨 Нет ресурспаков для версии {version}")
             await callback.answer()
@@ -1983,7 +3402,7 @@ async def detail_view(callback: CallbackQuery, state: FSMContext):
     item_id = int(item_id)
     user_id = callback.from_user.id
     
-    item = get_item(category, item_id)
+    item = await get_item_async(category, item_id)
     if not item:
         await callback.answer("❌ Не найден", show_alert=True)
         return
@@ -1991,63 +3410,26 @@ async def detail_view(callback: CallbackQuery, state: FSMContext):
     logger.info(f"📋 Детальный просмотр: {category} ID={item_id}, данные={item}")
     
     is_admin = (user_id == ADMIN_ID)
-    user_status = get_user_status(user_id)
-    is_vip = user_status.get('is_vip', False)
+    user_status = await get_user_status_async(user_id)
+    is_vip = user_status.is_vip
+    is_fav = await is_favorite_async(user_id, item_id) if category == "packs" else False
     
-    if category == "clients":
-        name = item[1]
-        full_desc = item[2]
-        media = item[3]
-        download_url = item[4]
-        version = item[5]
-        item_is_vip = item[6] == 1 if len(item) > 6 else False
-        downloads = int(item[7]) if len(item) > 7 and item[7] else 0
-        views = int(item[8]) if len(item) > 8 and item[8] else 0
-        
-        try:
-            media_list = json.loads(media) if media else []
-        except:
-            media_list = []
-        
-        vip_text = "💎 VIP\n\n" if item_is_vip else ""
-        text = f"🎮 {name}\n\n{vip_text}{full_desc}\n\nВерсия: {version}\n📥 Скачиваний: {format_number(downloads)}\n👁 Просмотров: {format_number(views)}"
-    
-    elif category == "packs":
-        name = item[1]
-        full_desc = item[2]
-        media = item[3]
-        download_url = item[4]
-        version = item[5]
-        author = item[6] if len(item) > 6 else "Неизвестен"
-        item_is_vip = item[7] == 1 if len(item) > 7 else False
-        downloads = int(item[8]) if len(item) > 8 and item[8] else 0
-        likes = int(item[9]) if len(item) > 9 and item[9] else 0
-        views = int(item[10]) if len(item) > 10 and item[10] else 0
-        
-        try:
-            media_list = json.loads(media) if media else []
-        except:
-            media_list = []
-        
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        is_fav = cur.execute('SELECT 1 FROM favorites WHERE user_id = ? AND pack_id = ?', (callback.from_user.id, item_id)).fetchone()
-        conn.close()
-        
-        vip_text = "💎 VIP\n\n" if item_is_vip else ""
-        text = f"🎨 {name}\n\n{vip_text}{full_desc}\n\nАвтор: {author}\nВерсия: {version}\n📥 Скачиваний: {format_number(downloads)}\n❤️ В избранном: {format_number(likes)}\n👁 Просмотров: {format_number(views)}"
+    text, cover, keyboard = cached_render(
+        ("detail", category, item_id, _viewer_tier(is_vip, is_admin), is_fav),
+        lambda: render_detail_card(category, item, is_fav, is_vip, is_admin)
+    )
     
-    increment_view(category, item_id)
+    await increment_view_async(category, item_id)
     
-    if media_list and media_list[0]['type'] == 'photo':
+    if cover:
         try:
-            await callback.message.answer_photo(photo=media_list[0]['id'], caption=text, reply_markup=get_detail_keyboard(category, item_id, is_fav if category == 'packs' else False, item_is_vip, is_vip, is_admin))
+            await callback.message.answer_photo(photo=cover, caption=text, reply_markup=keyboard)
             await callback.message.delete()
         except Exception as e:
             logger.error(f"Ошибка отправки фото: {e}")
-            await callback.message.edit_text(text + "\n\n❌ Фото недоступно", reply_markup=get_detail_keyboard(category, item_id, is_fav if category == 'packs' else False, item_is_vip, is_vip, is_admin))
+            await callback.message.edit_text(text + "\n\n❌ Фото недоступно", reply_markup=keyboard)
     else:
-        await callback.message.edit_text(text, reply_markup=get_detail_keyboard(category, item_id, is_fav if category == 'packs' else False, item_is_vip, is_vip, is_admin))
+        await callback.message.edit_text(text, reply_markup=keyboard)
     
     await callback.answer()
 
@@ -2059,7 +3441,7 @@ async def back_to_list(callback: CallbackQuery, state: FSMContext):
     
     if category == "clients":
         version = data.get("client_version", "1.20")
-        items, total = get_clients_by_version(version, 1, user_id=user_id)
+        items, total = await get_clients_by_version_async(version, 1, user_id=user_id)
         if total == 0:
             try:
                 await callback.message.edit_text(f"🎮 Нет клиентов для версии {version}")
@@ -2072,7 +3454,7 @@ async def back_to_list(callback: CallbackQuery, state: FSMContext):
         page = 1
     elif category == "packs":
         version = data.get("pack_version", "1.20")
-        items, total = get_packs_by_version(version, 1, user_id=user_id)
+        items, total = await get_packs_by_version_async(version, 1, user_id=user_id)
         if total == 0:
             try:
                 await callback.message.edit_text(f"🎨 Нет ресурспаков для версии {version}")
@@ -2116,22 +3498,18 @@ async def download_item(callback: CallbackQuery):
     _, category, item_id = callback.data.split("_")
     item_id = int(item_id)
     user_id = callback.from_user.id
-    item = get_item(category, item_id)
+    item = await get_item_async(category, item_id)
     if not item:
         await callback.answer("❌ Не найден", show_alert=True)
         return
     is_admin = (user_id == ADMIN_ID)
-    user_status = get_user_status(user_id)
-    is_vip = user_status.get('is_vip', False)
+    user_status = await get_user_status_async(user_id)
+    is_vip = user_status.is_vip
     
-    if category == "clients":
-        item_is_vip = item[6] == 1 if len(item) > 6 else False
-        url = item[4]
-        name = item[1]
-    elif category == "packs":
-        item_is_vip = item[7] == 1 if len(item) > 7 else False
-        url = item[4]
-        name = item[1]
+    if category in ("clients", "packs"):
+        item_is_vip = bool(item.is_vip)
+        url = item.download_url
+        name = item.name
     else:
         await callback.answer("❌ Неизвестная категория", show_alert=True)
         return
@@ -2140,8 +3518,8 @@ async def download_item(callback: CallbackQuery):
         await callback.answer("💎 Это VIP контент! Получи VIP статус у админа", show_alert=True)
         return
     
-    increment_download(category, item_id, item_is_vip)
-    increment_download_count(user_id, item_is_vip)
+    await increment_download_async(category, item_id, item_is_vip)
+    await register_download(user_id, item_id, item_is_vip)
     
     vip_prefix = "💎 " if item_is_vip else ""
     await callback.message.answer(f"📥 Скачать {vip_prefix}{name}\n\n{url}")
@@ -2149,14 +3527,14 @@ async def download_item(callback: CallbackQuery):
 
 @dp.message(F.text == "❤️ Избранное")
 async def show_favorites(message: Message):
-    favs = get_favorites(message.from_user.id)
+    favs = await get_favorites_async(message.from_user.id)
     if not favs:
         await message.answer("❤️ Избранное пусто\n\nДобавляй ресурспаки в избранное кнопкой 🤍")
         return
     text = "❤️ Твоё избранное:\n\n"
     for fav in favs[:10]:
-        downloads = int(fav[4]) if fav[4] else 0
-        is_vip = fav[6] if len(fav) > 6 else 0
+        downloads = int(fav[3]) if fav[3] else 0
+        is_vip = fav[5]
         vip_icon = "💎 " if is_vip else ""
         text += f"• {vip_icon}{fav[1]} - {format_number(downloads)} 📥\n"
     await message.answer(text)
@@ -2168,40 +3546,17 @@ async def favorite_handler(callback: CallbackQuery):
     if category != "packs":
         await callback.answer("❌ Только для ресурспаков", show_alert=True)
         return
-    toggle_favorite(callback.from_user.id, item_id)
+    await toggle_favorite_async(callback.from_user.id, item_id)
     await callback.answer("✅ Готово!")
     await detail_view(callback, None)
 
 @dp.message(F.text == "ℹ️ Инфо")
 async def info(message: Message):
     try:
-        users_count = get_users_count()
-        vip_count = get_vip_users_count()
-        conn = sqlite3.connect(str(DB_PATH))
-        cur = conn.cursor()
-        clients_count = cur.execute('SELECT COUNT(*) FROM clients').fetchone()[0]
-        cur.execute("PRAGMA table_info(clients)")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'is_vip' in columns:
-            vip_clients = cur.execute('SELECT COUNT(*) FROM clients WHERE is_vip = 1').fetchone()[0]
-        else:
-            vip_clients = 0
-        packs_count = cur.execute('SELECT COUNT(*) FROM resourcepacks').fetchone()[0]
-        cur.execute("PRAGMA table_info(resourcepacks)")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'is_vip' in columns:
-            vip_packs = cur.execute('SELECT COUNT(*) FROM resourcepacks WHERE is_vip = 1').fetchone()[0]
-        else:
-            vip_packs = 0
-        configs_count = cur.execute('SELECT COUNT(*) FROM configs').fetchone()[0]
-        cur.execute("PRAGMA table_info(configs)")
-        columns = [col[1] for col in cur.fetchall()]
-        if 'is_vip' in columns:
-            vip_configs = cur.execute('SELECT COUNT(*) FROM configs WHERE is_vip = 1').fetchone()[0]
-        else:
-            vip_configs = 0
-        conn.close()
-        text = f"ℹ️ Информация о боте\n\nСоздатель: {CREATOR_USERNAME}\nВерсия: 23.0\n\n📊 Статистика:\n• Пользователей: {users_count} (💎 VIP: {vip_count})\n• Клиентов: {clients_count} (💎 VIP: {vip_clients})\n• Ресурспаков: {packs_count} (💎 VIP: {vip_packs})\n• Конфигов: {configs_count} (💎 VIP: {vip_configs})"
+        users_count = await get_users_count_async()
+        vip_count = await get_vip_users_count_async()
+        stats = await get_catalog_stats_async()
+        text = f"ℹ️ Информация о боте\n\nСоздатель: {CREATOR_USERNAME}\nВерсия: 23.0\n\n📊 Статистика:\n• Пользователей: {users_count} (💎 VIP: {vip_count})\n• Клиентов: {stats['clients']} (💎 VIP: {stats['vip_clients']})\n• Ресурспаков: {stats['resourcepacks']} (💎 VIP: {stats['vip_resourcepacks']})\n• Конфигов: {stats['configs']} (💎 VIP: {stats['vip_configs']})"
         await message.answer(text)
     except Exception as e:
         logger.error(f"Ошибка в info: {e}")
@@ -2258,39 +3613,65 @@ async def admin_back(callback: CallbackQuery):
 
 # ========== УПРАВЛЕНИЕ БД ==========
 
-@dp.callback_query(lambda c: c.data == "admin_db_management")
-async def admin_db_management(callback: CallbackQuery):
-    if callback.from_user.id != ADMIN_ID:
-        await callback.answer("⛔ Доступ запрещен", show_alert=True)
-        return
+DIFF_TABLE_TITLES = {"clients": "🎮 Клиенты", "resourcepacks": "🎨 Ресурспаки", "configs": "⚙️ Конфиги"}
+DIFF_OP_ICONS = {"insert": "➕", "update": "✏️", "delete": "🗑"}
+
+async def show_db_management(callback: CallbackQuery, page: int = 1):
+    counts, items, total = await get_staged_diff_async(page)
+    total_pages = max(1, (total + DIFF_PAGE_SIZE - 1) // DIFF_PAGE_SIZE)
     
-    # Проверяем, есть ли временная БД
-    if TEMP_DB_PATH.exists():
+    if total:
         status = "🟢 ЕСТЬ несохраненные изменения"
     else:
         status = "🔴 НЕТ несохраненных изменений"
     
     text = f"🗄️ УПРАВЛЕНИЕ БАЗОЙ ДАННЫХ\n\n"
-    text += f"Статус временной БД: {status}\n\n"
+    text += f"Статус правок: {status}\n\n"
+    if total:
+        for table, title in DIFF_TABLE_TITLES.items():
+            ops = counts.get(table)
+            if ops:
+                text += f"{title}: ➕ {ops.get('insert', 0)}  ✏️ {ops.get('update', 0)}  🗑 {ops.get('delete', 0)}\n"
+        text += "\n"
+        for table, item_id, op, name, changed in items:
+            line = f"{DIFF_OP_ICONS[op]} {DIFF_TABLE_TITLES[table].split()[0]} #{item_id} {(name or '')[:30]}"
+            if op == "update" and changed:
+                line += f" ({changed})"
+            text += line + "\n"
+        text += "\n"
     text += "Вы можете сохранить все изменения или отменить их."
     
-    await callback.message.edit_text(text, reply_markup=get_db_management_keyboard())
+    await callback.message.edit_text(text, reply_markup=get_db_management_keyboard(page, total_pages))
     await callback.answer()
 
+@dp.callback_query(lambda c: c.data == "admin_db_management")
+async def admin_db_management(callback: CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+    await show_db_management(callback)
+
+@dp.callback_query(lambda c: c.data.startswith("db_diff_page_"))
+async def db_diff_page(callback: CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещен", show_alert=True)
+        return
+    await show_db_management(callback, int(callback.data.replace("db_diff_page_", "")))
+
 @dp.callback_query(lambda c: c.data == "save_edit_all")
 async def save_all_changes(callback: CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    if apply_temp_db_changes():
+    if await apply_temp_db_changes_async():
         await callback.message.edit_text(
             "✅ Все изменения сохранены! База данных обновлена.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад в админку", callback_data="admin_back")]])
         )
     else:
         await callback.message.edit_text(
-            "❌ Ошибка при сохранении изменений. Возможно, нет временной БД.",
+            "❌ Изменения не сохранены: несохраненных правок нет или произошла ошибка.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_db_management")]])
         )
     
@@ -2302,14 +3683,14 @@ async def cancel_all_changes(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    if cancel_temp_db_changes():
+    if await cancel_temp_db_changes_async():
         await callback.message.edit_text(
             "❌ Все изменения отменены. База данных не изменена.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад в админку", callback_data="admin_back")]])
         )
     else:
         await callback.message.edit_text(
-            "⚠️ Временная БД уже удалена или произошла ошибка.",
+            "⚠️ Не удалось отменить несохраненные правки, подробности в логах.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_db_management")]])
         )
     
@@ -2334,7 +3715,7 @@ async def vip_list(callback: CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
-    users = get_all_users_with_details()
+    users = await get_all_users_with_details_async()
     vip_users = [u for u in users if u[4] == 1]
     if not vip_users:
         await callback.message.edit_text("📭 Нет VIP пользователей", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_vip")]]))
@@ -2385,13 +3766,13 @@ async def vip_handle_user_id(message: Message, state: FSMContext):
     action = data.get('vip_action', 'add')
     
     if action == 'add':
-        success = set_user_vip(user_id, ADMIN_ID)
+        success = await set_user_vip_async(user_id, ADMIN_ID)
         if success:
             await message.answer(f"✅ VIP статус выдан пользователю {user_id}!\n\nСпасибо за ваше доверие!")
         else:
             await message.answer("❌ Ошибка при выдаче VIP статуса")
     else:
-        success = remove_user_vip(user_id, ADMIN_ID)
+        success = await remove_user_vip_async(user_id, ADMIN_ID)
         if success:
             await message.answer(f"✅ VIP статус снят с пользователя {user_id}!")
         else:
@@ -2406,10 +3787,10 @@ async def admin_clients(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    # Создаем временную копию БД для редактирования
-    if not create_temp_db():
+    # Начинаем сеанс редактирования (правки копятся в журнале)
+    if not await create_temp_db_async():
         await callback.message.edit_text(
-            "❌ Ошибка создания временной копии БД", 
+            "❌ Не удалось начать редактирование", 
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]])
         )
         await callback.answer()
@@ -2431,10 +3812,10 @@ async def admin_packs(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    # Создаем временную копию БД для редактирования
-    if not create_temp_db():
+    # Начинаем сеанс редактирования (правки копятся в журнале)
+    if not await create_temp_db_async():
         await callback.message.edit_text(
-            "❌ Ошибка создания временной копии БД", 
+            "❌ Не удалось начать редактирование", 
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]])
         )
         await callback.answer()
@@ -2458,10 +3839,10 @@ async def admin_configs(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    # Создаем временную копию БД для редактирования
-    if not create_temp_db():
+    # Начинаем сеанс редактирования (правки копятся в журнале)
+    if not await create_temp_db_async():
         await callback.message.edit_text(
-            "❌ Ошибка создания временной копии БД", 
+            "❌ Не удалось начать редактирование", 
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]])
         )
         await callback.answer()
@@ -2542,13 +3923,13 @@ async def config_media(message: Message, state: FSMContext):
         if not client_version or client_version.strip() == "":
             client_version = "1.20"
         
-        item_id = add_config(client_name, client_version, name, full_desc, url, is_vip, media_list)
+        item_id = await add_config_async(client_name, client_version, name, full_desc, url, is_vip, media_list)
         await state.clear()
         
         if item_id:
             vip_text = "💎 VIP" if is_vip else "📦 Обычный"
             await message.answer(
-                f"✅ Конфиг добавлен во временную БД!\nID: {item_id}\nДля клиента: {client_name} (версия {client_version})\n{vip_text}\nДобавлено фото: {len(media_list)}",
+                f"✅ Конфиг добавлен (до сохранения БД)!\nID: {item_id}\nДля клиента: {client_name} (версия {client_version})\n{vip_text}\nДобавлено фото: {len(media_list)}",
                 reply_markup=get_save_cancel_keyboard("configs")
             )
         else:
@@ -2566,13 +3947,13 @@ async def config_media(message: Message, state: FSMContext):
         if not client_version or client_version.strip() == "":
             client_version = "1.20"
         
-        item_id = add_config(client_name, client_version, name, full_desc, url, is_vip, [])
+        item_id = await add_config_async(client_name, client_version, name, full_desc, url, is_vip, [])
         await state.clear()
         
         if item_id:
             vip_text = "💎 VIP" if is_vip else "📦 Обычный"
             await message.answer(
-                f"✅ Конфиг добавлен во временную БД!\nID: {item_id}\nДля клиента: {client_name} (версия {client_version})\n{vip_text}\nБез фото",
+                f"✅ Конфиг добавлен (до сохранения БД)!\nID: {item_id}\nДля клиента: {client_name} (версия {client_version})\n{vip_text}\nБез фото",
                 reply_markup=get_save_cancel_keyboard("configs")
             )
         else:
@@ -2644,16 +4025,16 @@ async def client_media(message: Message, state: FSMContext):
         if not version or version.strip() == "":
             version = "1.20"
         
-        item_id = add_client(name, full_desc, url, version, is_vip, media_list)
+        item_id = await add_client_async(name, full_desc, url, version, is_vip, media_list)
         await state.clear()
         
         if item_id:
             vip_text = "💎 VIP" if is_vip else "📦 Обычный"
             await message.answer(
-                f"✅ Клиент добавлен во временную БД!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nДобавлено фото: {len(media_list)}",
+                f"✅ Клиент добавлен (до сохранения БД)!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nДобавлено фото: {len(media_list)}",
                 reply_markup=get_save_cancel_keyboard("clients")
             )
-            check_all_clients()
+            await check_all_clients_async()
         else:
             await message.answer("❌ Ошибка при добавлении клиента", reply_markup=get_main_keyboard(is_admin=True))
         return
@@ -2668,16 +4049,16 @@ async def client_media(message: Message, state: FSMContext):
         if not version or version.strip() == "":
             version = "1.20"
         
-        item_id = add_client(name, full_desc, url, version, is_vip, [])
+        item_id = await add_client_async(name, full_desc, url, version, is_vip, [])
         await state.clear()
         
         if item_id:
             vip_text = "💎 VIP" if is_vip else "📦 Обычный"
             await message.answer(
-                f"✅ Клиент добавлен во временную БД!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nБез фото",
+                f"✅ Клиент добавлен (до сохранения БД)!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nБез фото",
                 reply_markup=get_save_cancel_keyboard("clients")
             )
-            check_all_clients()
+            await check_all_clients_async()
         else:
             await message.answer("❌ Ошибка при добавлении клиента", reply_markup=get_main_keyboard(is_admin=True))
         return
@@ -2754,13 +4135,13 @@ async def pack_media(message: Message, state: FSMContext):
         if not version or version.strip() == "":
             version = "1.20"
         
-        item_id = add_pack(name, full_desc, url, version, author, is_vip, media_list)
+        item_id = await add_pack_async(name, full_desc, url, version, author, is_vip, media_list)
         await state.clear()
         
         if item_id:
             vip_text = "💎 VIP" if is_vip else "📦 Обычный"
             await message.answer(
-                f"✅ Ресурспак добавлен во временную БД!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nДобавлено фото: {len(media_list)}",
+                f"✅ Ресурспак добавлен (до сохранения БД)!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nДобавлено фото: {len(media_list)}",
                 reply_markup=get_save_cancel_keyboard("packs")
             )
         else:
@@ -2778,13 +4159,13 @@ async def pack_media(message: Message, state: FSMContext):
         if not version or version.strip() == "":
             version = "1.20"
         
-        item_id = add_pack(name, full_desc, url, version, author, is_vip, [])
+        item_id = await add_pack_async(name, full_desc, url, version, author, is_vip, [])
         await state.clear()
         
         if item_id:
             vip_text = "💎 VIP" if is_vip else "📦 Обычный"
             await message.answer(
-                f"✅ Ресурспак добавлен во временную БД!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nБез фото",
+                f"✅ Ресурспак добавлен (до сохранения БД)!\nID: {item_id}\n{vip_text}\nВерсия: {version}\nБез фото",
                 reply_markup=get_save_cancel_keyboard("packs")
             )
         else:
@@ -2806,7 +4187,7 @@ async def edit_configs_list(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    items, total = get_all_items_paginated("configs", 1, 50, use_temp=True)
+    items, total = await get_all_items_paginated_async("configs", 1, 50, use_temp=True)
     total_pages = max(1, (total + 49) // 50)
     
     logger.info(f"📋 Найдено конфигов для редактирования: {len(items)} из {total}")
@@ -2821,12 +4202,7 @@ async def edit_configs_list(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        if len(item) >= 8:
-            item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-        else:
-            item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-            client_name = name
-            client_version = version
+        item_id, client_name, client_version, name, media_count, downloads, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({client_name} v{client_version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"edit_item_configs_{item_id}")])
@@ -2835,7 +4211,7 @@ async def edit_configs_list(callback: CallbackQuery):
         nav_row = []
         nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
         if 1 < total_pages:
-            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"edit_configs_page_2"))
+            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("edit_configs_page_", "configs", 2, items, forward=True)))
         if nav_row:
             buttons.append(nav_row)
     
@@ -2855,8 +4231,8 @@ async def edit_configs_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("edit_configs_page_", ""))
-    items, total = get_all_items_paginated("configs", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("edit_configs_page_", ""))
+    items, total = await get_all_items_paginated_async("configs", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -2869,22 +4245,17 @@ async def edit_configs_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        if len(item) >= 8:
-            item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-        else:
-            item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-            client_name = name
-            client_version = version
+        item_id, client_name, client_version, name, media_count, downloads, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({client_name} v{client_version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"edit_item_configs_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"edit_configs_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("edit_configs_page_", "configs", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"edit_configs_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("edit_configs_page_", "configs", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -2910,28 +4281,16 @@ async def edit_config_select(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    item = get_item("configs", item_id, use_temp=True)
+    item = await get_item_async("configs", item_id, use_temp=True)
     if not item:
         await callback.answer("❌ Конфиг не найден", show_alert=True)
         return
     
-    try:
-        media_list = json.loads(item[5]) if len(item) > 5 and item[5] else []
-        media_count = len(media_list)
-    except:
-        media_count = 0
-    
-    is_vip = item[7] == 1 if len(item) > 7 else 0
-    
-    # Определяем название и клиента для отображения
-    if len(item) >= 10:
-        name = item[3]
-        client_name = item[1]
-        client_version = item[2]
-    else:
-        name = item[1]
-        client_name = name
-        client_version = item[5] if len(item) > 5 else "1.20.4"
+    media_count = item.media_count
+    is_vip = item.is_vip
+    name = item.name
+    client_name = item.client_name
+    client_version = item.client_version
     
     await state.update_data(edit_item_id=item_id, edit_category="configs")
     
@@ -2980,7 +4339,7 @@ async def delete_configs_list(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    items, total = get_all_items_paginated("configs", 1, 50, use_temp=True)
+    items, total = await get_all_items_paginated_async("configs", 1, 50, use_temp=True)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -2993,12 +4352,7 @@ async def delete_configs_list(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        if len(item) >= 8:
-            item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-        else:
-            item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-            client_name = name
-            client_version = version
+        item_id, client_name, client_version, name, media_count, downloads, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({client_name} v{client_version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"delete_item_configs_{item_id}")])
@@ -3007,7 +4361,7 @@ async def delete_configs_list(callback: CallbackQuery):
         nav_row = []
         nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
         if 1 < total_pages:
-            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"delete_configs_page_2"))
+            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("delete_configs_page_", "configs", 2, items, forward=True)))
         if nav_row:
             buttons.append(nav_row)
     
@@ -3027,8 +4381,8 @@ async def delete_configs_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("delete_configs_page_", ""))
-    items, total = get_all_items_paginated("configs", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("delete_configs_page_", ""))
+    items, total = await get_all_items_paginated_async("configs", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3041,22 +4395,17 @@ async def delete_configs_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        if len(item) >= 8:
-            item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-        else:
-            item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-            client_name = name
-            client_version = version
+        item_id, client_name, client_version, name, media_count, downloads, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({client_name} v{client_version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"delete_item_configs_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"delete_configs_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("delete_configs_page_", "configs", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"delete_configs_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("delete_configs_page_", "configs", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -3082,20 +4431,14 @@ async def delete_config_confirm(callback: CallbackQuery):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    item = get_item("configs", item_id, use_temp=True)
+    item = await get_item_async("configs", item_id, use_temp=True)
     if not item:
         await callback.answer("❌ Конфиг не найден", show_alert=True)
         return
     
-    # Определяем название для отображения
-    if len(item) >= 10:
-        name = item[3]
-        client_name = item[1]
-        client_version = item[2]
-    else:
-        name = item[1]
-        client_name = name
-        client_version = item[5] if len(item) > 5 else "1.20.4"
+    name = item.name
+    client_name = item.client_name
+    client_version = item.client_version
     
     buttons = [
         [InlineKeyboardButton(text="✅ Да, удалить", callback_data=f"delete_item_configs_confirm_{item_id}")],
@@ -3120,10 +4463,10 @@ async def delete_config_execute(callback: CallbackQuery):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    success = delete_item_from_temp("configs", item_id)
+    success = await delete_item_from_temp_async("configs", item_id)
     
     if success:
-        await callback.answer("✅ Конфиг удален из временной БД!", show_alert=True)
+        await callback.answer("✅ Конфиг удален (до сохранения БД)!", show_alert=True)
     else:
         await callback.answer("❌ Ошибка при удалении!", show_alert=True)
     
@@ -3140,7 +4483,7 @@ async def toggle_vip_configs(callback: CallbackQuery):
     parts = callback.data.split("_")
     if len(parts) == 3:
         # Показ списка конфигов для переключения VIP
-        items, total = get_all_items_paginated("configs", 1, 50, use_temp=True)
+        items, total = await get_all_items_paginated_async("configs", 1, 50, use_temp=True)
         total_pages = max(1, (total + 49) // 50)
         
         if not items:
@@ -3153,12 +4496,7 @@ async def toggle_vip_configs(callback: CallbackQuery):
         
         buttons = []
         for item in items:
-            if len(item) >= 8:
-                item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-            else:
-                item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-                client_name = name
-                client_version = version
+            item_id, client_name, client_version, name, media_count, downloads, is_vip = item
             status = "💎 VIP" if is_vip else "🔘 Обычный"
             button_text = f"{item_id}. {name[:30]} ({client_name} v{client_version}) - {status}"
             buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"toggle_vip_configs_{item_id}")])
@@ -3167,7 +4505,7 @@ async def toggle_vip_configs(callback: CallbackQuery):
             nav_row = []
             nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
             if 1 < total_pages:
-                nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"toggle_vip_configs_page_2"))
+                nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("toggle_vip_configs_page_", "configs", 2, items, forward=True)))
             if nav_row:
                 buttons.append(nav_row)
         
@@ -3183,12 +4521,12 @@ async def toggle_vip_configs(callback: CallbackQuery):
     elif len(parts) >= 4:
         # Переключение конкретного конфига
         item_id = int(parts[3])
-        new_status = toggle_vip_in_temp("configs", item_id)
+        new_status = await toggle_vip_in_temp_async("configs", item_id)
         
         if new_status:
-            await callback.answer("✅ Конфиг теперь VIP во временной БД!", show_alert=True)
+            await callback.answer("✅ Конфиг теперь VIP (до сохранения БД)!", show_alert=True)
         else:
-            await callback.answer("✅ Конфиг теперь обычный во временной БД!", show_alert=True)
+            await callback.answer("✅ Конфиг теперь обычный (до сохранения БД)!", show_alert=True)
         
         await toggle_vip_configs(callback)
     
@@ -3200,8 +4538,8 @@ async def toggle_vip_configs_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("toggle_vip_configs_page_", ""))
-    items, total = get_all_items_paginated("configs", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("toggle_vip_configs_page_", ""))
+    items, total = await get_all_items_paginated_async("configs", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3214,22 +4552,17 @@ async def toggle_vip_configs_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        if len(item) >= 8:
-            item_id, client_name, client_version, name, full_desc, media_json, downloads, is_vip = item[:8]
-        else:
-            item_id, name, version, name2, full_desc, media_json, downloads, is_vip = item
-            client_name = name
-            client_version = version
+        item_id, client_name, client_version, name, media_count, downloads, is_vip = item
         status = "💎 VIP" if is_vip else "🔘 Обычный"
         button_text = f"{item_id}. {name[:30]} ({client_name} v{client_version}) - {status}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"toggle_vip_configs_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"toggle_vip_configs_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("toggle_vip_configs_page_", "configs", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"toggle_vip_configs_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("toggle_vip_configs_page_", "configs", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -3252,7 +4585,7 @@ async def edit_clients_list(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    items, total = get_all_items_paginated("clients", 1, 50, use_temp=True)
+    items, total = await get_all_items_paginated_async("clients", 1, 50, use_temp=True)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3265,7 +4598,7 @@ async def edit_clients_list(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"edit_item_clients_{item_id}")])
@@ -3274,7 +4607,7 @@ async def edit_clients_list(callback: CallbackQuery):
         nav_row = []
         nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
         if 1 < total_pages:
-            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"edit_clients_page_2"))
+            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("edit_clients_page_", "clients", 2, items, forward=True)))
         if nav_row:
             buttons.append(nav_row)
     
@@ -3294,8 +4627,8 @@ async def edit_clients_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("edit_clients_page_", ""))
-    items, total = get_all_items_paginated("clients", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("edit_clients_page_", ""))
+    items, total = await get_all_items_paginated_async("clients", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3308,17 +4641,17 @@ async def edit_clients_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"edit_item_clients_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"edit_clients_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("edit_clients_page_", "clients", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"edit_clients_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("edit_clients_page_", "clients", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -3344,23 +4677,18 @@ async def edit_client_select(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    item = get_item("clients", item_id, use_temp=True)
+    item = await get_item_async("clients", item_id, use_temp=True)
     if not item:
         await callback.answer("❌ Клиент не найден", show_alert=True)
         return
     
-    try:
-        media_list = json.loads(item[3]) if item[3] else []
-        media_count = len(media_list)
-    except:
-        media_count = 0
-    
-    is_vip = item[6] == 1 if len(item) > 6 else 0
+    media_count = item.media_count
+    is_vip = item.is_vip
     
     await state.update_data(edit_item_id=item_id, edit_category="clients")
     
     await callback.message.edit_text(
-        f"✏️ Редактирование клиента: {item[1]}\n\nЧто изменить?",
+        f"✏️ Редактирование клиента: {item.name}\n\nЧто изменить?",
         reply_markup=get_edit_item_keyboard("clients", item_id, media_count, is_vip)
     )
     await callback.answer()
@@ -3373,7 +4701,7 @@ async def edit_packs_list(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    items, total = get_all_items_paginated("resourcepacks", 1, 50, use_temp=True)
+    items, total = await get_all_items_paginated_async("resourcepacks", 1, 50, use_temp=True)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3386,7 +4714,7 @@ async def edit_packs_list(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"edit_item_packs_{item_id}")])
@@ -3395,7 +4723,7 @@ async def edit_packs_list(callback: CallbackQuery):
         nav_row = []
         nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
         if 1 < total_pages:
-            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"edit_packs_page_2"))
+            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("edit_packs_page_", "resourcepacks", 2, items, forward=True)))
         if nav_row:
             buttons.append(nav_row)
     
@@ -3415,8 +4743,8 @@ async def edit_packs_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("edit_packs_page_", ""))
-    items, total = get_all_items_paginated("resourcepacks", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("edit_packs_page_", ""))
+    items, total = await get_all_items_paginated_async("resourcepacks", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3429,17 +4757,17 @@ async def edit_packs_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"edit_item_packs_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"edit_packs_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("edit_packs_page_", "resourcepacks", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"edit_packs_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("edit_packs_page_", "resourcepacks", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -3465,23 +4793,18 @@ async def edit_pack_select(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    item = get_item("resourcepacks", item_id, use_temp=True)
+    item = await get_item_async("resourcepacks", item_id, use_temp=True)
     if not item:
         await callback.answer("❌ Ресурспак не найден", show_alert=True)
         return
     
-    try:
-        media_list = json.loads(item[3]) if item[3] else []
-        media_count = len(media_list)
-    except:
-        media_count = 0
-    
-    is_vip = item[7] == 1 if len(item) > 7 else 0
+    media_count = item.media_count
+    is_vip = item.is_vip
     
     await state.update_data(edit_item_id=item_id, edit_category="packs")
     
     await callback.message.edit_text(
-        f"✏️ Редактирование ресурспака: {item[1]}\n\nЧто изменить?",
+        f"✏️ Редактирование ресурспака: {item.name}\n\nЧто изменить?",
         reply_markup=get_edit_item_keyboard("packs", item_id, media_count, is_vip)
     )
     await callback.answer()
@@ -3494,7 +4817,7 @@ async def delete_clients_list(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    items, total = get_all_items_paginated("clients", 1, 50, use_temp=True)
+    items, total = await get_all_items_paginated_async("clients", 1, 50, use_temp=True)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3507,7 +4830,7 @@ async def delete_clients_list(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"delete_item_clients_{item_id}")])
@@ -3516,7 +4839,7 @@ async def delete_clients_list(callback: CallbackQuery):
         nav_row = []
         nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
         if 1 < total_pages:
-            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"delete_clients_page_2"))
+            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("delete_clients_page_", "clients", 2, items, forward=True)))
         if nav_row:
             buttons.append(nav_row)
     
@@ -3536,8 +4859,8 @@ async def delete_clients_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("delete_clients_page_", ""))
-    items, total = get_all_items_paginated("clients", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("delete_clients_page_", ""))
+    items, total = await get_all_items_paginated_async("clients", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3550,17 +4873,17 @@ async def delete_clients_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"delete_item_clients_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"delete_clients_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("delete_clients_page_", "clients", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"delete_clients_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("delete_clients_page_", "clients", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -3586,7 +4909,7 @@ async def delete_client_confirm(callback: CallbackQuery):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    item = get_item("clients", item_id, use_temp=True)
+    item = await get_item_async("clients", item_id, use_temp=True)
     if not item:
         await callback.answer("❌ Клиент не найден", show_alert=True)
         return
@@ -3597,7 +4920,7 @@ async def delete_client_confirm(callback: CallbackQuery):
     ]
     
     await callback.message.edit_text(
-        f"⚠️ Подтверждение удаления\n\nТы действительно хочешь удалить клиента:\n{item[1]} (ID: {item_id})?\n\nЭто действие нельзя отменить!",
+        f"⚠️ Подтверждение удаления\n\nТы действительно хочешь удалить клиента:\n{item.name} (ID: {item_id})?\n\nЭто действие нельзя отменить!",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
     )
     await callback.answer()
@@ -3614,10 +4937,10 @@ async def delete_client_execute(callback: CallbackQuery):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    success = delete_item_from_temp("clients", item_id)
+    success = await delete_item_from_temp_async("clients", item_id)
     
     if success:
-        await callback.answer("✅ Клиент удален из временной БД!", show_alert=True)
+        await callback.answer("✅ Клиент удален (до сохранения БД)!", show_alert=True)
     else:
         await callback.answer("❌ Ошибка при удалении!", show_alert=True)
     
@@ -3631,7 +4954,7 @@ async def delete_packs_list(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    items, total = get_all_items_paginated("resourcepacks", 1, 50, use_temp=True)
+    items, total = await get_all_items_paginated_async("resourcepacks", 1, 50, use_temp=True)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3644,7 +4967,7 @@ async def delete_packs_list(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"delete_item_packs_{item_id}")])
@@ -3653,7 +4976,7 @@ async def delete_packs_list(callback: CallbackQuery):
         nav_row = []
         nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
         if 1 < total_pages:
-            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"delete_packs_page_2"))
+            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("delete_packs_page_", "resourcepacks", 2, items, forward=True)))
         if nav_row:
             buttons.append(nav_row)
     
@@ -3673,8 +4996,8 @@ async def delete_packs_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("delete_packs_page_", ""))
-    items, total = get_all_items_paginated("resourcepacks", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("delete_packs_page_", ""))
+    items, total = await get_all_items_paginated_async("resourcepacks", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3687,17 +5010,17 @@ async def delete_packs_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         vip_icon = "💎 " if is_vip else ""
         button_text = f"{item_id}. {vip_icon}{name[:30]} ({version}) 📥 {downloads}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"delete_item_packs_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"delete_packs_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("delete_packs_page_", "resourcepacks", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"delete_packs_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("delete_packs_page_", "resourcepacks", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -3723,7 +5046,7 @@ async def delete_pack_confirm(callback: CallbackQuery):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    item = get_item("resourcepacks", item_id, use_temp=True)
+    item = await get_item_async("resourcepacks", item_id, use_temp=True)
     if not item:
         await callback.answer("❌ Ресурспак не найден", show_alert=True)
         return
@@ -3734,7 +5057,7 @@ async def delete_pack_confirm(callback: CallbackQuery):
     ]
     
     await callback.message.edit_text(
-        f"⚠️ Подтверждение удаления\n\nТы действительно хочешь удалить ресурспак:\n{item[1]} (ID: {item_id})?\n\nЭто действие нельзя отменить!",
+        f"⚠️ Подтверждение удаления\n\nТы действительно хочешь удалить ресурспак:\n{item.name} (ID: {item_id})?\n\nЭто действие нельзя отменить!",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
     )
     await callback.answer()
@@ -3751,10 +5074,10 @@ async def delete_pack_execute(callback: CallbackQuery):
         await callback.answer("❌ Неверный ID", show_alert=True)
         return
     
-    success = delete_item_from_temp("resourcepacks", item_id)
+    success = await delete_item_from_temp_async("resourcepacks", item_id)
     
     if success:
-        await callback.answer("✅ Ресурспак удален из временной БД!", show_alert=True)
+        await callback.answer("✅ Ресурспак удален (до сохранения БД)!", show_alert=True)
     else:
         await callback.answer("❌ Ошибка при удалении!", show_alert=True)
     
@@ -3770,7 +5093,7 @@ async def toggle_vip_clients(callback: CallbackQuery):
     
     parts = callback.data.split("_")
     if len(parts) == 3:
-        items, total = get_all_items_paginated("clients", 1, 50, use_temp=True)
+        items, total = await get_all_items_paginated_async("clients", 1, 50, use_temp=True)
         total_pages = max(1, (total + 49) // 50)
         
         if not items:
@@ -3783,7 +5106,7 @@ async def toggle_vip_clients(callback: CallbackQuery):
         
         buttons = []
         for item in items:
-            item_id, name, full_desc, media_json, downloads, version, is_vip = item
+            item_id, name, media_count, downloads, version, is_vip = item
             status = "💎 VIP" if is_vip else "🔘 Обычный"
             button_text = f"{item_id}. {name[:30]} ({version}) - {status}"
             buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"toggle_vip_clients_{item_id}")])
@@ -3792,7 +5115,7 @@ async def toggle_vip_clients(callback: CallbackQuery):
             nav_row = []
             nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
             if 1 < total_pages:
-                nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"toggle_vip_clients_page_2"))
+                nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("toggle_vip_clients_page_", "clients", 2, items, forward=True)))
             if nav_row:
                 buttons.append(nav_row)
         
@@ -3807,12 +5130,12 @@ async def toggle_vip_clients(callback: CallbackQuery):
     
     elif len(parts) >= 4:
         item_id = int(parts[3])
-        new_status = toggle_vip_in_temp("clients", item_id)
+        new_status = await toggle_vip_in_temp_async("clients", item_id)
         
         if new_status:
-            await callback.answer("✅ Клиент теперь VIP во временной БД!", show_alert=True)
+            await callback.answer("✅ Клиент теперь VIP (до сохранения БД)!", show_alert=True)
         else:
-            await callback.answer("✅ Клиент теперь обычный во временной БД!", show_alert=True)
+            await callback.answer("✅ Клиент теперь обычный (до сохранения БД)!", show_alert=True)
         
         await toggle_vip_clients(callback)
     
@@ -3824,8 +5147,8 @@ async def toggle_vip_clients_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("toggle_vip_clients_page_", ""))
-    items, total = get_all_items_paginated("clients", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("toggle_vip_clients_page_", ""))
+    items, total = await get_all_items_paginated_async("clients", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3838,17 +5161,17 @@ async def toggle_vip_clients_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         status = "💎 VIP" if is_vip else "🔘 Обычный"
         button_text = f"{item_id}. {name[:30]} ({version}) - {status}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"toggle_vip_clients_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"toggle_vip_clients_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("toggle_vip_clients_page_", "clients", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"toggle_vip_clients_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("toggle_vip_clients_page_", "clients", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -3873,7 +5196,7 @@ async def toggle_vip_packs(callback: CallbackQuery):
     
     parts = callback.data.split("_")
     if len(parts) == 3:
-        items, total = get_all_items_paginated("resourcepacks", 1, 50, use_temp=True)
+        items, total = await get_all_items_paginated_async("resourcepacks", 1, 50, use_temp=True)
         total_pages = max(1, (total + 49) // 50)
         
         if not items:
@@ -3886,7 +5209,7 @@ async def toggle_vip_packs(callback: CallbackQuery):
         
         buttons = []
         for item in items:
-            item_id, name, full_desc, media_json, downloads, version, is_vip = item
+            item_id, name, media_count, downloads, version, is_vip = item
             status = "💎 VIP" if is_vip else "🔘 Обычный"
             button_text = f"{item_id}. {name[:30]} ({version}) - {status}"
             buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"toggle_vip_packs_{item_id}")])
@@ -3895,7 +5218,7 @@ async def toggle_vip_packs(callback: CallbackQuery):
             nav_row = []
             nav_row.append(InlineKeyboardButton(text=f"1/{total_pages}", callback_data="noop"))
             if 1 < total_pages:
-                nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"toggle_vip_packs_page_2"))
+                nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("toggle_vip_packs_page_", "resourcepacks", 2, items, forward=True)))
             if nav_row:
                 buttons.append(nav_row)
         
@@ -3910,12 +5233,12 @@ async def toggle_vip_packs(callback: CallbackQuery):
     
     elif len(parts) >= 4:
         item_id = int(parts[3])
-        new_status = toggle_vip_in_temp("resourcepacks", item_id)
+        new_status = await toggle_vip_in_temp_async("resourcepacks", item_id)
         
         if new_status:
-            await callback.answer("✅ Ресурспак теперь VIP во временной БД!", show_alert=True)
+            await callback.answer("✅ Ресурспак теперь VIP (до сохранения БД)!", show_alert=True)
         else:
-            await callback.answer("✅ Ресурспак теперь обычный во временной БД!", show_alert=True)
+            await callback.answer("✅ Ресурспак теперь обычный (до сохранения БД)!", show_alert=True)
         
         await toggle_vip_packs(callback)
     
@@ -3927,8 +5250,8 @@ async def toggle_vip_packs_page(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     
-    page = int(callback.data.replace("toggle_vip_packs_page_", ""))
-    items, total = get_all_items_paginated("resourcepacks", page, 50, use_temp=True)
+    page, cursor = parse_page_data(callback.data.replace("toggle_vip_packs_page_", ""))
+    items, total = await get_all_items_paginated_async("resourcepacks", page, 50, use_temp=True, cursor=cursor)
     total_pages = max(1, (total + 49) // 50)
     
     if not items:
@@ -3941,17 +5264,17 @@ async def toggle_vip_packs_page(callback: CallbackQuery):
     
     buttons = []
     for item in items:
-        item_id, name, full_desc, media_json, downloads, version, is_vip = item
+        item_id, name, media_count, downloads, version, is_vip = item
         status = "💎 VIP" if is_vip else "🔘 Обычный"
         button_text = f"{item_id}. {name[:30]} ({version}) - {status}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"toggle_vip_packs_{item_id}")])
     
     nav_row = []
     if page > 1:
-        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"toggle_vip_packs_page_{page-1}"))
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=page_nav_data("toggle_vip_packs_page_", "resourcepacks", page - 1, items, forward=False)))
     nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"toggle_vip_packs_page_{page+1}"))
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=page_nav_data("toggle_vip_packs_page_", "resourcepacks", page + 1, items, forward=True)))
     if nav_row:
         buttons.append(nav_row)
     
@@ -4012,16 +5335,16 @@ async def edit_value(message: Message, state: FSMContext):
     
     success = False
     if category == 'clients':
-        success = update_item_in_temp("clients", item_id, field, message.text)
+        success = await update_item_in_temp_async("clients", item_id, field, message.text)
     elif category == 'packs':
-        success = update_item_in_temp("resourcepacks", item_id, field, message.text)
+        success = await update_item_in_temp_async("resourcepacks", item_id, field, message.text)
     elif category == 'configs':
-        success = update_item_in_temp("configs", item_id, field, message.text)
+        success = await update_item_in_temp_async("configs", item_id, field, message.text)
     
     await state.clear()
     
     if success:
-        await message.answer("✅ Значение обновлено во временной БД!\n\nНе забудь сохранить изменения кнопкой 'СОХРАНИТЬ БД' в админке!", reply_markup=get_main_keyboard(is_admin=True))
+        await message.answer("✅ Значение обновлено (до сохранения БД)!\n\nНе забудь сохранить изменения кнопкой 'СОХРАНИТЬ БД' в админке!", reply_markup=get_main_keyboard(is_admin=True))
     else:
         await message.answer("❌ Ошибка при обновлении", reply_markup=get_main_keyboard(is_admin=True))
 
@@ -4037,23 +5360,17 @@ async def edit_media_start(callback: CallbackQuery, state: FSMContext):
     category = parts[2]
     item_id = int(parts[3])
     
-    item = get_item(category, item_id, use_temp=True)
-    if not item:
+    item = await get_item_async(category, item_id, use_temp=True)
+    media_list = await get_item_media_async(category, item_id, use_temp=True)
+    if not item or media_list is None:
         await callback.answer("❌ Элемент не найден", show_alert=True)
         return
     
-    media_index = 5 if category == "configs" and len(item) > 5 else 3
-    
-    try:
-        media_list = json.loads(item[media_index]) if len(item) > media_index and item[media_index] else []
-    except:
-        media_list = []
-    
     await state.update_data(edit_item_id=item_id, edit_category=category, media_list=media_list)
     await state.set_state(AdminStates.edit_media)
     
     media_count = len(media_list)
-    name = item[1] if category != "configs" else (item[3] if len(item) > 3 else "Конфиг")
+    name = item.name
     text = f"🖼️ Управление фото для {name}\n\nСейчас фото: {media_count}\n\n"
     if media_count > 0:
         text += "Чтобы удалить все фото, нажми кнопку ниже.\nЧтобы добавить новые, просто отправь фото."
@@ -4087,14 +5404,14 @@ async def delete_media(callback: CallbackQuery, state: FSMContext):
     
     success = False
     if category == "clients":
-        success = update_client_media(item_id, [])
+        success = await update_client_media_async(item_id, [])
     elif category == "packs":
-        success = update_pack_media(item_id, [])
+        success = await update_pack_media_async(item_id, [])
     elif category == "configs":
-        success = update_config_media(item_id, [])
+        success = await update_config_media_async(item_id, [])
     
     if success:
-        await callback.message.edit_text("✅ Все фото удалены из временной БД!", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data=f"edit_media_{category}_{item_id}")]]))
+        await callback.message.edit_text("✅ Все фото удалены (до сохранения БД)!", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data=f"edit_media_{category}_{item_id}")]]))
     else:
         await callback.message.edit_text("❌ Ошибка при удалении фото", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data=f"edit_media_{category}_{item_id}")]]))
     await callback.answer()
@@ -4113,15 +5430,15 @@ async def handle_media_edit(message: Message, state: FSMContext):
     if message.text and message.text.lower() == 'готово':
         success = False
         if category == 'clients':
-            success = update_client_media(item_id, current_media)
+            success = await update_client_media_async(item_id, current_media)
         elif category == 'packs':
-            success = update_pack_media(item_id, current_media)
+            success = await update_pack_media_async(item_id, current_media)
         elif category == 'configs':
-            success = update_config_media(item_id, current_media)
+            success = await update_config_media_async(item_id, current_media)
         
         await state.clear()
         if success:
-            await message.answer(f"✅ Фото сохранено во временной БД! Всего: {len(current_media)}\n\nНе забудь сохранить изменения кнопкой 'СОХРАНИТЬ БД' в админке!", reply_markup=get_main_keyboard(is_admin=True))
+            await message.answer(f"✅ Фото сохранено (до сохранения БД)! Всего: {len(current_media)}\n\nНе забудь сохранить изменения кнопкой 'СОХРАНИТЬ БД' в админке!", reply_markup=get_main_keyboard(is_admin=True))
         else:
             await message.answer("❌ Ошибка при сохранении фото", reply_markup=get_main_keyboard(is_admin=True))
         return
@@ -4134,7 +5451,7 @@ async def handle_media_edit(message: Message, state: FSMContext):
     if message.photo:
         current_media.append({'type': 'photo', 'id': message.photo[-1].file_id})
         await state.update_data(media_list=current_media)
-        await message.answer(f"✅ Фото добавлено во временную БД! Всего: {len(current_media)}\nМожешь отправить ещё фото или написать 'готово'")
+        await message.answer(f"✅ Фото добавлено (до сохранения БД)! Всего: {len(current_media)}\nМожешь отправить ещё фото или написать 'готово'")
     else:
         await message.answer("❌ Отправь фото, или напиши 'готово' / 'отмена'")
 
@@ -4148,15 +5465,15 @@ async def save_edit_changes(callback: CallbackQuery):
     
     category = callback.data.replace("save_edit_", "")
     
-    # Применяем изменения из временной БД
-    if apply_temp_db_changes():
+    # Применяем правки из журнала
+    if await apply_temp_db_changes_async():
         await callback.message.edit_text(
             f"✅ Изменения сохранены! База данных обновлена.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_{category}")]])
         )
     else:
         await callback.message.edit_text(
-            f"❌ Ошибка при сохранении изменений. Возможно, нет временной БД.",
+            f"❌ Изменения не сохранены: несохраненных правок нет или произошла ошибка.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_{category}")]])
         )
     
@@ -4170,15 +5487,15 @@ async def cancel_edit_changes(callback: CallbackQuery):
     
     category = callback.data.replace("cancel_edit_", "")
     
-    # Отменяем изменения, удаляя временную БД
-    if cancel_temp_db_changes():
+    # Отменяем изменения, очищая журнал правок
+    if await cancel_temp_db_changes_async():
         await callback.message.edit_text(
             f"❌ Изменения отменены. База данных не изменена.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_{category}")]])
         )
     else:
         await callback.message.edit_text(
-            f"⚠️ Временная БД уже удалена или произошла ошибка.",
+            f"⚠️ Не удалось отменить несохраненные правки, подробности в логах.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_{category}")]])
         )
     
@@ -4217,15 +5534,20 @@ async def admin_zip_backups(callback: CallbackQuery):
     created = [b for b in backups if b.startswith('backup_')]
     uploaded = [b for b in backups if b.startswith('uploaded_')]
     all_backups = created + uploaded
-    text = "📦 ZIP Бэкапы\n\nВсего бэкапов: " + str(len(all_backups)) + "\n\n"
+    usage = await run_backup_io(get_backup_disk_usage)
+    mb = 1024 * 1024
+    text = "📦 ZIP Бэкапы\n\nВсего бэкапов: " + str(len(all_backups)) + "\n"
+    text += f"💾 Занято: {(usage['store'] + usage['zip'] + usage['copies'] + usage['wal']) // mb} МБ (хранилище {usage['store'] // mb}, ZIP {usage['zip'] // mb}, копии {usage['copies'] // mb}, WAL {usage['wal'] // mb}), свободно {usage['free'] // mb} МБ\n"
+    text += f"⏰ Автобэкап каждые {BACKUP_SCHEDULE_MAX_INTERVAL // 3600} ч (в тихое время - раньше)\n\n"
+    sizes = await run_backup_io(get_backup_sizes, all_backups[:10])
     if all_backups:
         for i, b in enumerate(all_backups[:10], 1):
             try:
-                size = (BACKUP_DIR / b).stat().st_size // 1024
+                size = sizes[b] // 1024
                 if b.startswith('backup_'):
-                    display = b.replace('backup_', '📦 ').replace('.zip', '')
+                    display = b.replace('backup_', '📦 ').replace('.zip', '').replace(BACKUP_MANIFEST_SUFFIX, '')
                 else:
-                    display = b.replace('uploaded_', '📤 ').replace('.zip', '')
+                    display = b.replace('uploaded_', '📤 ').replace('.zip', '').replace(BACKUP_MANIFEST_SUFFIX, '')
                 short_display = display[:20] + "..." if len(display) > 20 else display
                 text += f"{i}. {short_display} ({size} KB)\n"
             except Exception as e:
@@ -4236,7 +5558,7 @@ async def admin_zip_backups(callback: CallbackQuery):
     for i, b in enumerate(all_backups[:10], 1):
         encoded_name = encode_filename(b)
         try:
-            size = (BACKUP_DIR / b).stat().st_size // 1024
+            size = sizes[b] // 1024
             icon = "📦" if b.startswith('backup_') else "📤"
             if b.startswith('backup_'):
                 short_name = b[7:15] + "..." if len(b) > 15 else b[7:]
@@ -4262,9 +5584,25 @@ async def create_backup(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     await callback.message.edit_text("⏳ Создание бэкапа...")
-    zip_path, zip_filename = await create_zip_backup()
-    if zip_path:
-        await callback.message.answer_document(document=FSInputFile(zip_path), caption=f"✅ Бэкап создан: {zip_filename}")
+    
+    async def show_progress(stage, percent):
+        try:
+            await callback.message.edit_text(f"⏳ Создание бэкапа...\n\n{stage}: {percent}%")
+        except TelegramBadRequest:
+            pass
+    
+    backup_path, backup_name = await create_backup_async(show_progress)
+    if backup_path:
+        # В хранилище бэкап уже лежит; админу уходит его копия одним ZIP
+        zip_path = TEMP_DIR / backup_name.replace(BACKUP_MANIFEST_SUFFIX, '.zip')
+        try:
+            await run_backup_job(export_backup_zip, backup_path, zip_path, on_progress=show_progress)
+            await callback.message.answer_document(document=FSInputFile(zip_path), caption=f"✅ Бэкап создан: {backup_name}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки бэкапа {backup_name}: {e}")
+            await callback.message.answer(f"✅ Бэкап создан: {backup_name}\n⚠️ Отправить копию не удалось: {e}")
+        finally:
+            zip_path.unlink(missing_ok=True)
         await admin_zip_backups(callback)
     else:
         await callback.message.edit_text("❌ Ошибка создания бэкапа", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_zip_backups")]]))
@@ -4288,15 +5626,15 @@ async def restore_backup(callback: CallbackQuery):
         if not found:
             await callback.answer(f"❌ Файл не найден", show_alert=True)
             return
-    issues = check_backup_structure(str(filepath))
+    issues = await run_backup_io(check_backup_structure, str(filepath))
     try:
-        size = filepath.stat().st_size // 1024
+        size = (await run_backup_io(get_backup_sizes, [filepath.name]))[filepath.name] // 1024
         date = datetime.fromtimestamp(filepath.stat().st_mtime).strftime("%Y-%m-%d %H:%M")
     except:
         size = 0
         date = "?"
     icon = "📦" if filename.startswith('backup_') else "📤"
-    display = filename.replace('backup_', '').replace('uploaded_', '').replace('.zip', '')
+    display = filename.replace('backup_', '').replace('uploaded_', '').replace('.zip', '').replace(BACKUP_MANIFEST_SUFFIX, '')
     if issues:
         warning_text = "\n\n⚠️ ПРОБЛЕМЫ С БЭКАПОМ:\n" + "\n".join(issues) + "\n\nВосстановление может работать некорректно!"
     else:
@@ -4325,13 +5663,20 @@ async def restore_confirm(callback: CallbackQuery):
         if not found:
             await callback.answer("❌ Файл не найден", show_alert=True)
             return
-    await callback.message.edit_text("⏳ Восстановление... (это может занять несколько секунд)")
-    await create_zip_backup()
-    success = await restore_from_zip(str(filepath))
-    if success:
-        await callback.message.edit_text("✅ База данных успешно восстановлена!", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ К бэкапам", callback_data="admin_zip_backups")]]))
+    await callback.message.edit_text("⏳ Восстановление...")
+    
+    async def show_progress(stage, percent):
+        try:
+            await callback.message.edit_text(f"⏳ Восстановление...\n\n{stage}: {percent}%")
+        except TelegramBadRequest:
+            pass
+    
+    # Текущие файлы сохраняются как pre_restore_*.db жесткими ссылками - отдельный полный бэкап не нужен
+    restored_files, error = await restore_from_backup(str(filepath), show_progress)
+    if restored_files:
+        await callback.message.edit_text(f"✅ База данных успешно восстановлена!\n\nФайлы: {', '.join(restored_files)}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ К бэкапам", callback_data="admin_zip_backups")]]))
     else:
-        await callback.message.edit_text("❌ Ошибка восстановления!\n\nПроверьте целостность ZIP файла.", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_zip_backups")]]))
+        await callback.message.edit_text(f"❌ Ошибка восстановления!\n\n{error}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_zip_backups")]]))
 
 @dp.callback_query(lambda c: c.data == "upload_backup")
 async def upload_backup(callback: CallbackQuery, state: FSMContext):
@@ -4366,8 +5711,15 @@ async def handle_upload(message: Message, state: FSMContext):
         filename = f"uploaded_{timestamp}_{safe_name}.zip"
         filepath = BACKUP_DIR / filename
         await bot.download_file(file.file_path, str(filepath))
-        issues = check_backup_structure(str(filepath))
+        issues = await run_backup_io(check_backup_structure, str(filepath))
         size_kb = filepath.stat().st_size // 1024
+        try:
+            # Загруженный архив хранится как обычный бэкап: чанками, без повторов
+            manifest_path = await run_backup_job(import_zip_backup, filepath, filepath.stem)
+            filepath.unlink()
+            filename = manifest_path.name
+        except Exception as e:
+            logger.error(f"❌ {filename} не перенесен в хранилище, остается ZIP: {e}")
         if issues:
             warning = "\n".join(issues)
             await wait_msg.edit_text(f"⚠️ Файл загружен, но есть проблемы:\n\nИмя: {filename}\nРазмер: {size_kb} KB\nПроблемы:\n{warning}\n\nВосстановление может не работать!")
@@ -4379,14 +5731,15 @@ async def handle_upload(message: Message, state: FSMContext):
         uploaded = [b for b in backups if b.startswith('uploaded_')]
         all_backups = created + uploaded
         text = "📦 ZIP Бэкапы\n\nВсего бэкапов: " + str(len(all_backups)) + "\n\n"
+        sizes = await run_backup_io(get_backup_sizes, all_backups[:10])
         if all_backups:
             for i, b in enumerate(all_backups[:10], 1):
                 try:
-                    size = (BACKUP_DIR / b).stat().st_size // 1024
+                    size = sizes[b] // 1024
                     if b.startswith('backup_'):
-                        display = b.replace('backup_', '📦 ').replace('.zip', '')
+                        display = b.replace('backup_', '📦 ').replace('.zip', '').replace(BACKUP_MANIFEST_SUFFIX, '')
                     else:
-                        display = b.replace('uploaded_', '📤 ').replace('.zip', '')
+                        display = b.replace('uploaded_', '📤 ').replace('.zip', '').replace(BACKUP_MANIFEST_SUFFIX, '')
                     short_display = display[:20] + "..." if len(display) > 20 else display
                     text += f"{i}. {short_display} ({size} KB)\n"
                 except:
@@ -4397,7 +5750,7 @@ async def handle_upload(message: Message, state: FSMContext):
         for i, b in enumerate(all_backups[:10], 1):
             encoded_name = encode_filename(b)
             try:
-                size = (BACKUP_DIR / b).stat().st_size // 1024
+                size = sizes[b] // 1024
                 icon = "📦" if b.startswith('backup_') else "📤"
                 if b.startswith('backup_'):
                     short_name = b[7:15] + "..." if len(b) > 15 else b[7:]
@@ -4424,8 +5777,8 @@ async def cleanup_backups(callback: CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
-    buttons = [[InlineKeyboardButton(text="🧹 Удалить все", callback_data="cleanup_all"), InlineKeyboardButton(text="🗑 Кроме 5 последних", callback_data="cleanup_old")], [InlineKeyboardButton(text="❌ Отмена", callback_data="admin_zip_backups")]]
-    await callback.message.edit_text("🗑 Очистка бэкапов", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+    buttons = [[InlineKeyboardButton(text="🧹 Удалить все", callback_data="cleanup_all"), InlineKeyboardButton(text="🗑 По схеме хранения", callback_data="cleanup_old")], [InlineKeyboardButton(text="❌ Отмена", callback_data="admin_zip_backups")]]
+    await callback.message.edit_text("🗑 Очистка бэкапов\n\nСхема хранения: по одному бэкапу на каждый час за сутки, день за неделю, неделю за месяц и месяц за полгода (бэкапы, копии перед правкой и восстановлением)", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data == "cleanup_all")
@@ -4434,13 +5787,7 @@ async def cleanup_all(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
     await callback.message.edit_text("⏳ Удаление...")
-    deleted = 0
-    for b in get_all_backups():
-        try:
-            (BACKUP_DIR / b).unlink()
-            deleted += 1
-        except:
-            pass
+    deleted = await run_backup_io(delete_all_backups)
     await callback.message.edit_text(f"✅ Удалено: {deleted}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_zip_backups")]]))
 
 @dp.callback_query(lambda c: c.data == "cleanup_old")
@@ -4448,19 +5795,8 @@ async def cleanup_old(callback: CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
-    backups = get_all_backups()
-    backups.sort(reverse=True)
-    if len(backups) <= 5:
-        await callback.answer("❌ Мало бэкапов", show_alert=True)
-        return
     await callback.message.edit_text("⏳ Удаление...")
-    deleted = 0
-    for b in backups[5:]:
-        try:
-            (BACKUP_DIR / b).unlink()
-            deleted += 1
-        except:
-            pass
+    deleted = await asyncio.get_running_loop().run_in_executor(_backup_executor, apply_backup_retention)
     await callback.message.edit_text(f"✅ Удалено: {deleted}", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_zip_backups")]]))
 
 @dp.callback_query(lambda c: c.data == "admin_stats")
@@ -4468,40 +5804,17 @@ async def admin_stats(callback: CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
-    users_count = get_users_count()
-    vip_count = get_vip_users_count()
-    conn = sqlite3.connect(str(DB_PATH))
-    cur = conn.cursor()
-    clients_count = cur.execute('SELECT COUNT(*) FROM clients').fetchone()[0]
-    cur.execute("PRAGMA table_info(clients)")
-    columns = [col[1] for col in cur.fetchall()]
-    if 'is_vip' in columns:
-        vip_clients = cur.execute('SELECT COUNT(*) FROM clients WHERE is_vip = 1').fetchone()[0]
-    else:
-        vip_clients = 0
-    packs_count = cur.execute('SELECT COUNT(*) FROM resourcepacks').fetchone()[0]
-    cur.execute("PRAGMA table_info(resourcepacks)")
-    columns = [col[1] for col in cur.fetchall()]
-    if 'is_vip' in columns:
-        vip_packs = cur.execute('SELECT COUNT(*) FROM resourcepacks WHERE is_vip = 1').fetchone()[0]
-    else:
-        vip_packs = 0
-    configs_count = cur.execute('SELECT COUNT(*) FROM configs').fetchone()[0]
-    cur.execute("PRAGMA table_info(configs)")
-    columns = [col[1] for col in cur.fetchall()]
-    if 'is_vip' in columns:
-        vip_configs = cur.execute('SELECT COUNT(*) FROM configs WHERE is_vip = 1').fetchone()[0]
-    else:
-        vip_configs = 0
-    conn.close()
-    await callback.message.edit_text(f"📊 Статистика\n\n👤 Пользователей: {users_count} (💎 VIP: {vip_count})\n🎮 Клиентов: {clients_count} (💎 VIP: {vip_clients})\n🎨 Ресурспаков: {packs_count} (💎 VIP: {vip_packs})\n⚙️ Конфигов: {configs_count} (💎 VIP: {vip_configs})", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]]))
+    users_count = await get_users_count_async()
+    vip_count = await get_vip_users_count_async()
+    stats = await get_catalog_stats_async()
+    await callback.message.edit_text(f"📊 Статистика\n\n👤 Пользователей: {users_count} (💎 VIP: {vip_count})\n🎮 Клиентов: {stats['clients']} (💎 VIP: {stats['vip_clients']})\n🎨 Ресурспаков: {stats['resourcepacks']} (💎 VIP: {stats['vip_resourcepacks']})\n⚙️ Конфигов: {stats['configs']} (💎 VIP: {stats['vip_configs']})", reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="◀️ Назад", callback_data="admin_back")]]))
 
 @dp.callback_query(lambda c: c.data == "admin_broadcast")
 async def admin_broadcast(callback: CallbackQuery, state: FSMContext):
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("⛔ Доступ запрещен", show_alert=True)
         return
-    users_count = get_users_count()
+    users_count = await get_users_count_async()
     await state.set_state(AdminStates.broadcast_text)
     await callback.message.delete()
     await callback.message.answer(f"📢 Создание рассылки\n\nВсего пользователей: {users_count}\n\nВведи текст сообщения для рассылки (или отправь /cancel для отмены):")
@@ -4539,7 +5852,7 @@ async def broadcast_photo(message: Message, state: FSMContext):
     else:
         await message.answer("❌ Отправь фото или напиши 'пропустить' (или /cancel)")
         return
-    users = get_all_users()
+    users = await get_all_users_async()
     if not users:
         await message.answer("❌ Нет пользователей для рассылки")
         await state.clear()
@@ -4559,7 +5872,7 @@ async def broadcast_send(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     text = data.get('broadcast_text')
     photo_id = data.get('broadcast_photo')
-    users = get_all_users()
+    users = await get_all_users_async()
     if not users:
         await callback.message.edit_text("❌ Нет пользователей для рассылки")
         await state.clear()
@@ -4601,18 +5914,10 @@ async def view_media(callback: CallbackQuery, state: FSMContext):
             await callback.answer("❌ Ошибка", show_alert=True)
             return
         category, item_id = parts[1], int(parts[2])
-        item = get_item(category, item_id)
-        if not item:
+        media_list = await get_item_media_async(category, item_id)
+        if media_list is None:
             await callback.answer("❌ Не найден", show_alert=True)
             return
-        
-        media_index = 5 if category == "configs" and len(item) > 5 else 3
-        
-        try:
-            media_list = json.loads(item[media_index]) if len(item) > media_index and item[media_index] else []
-        except:
-            media_list = []
-            logger.error(f"Ошибка парсинга media для {category} {item_id}")
         if not media_list:
             await callback.answer("📭 Нет медиа", show_alert=True)
             return
@@ -4683,9 +5988,9 @@ async def back_to_main(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.message.delete()
     user_id = callback.from_user.id
-    user_status = get_user_status(user_id)
+    user_status = await get_user_status_async(user_id)
     is_admin = (user_id == ADMIN_ID)
-    is_vip = user_status.get('is_vip', False)
+    is_vip = user_status.is_vip
     await callback.message.answer("Главное меню:", reply_markup=get_main_keyboard(is_admin, is_vip))
 
 async def main():
@@ -4700,15 +6005,17 @@ async def main():
     print("   • 🎮 Клиенты, ресурспаки, конфиги")
     print("   • 👑 VIP управление")
     print("   • 🗄️ Управление БД (сохранение/отмена изменений)")
-    print("   • 📦 Бэкапы")
+    print("   • 📦 Бэкапы (автобэкап по расписанию, хранение дед-отец-сын)")
+    print("   • 🧬 Непрерывный бэкап WAL с восстановлением на момент (/restore_at)")
     print("   • 📢 Рассылка")
     print("   • 🔍 Диагностика БД (/check_db, /debug_admin)")
-    print("   • 🔄 Редактирование через временную БД")
+    print("   • 🔄 Редактирование через журнал несохраненных правок")
     print("   • ⚙️ Конфиги привязаны к названиям клиентов")
     print("="*50)
     
     # Проверяем данные при запуске
-    check_all_clients()
+    await check_all_clients_async()
+    await build_catalog_async()
     
     try:
         me = await bot.get_me()
@@ -4716,9 +6023,32 @@ async def main():
     except Exception as e:
         print(f"❌ Ошибка подключения к Telegram: {e}")
         print("Проверьте токен в переменных окружения на bothost.ru")
+        _backup_executor.shutdown(wait=True)
+        shutdown_db_executors()
+        close_db()
         return
     
-    await dp.start_polling(bot)
+    # Непрерывный бэкап начинается с полного снимка: WAL прошлого запуска уже сброшен в файл при закрытии
+    for db_path in WAL_SHIPPED_DBS.values():
+        await run_db(db_path, start_wal_generation, db_path)
+    flush_tasks = [asyncio.create_task(counter_flush_loop()), asyncio.create_task(last_active_flush_loop()),
+                   asyncio.create_task(downloads_flush_loop()), asyncio.create_task(wal_ship_loop()),
+                   asyncio.create_task(backup_scheduler_loop())]
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for task in flush_tasks:
+            task.cancel()
+        # Сначала дожидаемся заданий в потоках: бэкап/восстановление и отложенные счетчики,
+        # которые они успеют положить в буферы, попадут в последний сброс
+        _backup_executor.shutdown(wait=True)
+        shutdown_db_executors()
+        flush_counters()
+        flush_downloads()
+        flush_last_active()
+        for db_path in WAL_SHIPPED_DBS.values():
+            ship_wal(db_path)
+        close_db()
 
 if __name__ == "__main__":
     try: